@@ -0,0 +1,100 @@
+"""
+Measures the zone rollups of the fleet aggregates on synthetic positions, aggregated in two incremental runs,
+and checks that the second run continues exactly one interval after the last rollup of the first one. The
+local time zone is set away from UTC, as rollup times are stored in UTC.
+
+Usage:
+    python benchmarks/bench_aggregates.py --vessels 2000 --days 3 --timezone Asia/Tokyo
+
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import numpy
+import pandas
+
+from common import timed
+from shipsdb.aggregates import FleetAggregates
+from shipsdb.positions import RECORD_DTYPE, PositionStore
+from shipsdb.store import write_snapshot
+
+# 2023-11-14 00:00 UTC
+_START = 1699920000
+
+_POLL_INTERVAL = 600
+
+
+def make_positions(vessels: int, days: int, seed: int = 0) -> numpy.ndarray:
+    """
+    :return: one record per vessel and poll, vessels wandering around Houston
+    """
+    random = numpy.random.default_rng(seed)
+    polls = days * 86400 // _POLL_INTERVAL
+    records = numpy.zeros(vessels * polls, dtype=RECORD_DTYPE)
+    records['timestamp'] = numpy.repeat(_START + numpy.arange(polls) * _POLL_INTERVAL, vessels)
+    records['received'] = records['timestamp']
+    records['ship_id'] = numpy.tile(numpy.arange(1, vessels + 1), polls)
+    records['imo'] = 9000000 + records['ship_id']
+    records['ship_type'] = 8
+    records['lat'] = random.uniform(28.7, 29.8, len(records))
+    records['lon'] = random.uniform(-95.4, -93.6, len(records))
+    records['speed'] = random.uniform(0., 12., len(records))
+    return records
+
+
+def make_cleaned(vessels: int, seed: int = 0) -> pandas.DataFrame:
+    random = numpy.random.default_rng(seed)
+    gross_tonnage = random.gamma(2., 25000., vessels) + 500.
+    return pandas.DataFrame({
+        'IMO': (9000001 + numpy.arange(vessels)).astype(str),
+        'Ship type': random.choice(['Crude Oil Tanker', 'Oil Products Tanker', 'LPG Tanker'], vessels),
+        'Flag': random.choice(['Panama', 'Liberia', 'Marshall Islands'], vessels),
+        'Length': numpy.clip(gross_tonnage ** 0.33 * 6.5, 40., 400.),
+        'Gross Tonnage': gross_tonnage,
+        'Deadweight': gross_tonnage * 1.7,
+    })
+
+
+def main(args):
+    os.environ['TZ'] = args.timezone
+    time.tzset()
+    with tempfile.TemporaryDirectory() as work_dir:
+        store_dir = os.path.sep.join([work_dir, 'store'])
+        write_snapshot(store_dir, 'cleaned', make_cleaned(args.vessels), vessel_type='6',
+                       snapshot_date=datetime.date(2023, 11, 13))
+        positions = PositionStore(os.path.sep.join([work_dir, 'positions']))
+        positions.append_records('Houston', make_positions(args.vessels, args.days))
+        positions.compact()
+
+        aggregates = FleetAggregates(os.path.sep.join([work_dir, 'aggregates.sqlite']))
+        halfway = _START + args.days * 86400 // 2
+        counts = dict()
+        first_seconds = timed(lambda: counts.update(first=aggregates.update_zones(positions, store_dir,
+                                                                                  args.interval, until=halfway)))
+        second_seconds = timed(lambda: counts.update(second=aggregates.update_zones(positions, store_dir,
+                                                                                    args.interval)))
+
+        rollup_times = [int(datetime.datetime.fromisoformat(as_of).replace(tzinfo=datetime.timezone.utc).timestamp())
+                        for as_of in aggregates.history('houston', measure='vessels').index]
+        assert len(rollup_times) == counts['first'] + counts['second']
+        assert numpy.all(numpy.diff(rollup_times) == args.interval), 'incremental run did not resume after ' \
+                                                                     'the last rollup'
+        print(f'time zone {args.timezone}, {args.vessels} vessels over {args.days} days, '
+              f'{len(rollup_times)} consecutive rollups every {args.interval}s')
+        print(f'  first run {counts["first"]} rollups in {first_seconds:.2f}s, '
+              f'incremental run {counts["second"]} rollups in {second_seconds:.2f}s '
+              f'({(first_seconds + second_seconds) / len(rollup_times) * 1000.:.0f} ms per rollup)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the zone rollups of the fleet aggregates',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--vessels', type=int, help='number of vessels in the zone', default=1000)
+    parser.add_argument('--days', type=int, help='days of positions', default=2)
+    parser.add_argument('--interval', type=int, help='seconds between two zone rollups', default=3600)
+    parser.add_argument('--timezone', type=str, help='local time zone of the run', default='America/Chicago')
+    main(parser.parse_args())
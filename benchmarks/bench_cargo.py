@@ -0,0 +1,61 @@
+"""
+Measures the throughput of the cargo event detector on a synthetic stream of draught updates, vessels
+alternating between ballast and laden voyages, and checks that each draught change gives one event.
+
+Usage:
+    python benchmarks/bench_cargo.py --vessels 5000 --updates 5000000
+
+"""
+import argparse
+
+import numpy
+
+from common import timed
+from shipsdb.cargo import CargoEventDetector
+
+_ZONES = ['Houston', 'Corpus Christi', 'New Orleans', None]
+
+
+def make_updates(vessels: int, updates: int, seed: int = 0):
+    """
+    :return: (imo, timestamp, draught, zone, speed) lists ordered by timestamp, and the number of draught changes
+    """
+    random = numpy.random.default_rng(seed)
+    per_vessel = updates // vessels
+    summer_draught = random.uniform(10., 20., vessels)
+    # voyages of about 200 updates each, draught reported by the crew at the start of each voyage
+    voyage = numpy.repeat(numpy.cumsum(random.random((vessels, per_vessel // 10 + 1)) < 1. / 20., axis=1), 10,
+                          axis=1)[:, :per_vessel]
+    laden = (voyage + numpy.arange(vessels)[:, None]) % 2 == 1
+    draught = numpy.round(numpy.where(laden, 0.95, 0.45) * summer_draught[:, None], 1)
+    speed = numpy.where(random.random((vessels, per_vessel)) < 0.3, 0., 12.)
+    zone = random.integers(0, len(_ZONES), (vessels, per_vessel))
+    imo = numpy.repeat(9000000 + numpy.arange(vessels), per_vessel)
+    timestamp = (numpy.arange(per_vessel)[None, :] * 300 + random.integers(0, 300, (vessels, 1))).ravel()
+    order = numpy.argsort(timestamp, kind='stable')
+    zones = numpy.array(_ZONES, dtype=object)[zone.ravel()[order]]
+    changes = int((numpy.diff(draught, axis=1) != 0).sum())
+    particulars = {9000000 + index: (summer_draught[index] * 7000., summer_draught[index]) for index in range(vessels)}
+    return (list(zip(imo[order].tolist(), timestamp[order].tolist(), draught.ravel()[order].tolist(),
+                     zones.tolist(), speed.ravel()[order].tolist())), changes, particulars)
+
+
+def main(args):
+    updates, changes, particulars = make_updates(args.vessels, args.updates)
+    detector = CargoEventDetector(particulars)
+    events = list()
+    duration = timed(lambda: events.extend(detector.update_many(updates)))
+    assert len(events) == changes
+    barrels = sum(event.barrels for event in events if event.kind == 'load')
+    print(f'{len(updates)} updates of {args.vessels} vessels, {len(events)} events, '
+          f'{barrels / 1e6:.0f} M barrels loaded')
+    print(f'  {duration:.2f} s, {len(updates) / duration * 60. / 1e6:.1f} M updates/minute')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the cargo event detector',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--vessels', type=int, help='number of vessels', default=5000)
+    parser.add_argument('--updates', type=int, help='number of draught updates', default=5000000)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+"""
+Compares the columnar clean_details() with the former row by row implementation on synthetic details,
+checking that both produce the same frame.
+
+Usage:
+    python benchmarks/bench_clean.py --size 1000000
+
+"""
+import argparse
+import csv
+import os
+import re
+import tempfile
+
+import numpy
+import pandas
+
+from common import load_script, timed
+from synthetic import make_details
+
+
+def clean_details_rows(input_filename: str) -> pandas.DataFrame:
+    """
+    Former implementation, kept as a reference.
+    """
+    with open(input_filename, 'r') as csv_file:
+        csv_reader = csv.DictReader(csv_file)
+        rows = list()
+        for row in csv_reader:
+            if row['IMO'] == '':
+                continue
+
+            if row['ship_country_owner'] != row['Flag']:
+                continue
+
+            row['Built'] = (row['Built'], numpy.nan)[row['Built'] is None or row['Built'] == '']
+            row['Current draught'] = (numpy.nan, row['Current draught'][:-2])[row['Current draught'].endswith(' m')]
+            row['Deadweight'] = (numpy.nan, row['Deadweight'][:-2])[row['Deadweight'].endswith(' t')]
+            row['Draught'] = (numpy.nan, row['Draught'][:-2])[row['Draught'].endswith(' m')]
+            row['Gross Tonnage'] = (numpy.nan, row['Gross Tonnage'][:-2])[row['Gross Tonnage'].endswith(' t')]
+            row['Net Tonnage'] = (numpy.nan, row['Net Tonnage'][:-2])[row['Net Tonnage'].endswith(' t')]
+            row['Course'] = numpy.nan
+            row['Speed'] = numpy.nan
+            course_speed = re.match(r'([0-9]+)\W+([0-9\.]+)', row['Course/Speed'])
+            if course_speed and len(course_speed.groups()) == 2:
+                row['Course'], row['Speed'] = course_speed.group(1, 2)
+
+            length_width = re.match(r'([0-9]+)\sx\s([0-9]+)', row['Size'])
+            row['Length'], row['Width'] = numpy.nan, numpy.nan
+            if length_width and len(length_width.groups()) == 2:
+                row['Length'], row['Width'] = length_width.group(1, 2)
+
+            del row['GT']
+            del row['Size']
+            del row['Course/Speed']
+            del row['Crude (bbl)']
+
+            rows.append(row)
+
+        vessels = pandas.DataFrame(rows).groupby('IMO').last()
+        numeric_columns = ['Course', 'Current draught', 'Draught', 'Width', 'Length', 'Deadweight',
+                           'Gross Tonnage', 'Net Tonnage', 'Speed']
+        vessels[numeric_columns] = vessels[numeric_columns].apply(pandas.to_numeric)
+        vessels = vessels[vessels['Width'] < vessels['Width'].mean() + 6. * vessels['Width'].std()]
+        vessels = vessels[vessels['Length'] < vessels['Length'].mean() + 6. * vessels['Width'].std()]
+        return vessels
+
+
+def main(args):
+    clean_vessels_data = load_script('clean-vessels-data')
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_filename = os.path.sep.join([work_dir, 'ship-db-details.csv'])
+        make_details(args.size).to_csv(input_filename, index=False)
+
+        results = dict()
+
+        def run_rows():
+            results['rows'] = clean_details_rows(input_filename)
+
+        def run_columns():
+            details = pandas.read_csv(input_filename, dtype=str, keep_default_na=False, engine='pyarrow')
+            results['columns'] = clean_vessels_data.clean_details_frame(details)
+
+        timing_rows = timed(run_rows)
+        timing_columns = timed(run_columns)
+        pandas.testing.assert_frame_equal(results['rows'], results['columns'])
+        print(f'{args.size} rows -> {len(results["columns"])} vessels, identical output')
+        print(f'  row by row: {timing_rows:7.2f} s')
+        print(f'    columnar: {timing_columns:7.2f} s  (x{timing_rows / timing_columns:.1f})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the details cleaning',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--size', type=int, help='number of synthetic details rows', default=1000000)
+    main(parser.parse_args())
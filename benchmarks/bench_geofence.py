@@ -0,0 +1,117 @@
+"""
+Classifies synthetic positions around the Gulf of Mexico against dozens of polygon port areas and the tracking
+zones: vectorized geofence against a naive loop testing each position against each zone in Python, results
+being checked against each other on the positions processed by the loop. Zone events are then detected on
+synthetic tracks.
+
+Usage:
+    python benchmarks/bench_geofence.py --positions 5000000 --zones 50
+
+"""
+import argparse
+
+import numpy
+import pandas
+
+from common import timed
+from shipsdb.geofence import Geofence, Zone, ZoneEventDetector, TRACKING_ZONES
+
+
+def make_zones(count: int, random: numpy.random.Generator) -> list:
+    """
+    :return: star shaped port areas of 5 to 80 vertices, some with a hole, followed by the tracking zones
+    """
+    zones = list()
+    for index in range(count):
+        center_lon, center_lat = random.uniform(-97.5, -88.5), random.uniform(27., 30.5)
+        vertices = random.integers(5, 80)
+        angles = numpy.sort(random.uniform(0., 2. * numpy.pi, vertices))
+        radius = random.uniform(0.03, 0.3, vertices)
+        rings = [numpy.column_stack([center_lon + radius * numpy.cos(angles), center_lat + radius * numpy.sin(angles)])]
+        if index % 5 == 0:
+            rings.append(numpy.column_stack([center_lon + 0.01 * numpy.cos(angles), center_lat + 0.01 * numpy.sin(angles)]))
+
+        zones.append(Zone(f'port-{index}', tuple(rings)))
+
+    return zones + [zone for name, zone in TRACKING_ZONES.items() if name != 'Test']
+
+
+def naive_classify(zones: list, lon: numpy.ndarray, lat: numpy.ndarray) -> numpy.ndarray:
+    """
+    Bounding box check then ray casting over the edges, one position and one zone at a time.
+    """
+    edges = [[(ring[count][0], ring[count][1], ring[(count + 1) % len(ring)][0], ring[(count + 1) % len(ring)][1])
+              for ring in zone.rings for count in range(len(ring))] for zone in zones]
+    bounds = [zone.bounds for zone in zones]
+    classes = numpy.full(len(lon), -1, dtype=numpy.int32)
+    for position, (x, y) in enumerate(zip(lon.tolist(), lat.tolist())):
+        for zone, (min_x, min_y, max_x, max_y) in enumerate(bounds):
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                continue
+
+            inside = False
+            for x0, y0, x1, y1 in edges[zone]:
+                if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+                    inside = not inside
+
+            if inside:
+                classes[position] = zone
+                break
+
+    return classes
+
+
+def make_tracks(vessels: int, steps: int, random: numpy.random.Generator) -> pandas.DataFrame:
+    """
+    :return: random walks of the vessels, one position per step
+    """
+    start_lon, start_lat = random.uniform(-97., -89., vessels), random.uniform(27.5, 30., vessels)
+    lon = start_lon[:, None] + numpy.cumsum(random.normal(0., 0.02, (vessels, steps)), axis=1)
+    lat = start_lat[:, None] + numpy.cumsum(random.normal(0., 0.02, (vessels, steps)), axis=1)
+    ship_id = numpy.repeat(numpy.arange(1, vessels + 1), steps)
+    return pandas.DataFrame({
+        'timestamp': numpy.tile(numpy.arange(steps) * 600, vessels),
+        'ship_id': ship_id,
+        'mmsi': ship_id + 200000000,
+        'imo': ship_id + 9000000,
+        'name': 'VESSEL',
+        'lat': lat.ravel().astype(numpy.float32),
+        'lon': lon.ravel().astype(numpy.float32),
+    })
+
+
+def main(args):
+    random = numpy.random.default_rng(1)
+    zones = make_zones(args.zones, random)
+    results = dict()
+    build_seconds = timed(lambda: results.update(geofence=Geofence(zones)))
+    geofence = results['geofence']
+    edges = sum(len(ring) for zone in zones for ring in zone.rings)
+    print(f'{len(zones)} zones, {edges} edges, geofence built in {build_seconds * 1000.:.0f}ms')
+
+    lon = random.uniform(-98.5, -87.5, args.positions).astype(numpy.float32)
+    lat = random.uniform(26.5, 31., args.positions).astype(numpy.float32)
+    vectorized_seconds = timed(lambda: results.update(classes=geofence.classify(lon, lat)))
+    naive_seconds = timed(lambda: results.update(naive=naive_classify(zones, lon[:args.naive], lat[:args.naive])))
+    classes = results['classes']
+    mismatches = int((classes[:args.naive] != results['naive']).sum())
+    print(f'{"classification":>16} {args.positions / vectorized_seconds:14,.0f} positions/s vectorized, '
+          f'{args.naive / naive_seconds:10,.0f} positions/s naive, {mismatches} mismatches on {args.naive} positions, '
+          f'{(classes >= 0).mean():.1%} in a zone')
+
+    tracks = make_tracks(args.vessels, args.positions // args.vessels, random)
+    detector = ZoneEventDetector(geofence)
+    events_seconds = timed(lambda: results.update(events=detector.update(tracks)))
+    print(f'{"zone events":>16} {len(tracks) / events_seconds:14,.0f} positions/s, {len(results["events"])} events '
+          f'for {args.vessels} vessels')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the geofencing of positions',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--positions', type=int, help='positions classified', default=2000000)
+    parser.add_argument('--zones', type=int, help='polygon port areas, besides the tracking zones', default=40)
+    parser.add_argument('--naive', type=int, help='positions classified by the naive loop', default=20000)
+    parser.add_argument('--vessels', type=int, help='vessels of the synthetic tracks', default=2000)
+    main(parser.parse_args())
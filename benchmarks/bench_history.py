@@ -0,0 +1,101 @@
+"""
+Weekly crawls of a synthetic vessels list, a small share of vessels being added, removed, renamed or reflagged
+each week: recording them in the vessels history against keeping full CSV copies and merging two of them by
+hand, in time and disk space, then rebuilding the fleet as of the first week.
+
+Usage:
+    python benchmarks/bench_history.py --size 200000 --weeks 8
+
+"""
+import argparse
+import datetime
+import os
+import tempfile
+
+import numpy
+import pandas
+
+from common import timed
+from shipsdb.history import VesselHistory
+from synthetic import make_vessels
+
+
+def next_crawl(vessels: pandas.DataFrame, random: numpy.random.Generator, churn: float,
+               first_imo: int) -> pandas.DataFrame:
+    """
+    :return: vessels of the following week, a share of them (churn) being removed, renamed or reflagged,
+    as many new ones being added
+    """
+    size = len(vessels)
+    draws = random.random(size)
+    vessels = vessels.copy()
+    renamed = draws < churn
+    vessels.loc[renamed, 'name'] = vessels.loc[renamed, 'name'] + ' II'
+    reflagged = (draws >= churn) & (draws < 2 * churn)
+    vessels.loc[reflagged, 'country'] = 'Panama'
+    kept = (draws < 2 * churn) | (draws >= 3 * churn)
+    added = make_vessels(int(size * churn), seed=first_imo)
+    added['imo'] = (first_imo + numpy.arange(len(added))).astype(str)
+    return pandas.concat([vessels[kept], added], ignore_index=True)
+
+
+def naive_diff(previous_filename: str, current_filename: str) -> int:
+    """
+    Merging two full exports and comparing every column.
+
+    :return: number of vessels added, removed or changed
+    """
+    previous = pandas.read_csv(previous_filename, dtype=str, keep_default_na=False)
+    current = pandas.read_csv(current_filename, dtype=str, keep_default_na=False)
+    merged = previous.merge(current, on='imo', how='outer', suffixes=('_previous', '_current'), indicator=True)
+    both = merged['_merge'] == 'both'
+    changed = numpy.zeros(len(merged), dtype=bool)
+    for column in [name for name in current.columns if name != 'imo']:
+        changed |= (merged[column + '_previous'] != merged[column + '_current']).to_numpy()
+
+    return int((~both).sum() + (both.to_numpy() & changed).sum())
+
+
+def main(args):
+    random = numpy.random.default_rng(1)
+    first_date = datetime.date(2024, 1, 1)
+    with tempfile.TemporaryDirectory() as work_dir:
+        history = VesselHistory(os.path.sep.join([work_dir, 'store']), vessel_type=6)
+        vessels = make_vessels(args.size)
+        csv_filenames = list()
+        record_seconds, naive_seconds = 0., 0.
+        for week in range(args.weeks):
+            if week > 0:
+                vessels = next_crawl(vessels, random, args.churn, 9900000 + week * args.size)
+
+            csv_filename = os.path.sep.join([work_dir, f'ship-db-6-week{week}.csv'])
+            vessels.to_csv(csv_filename, index=False)
+            csv_filenames.append(csv_filename)
+            crawl_date = first_date + datetime.timedelta(weeks=week)
+            results = dict()
+            seconds = timed(lambda: results.update(diff=history.record_csv(csv_filename, crawl_date)))
+            if week > 0:
+                record_seconds += seconds
+                naive_seconds += timed(lambda: results.update(naive=naive_diff(csv_filenames[-2], csv_filename)))
+                print(f'week {week}: {results["diff"].summary()}, {results["naive"]} by merging the exports')
+
+        weeks_diffed = max(args.weeks - 1, 1)
+        print(f'{"":>24} {"history":>10} {"full CSV":>10}')
+        print(f'{"weekly diff":>24} {record_seconds / weeks_diffed:9.2f}s {naive_seconds / weeks_diffed:9.2f}s')
+        history_size = sum(os.path.getsize(os.path.sep.join([history.directory, name]))
+                           for name in os.listdir(history.directory))
+        csv_size = sum(os.path.getsize(filename) for filename in csv_filenames)
+        print(f'{"disk space":>24} {history_size / 1024 ** 2:8.1f}MB {csv_size / 1024 ** 2:8.1f}MB')
+        print(f'{"fleet as of week 0":>24} {timed(lambda: history.as_of(first_date)):9.2f}s '
+              f'{timed(lambda: pandas.read_csv(csv_filenames[0], dtype=str, keep_default_na=False)):9.2f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the vessels history against full CSV copies',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--size', type=int, help='vessels per crawl', default=100000)
+    parser.add_argument('--weeks', type=int, help='weekly crawls recorded', default=6)
+    parser.add_argument('--churn', type=float, help='share of vessels renamed, reflagged and removed each week',
+                        default=0.01)
+    main(parser.parse_args())
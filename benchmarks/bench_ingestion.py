@@ -0,0 +1,119 @@
+"""
+Feeds a day of synthetic polls of a port zone through the delta ingestion, then rebuilds snapshots at
+random poll times and compares them with the polls: exactly (report times aside) with zero thresholds,
+within the position threshold otherwise.
+
+Usage:
+    python benchmarks/bench_ingestion.py --vessels 600 --interval 120
+
+"""
+import argparse
+import os
+import tempfile
+
+import numpy
+
+from common import timed
+from shipsdb.ingestion import DeltaIngester
+from shipsdb.positions import PositionStore, RECORD_DTYPE
+
+_BOX = (-95.45, 28.70, -93.60, 29.83)
+
+
+def make_polls(vessels: int, polls: int, interval: int, start: int, seed: int = 0):
+    """
+    Polls of a zone where most vessels are at anchor or berthed, their reported position jittering by a few meters,
+    while the others steam along straight lines. Vessels now and then leave and come back.
+
+    :return: generator of (poll time, records)
+    """
+    random = numpy.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = _BOX
+    lon = random.uniform(min_lon, max_lon, vessels)
+    lat = random.uniform(min_lat, max_lat, vessels)
+    moving = random.random(vessels) < 0.15
+    speed = numpy.where(moving, random.uniform(6., 14., vessels), 0.)
+    course = random.uniform(0., 360., vessels)
+    draught = numpy.round(random.uniform(6., 16., vessels), 1)
+    destination = numpy.array([b'HOUSTON', b'GALVESTON', b'TEXAS CITY', b'FREEPORT'])[numpy.arange(vessels) % 4]
+    timestamp = numpy.full(vessels, start - 60)
+    present = numpy.ones(vessels, dtype=bool)
+    for poll in range(polls):
+        received = start + poll * interval
+        present ^= random.random(vessels) < 0.002
+        reported = random.random(vessels) < min(1., interval / 180.)
+        timestamp = numpy.where(reported, received - random.integers(0, 60, vessels), timestamp)
+        step = numpy.where(reported, speed * interval / 3600. / 60., 0.)
+        lat = lat + step * numpy.cos(numpy.radians(course))
+        lon = lon + step * numpy.sin(numpy.radians(course))
+        jitter = numpy.where(reported & ~moving, 0.00003, 0.)
+        loaded = random.random(vessels) < 0.001
+        draught = numpy.where(loaded, numpy.round(draught + random.uniform(-3., 3., vessels), 1), draught)
+        records = numpy.zeros(vessels, dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamp
+        records['received'] = received
+        records['ship_id'] = numpy.arange(vessels) + 1
+        records['mmsi'] = numpy.arange(vessels) + 366000000
+        records['imo'] = numpy.arange(vessels) + 9000000
+        records['ship_type'] = 8
+        records['lat'] = lat + random.normal(0., 1., vessels) * jitter
+        records['lon'] = lon + random.normal(0., 1., vessels) * jitter
+        records['speed'] = speed
+        records['course'] = course
+        records['heading'] = course
+        records['draught'] = draught
+        records['name'] = numpy.char.add(b'VESSEL ', records['imo'].astype('S8'))
+        records['destination'] = destination
+        yield received, records[present]
+
+
+def check_snapshots(store: PositionStore, polls, position_threshold: float, samples: int = 20):
+    random = numpy.random.default_rng(1)
+    worst = 0.
+    for received, records in [polls[index] for index in random.choice(len(polls), samples, replace=False)]:
+        snapshot = store.snapshot('Houston', received).sort_values('ship_id')
+        assert numpy.array_equal(snapshot['ship_id'].to_numpy(), numpy.sort(records['ship_id']))
+        records = numpy.sort(records, order='ship_id')
+        if position_threshold == 0.:
+            for name in ('lat', 'lon', 'speed', 'course', 'draught', 'destination'):
+                values = records[name].astype(str) if name == 'destination' else records[name]
+                assert numpy.array_equal(snapshot[name].to_numpy(), values), name
+
+        error_lat = numpy.abs(snapshot['lat'].to_numpy() - records['lat']) * 111000.
+        error_lon = numpy.abs(snapshot['lon'].to_numpy() - records['lon']) * 111000. * numpy.cos(numpy.radians(29.))
+        worst = max(worst, numpy.hypot(error_lat, error_lon).max())
+
+    return worst
+
+
+def main(args):
+    polls = list(make_polls(args.vessels, 86400 // args.interval, args.interval, 1473033600))
+    total = sum(len(records) for _, records in polls)
+    print(f'{len(polls)} polls of {args.vessels} vessels, {total} positions')
+    print(f'{"position threshold (m)":>23} {"stored":>8} {"ratio":>6} {"positions/s":>12} {"worst error (m)":>16}')
+    for position_threshold in (0., args.position_threshold):
+        with tempfile.TemporaryDirectory() as work_dir:
+            store = PositionStore(os.path.sep.join([work_dir, 'positions']))
+            ingester = DeltaIngester(store, position_threshold=position_threshold,
+                                     speed_threshold=position_threshold and 0.5,
+                                     course_threshold=position_threshold and 10.,
+                                     draught_threshold=position_threshold and 0.05)
+
+            def ingest():
+                for received, records in polls:
+                    ingester.ingest_records('Houston', records, received)
+
+            duration = timed(ingest)
+            worst = check_snapshots(store, polls, position_threshold)
+            print(f'{position_threshold:23.0f} {ingester.stored_count:8d} {total / ingester.stored_count:6.1f} '
+                  f'{total / duration:12,.0f} {worst:16.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the delta ingestion of positions',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--vessels', type=int, help='vessels in the zone', default=600)
+    parser.add_argument('--interval', type=int, help='seconds between polls', default=120)
+    parser.add_argument('--position-threshold', type=float, help='position threshold in meters', default=50.)
+    main(parser.parse_args())
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark of the HTML parsing backends over the saved vesselfinder pages.
+
+Usage:
+    python benchmarks/bench_parsing.py --repeat 200
+
+"""
+import argparse
+import os
+import timeit
+
+from common import FIXTURES_DIR
+from shipsdb.parsing import get_parser, available_parsers, SoupParser
+
+_FIXTURES = {
+    'parse_results': 'vessels-results-page.html',
+    'parse_details': 'vessel-details-page.html',
+}
+
+
+def load_fixture(filename: str) -> str:
+    with open(os.path.sep.join([FIXTURES_DIR, filename]), 'r', encoding='utf-8') as fixture_file:
+        return fixture_file.read()
+
+
+def main(args):
+    for method_name, fixture_filename in _FIXTURES.items():
+        html_text = load_fixture(fixture_filename)
+        reference = getattr(SoupParser, method_name)(html_text)
+        timings = dict()
+        for parser_name in available_parsers():
+            parse = getattr(get_parser(parser_name), method_name)
+            if parse(html_text) != reference:
+                raise ValueError(f'parser "{parser_name}" output differs from reference for {fixture_filename}')
+
+            timings[parser_name] = min(timeit.repeat(lambda: parse(html_text), number=args.repeat, repeat=3))
+
+        print(f'{method_name} ({fixture_filename}, {len(html_text) / 1024.:.1f} kB)')
+        for parser_name, timing in sorted(timings.items(), key=lambda item: item[1]):
+            speedup = timings[SoupParser.name] / timing
+            print(f'  {parser_name:>6}: {1000. * timing / args.repeat:8.3f} ms/page  (x{speedup:.1f} vs {SoupParser.name})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking HTML parsing backends',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--repeat', type=int, help='number of parsing runs per measure', default=100)
+    main(parser.parse_args())
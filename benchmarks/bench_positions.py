@@ -0,0 +1,189 @@
+"""
+Loads synthetic AIS positions at Gulf Coast volumes into the positions store, then compares its box and
+track queries with a full scan of the same records held in memory. Compactions interrupted at each step of
+the swap are then checked to keep every record exactly once.
+
+Usage:
+    python benchmarks/bench_positions.py --days 30 --vessels 500 --interval 120
+
+"""
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy
+
+from common import timed
+from shipsdb.positions import PositionStore, RECORD_DTYPE
+
+_ZONES = {
+    'Houston': (-95.45, 28.70, -93.60, 29.83),
+    'Corpus Christi': (-97.60, 26.90, -96.20, 28.30),
+    'New Orleans': (-91.00, 28.85, -88.30, 30.50),
+}
+
+_SHIP_TYPES = numpy.array([7, 7, 8, 8, 8, 6, 3, 9], dtype=numpy.int16)
+
+
+def make_positions(box, vessels: int, start: int, polls: int, interval: int, first_imo: int,
+                   random: numpy.random.Generator) -> numpy.ndarray:
+    """
+    Positions reported by vessels wandering inside a box, about a third of them under way.
+    """
+    min_lon, min_lat, max_lon, max_lat = box
+    origin_lon = random.uniform(min_lon, max_lon, vessels)
+    origin_lat = random.uniform(min_lat, max_lat, vessels)
+    moving = random.random(vessels) < 0.35
+    speed = numpy.where(moving, random.uniform(5., 15., vessels), random.uniform(0., 0.3, vessels))
+    course = random.uniform(0., 360., vessels)
+    step = speed * interval / 3600. / 60.
+    drift_lon = numpy.cumsum(numpy.sin(numpy.radians(course)) * step * random.normal(1., 0.1, (polls, vessels)),
+                             axis=0)
+    drift_lat = numpy.cumsum(numpy.cos(numpy.radians(course)) * step * random.normal(1., 0.1, (polls, vessels)),
+                             axis=0)
+    records = numpy.zeros(polls * vessels, dtype=RECORD_DTYPE)
+    received = start + numpy.repeat(numpy.arange(polls) * interval, vessels)
+    records['received'] = received
+    records['timestamp'] = received - random.integers(0, 180, polls * vessels)
+    records['ship_id'] = numpy.tile(numpy.arange(vessels) + first_imo - 9000000, polls)
+    records['imo'] = numpy.tile(numpy.arange(vessels) + first_imo, polls)
+    records['mmsi'] = records['imo'] + 200000000
+    records['ship_type'] = numpy.tile(_SHIP_TYPES[numpy.arange(vessels) % len(_SHIP_TYPES)], polls)
+    records['lon'] = numpy.clip(origin_lon + drift_lon, min_lon, max_lon).ravel()
+    records['lat'] = numpy.clip(origin_lat + drift_lat, min_lat, max_lat).ravel()
+    records['speed'] = numpy.tile(speed, polls)
+    records['course'] = numpy.tile(course, polls)
+    records['heading'] = records['course']
+    records['draught'] = numpy.tile(random.uniform(5., 20., vessels), polls)
+    records['name'] = numpy.char.add(b'VESSEL ', records['imo'].astype('S8'))
+    records['destination'] = numpy.tile(numpy.array([b'HOUSTON', b'CORPUS CHRISTI', b'NEW ORLEANS', b'SINGAPORE'])[
+        numpy.arange(vessels) % 4], polls)
+    return records
+
+
+def best_of(func, repeat: int = 5) -> float:
+    return min(timed(func) for _ in range(repeat))
+
+
+class _Crash(Exception):
+    pass
+
+
+def check_interrupted_compactions(work_dir: str, random: numpy.random.Generator) -> int:
+    """
+    Stops a compaction merging new records into a compacted partition at each of its file operations in turn,
+    then compacts again as a restarted process would.
+
+    :return: number of interruption points checked
+    """
+    start = int(datetime.datetime(2016, 8, 1, tzinfo=datetime.timezone.utc).timestamp())
+    first = make_positions(_ZONES['Houston'], 50, start, 100, 300, 9000000, random)
+    second = make_positions(_ZONES['Houston'], 50, start + 30000, 100, 300, 9000000, random)
+    operations = {'replace': os.replace, 'remove': os.remove, 'rmtree': shutil.rmtree}
+    step = 0
+    while True:
+        root = os.path.sep.join([work_dir, f'interrupted-{step}'])
+        store = PositionStore(root)
+        store.append_records('Houston', first)
+        store.compact()
+        store.append_records('Houston', second)
+        calls = list()
+
+        def interrupted(name):
+            def operation(*args, **kwargs):
+                calls.append(name)
+                if len(calls) > step:
+                    raise _Crash(name)
+
+                return operations[name](*args, **kwargs)
+
+            return operation
+
+        try:
+            with mock.patch('os.replace', interrupted('replace')), mock.patch('os.remove', interrupted('remove')), \
+                    mock.patch('shutil.rmtree', interrupted('rmtree')):
+                store.compact()
+
+            completed = True
+
+        except _Crash:
+            completed = False
+
+        store = PositionStore(root)
+        store.compact()
+        stored = store.query()
+        assert len(stored) == len(first) + len(second), f'{len(stored)} records after an interruption at step {step}'
+        assert not stored.duplicated(['imo', 'timestamp', 'received']).any()
+        if completed:
+            return step
+
+        step += 1
+
+
+def main(args):
+    random = numpy.random.default_rng(0)
+    first_day = datetime.datetime(2016, 9, 1, tzinfo=datetime.timezone.utc)
+    polls = 86400 // args.interval
+    with tempfile.TemporaryDirectory() as work_dir:
+        store = PositionStore(os.path.sep.join([work_dir, 'positions']))
+        all_records = list()
+        ingestion_time = 0.
+        for day in range(args.days):
+            day_start = int(first_day.timestamp()) + day * 86400
+            for count, (zone, box) in enumerate(_ZONES.items()):
+                records = make_positions(box, args.vessels, day_start, polls, args.interval,
+                                         9000000 + count * args.vessels, random)
+                all_records.append(records)
+                ingestion_time += timed(store.append_records, zone, records)
+
+        compaction_time = timed(store.compact)
+        all_records = numpy.concatenate(all_records)
+        size = sum(os.path.getsize(os.path.join(path, filename))
+                   for path, _, filenames in os.walk(work_dir) for filename in filenames)
+        print(f'{len(all_records)} positions over {args.days} days and {len(_ZONES)} zones, '
+              f'{size / 1024. ** 2:.0f} MB on disk ({size / len(all_records):.0f} bytes per position)')
+        print(f'  append: {len(all_records) / ingestion_time:,.0f} positions/s, '
+              f'compaction: {len(all_records) / compaction_time:,.0f} positions/s')
+
+        end = int(first_day.timestamp()) + args.days * 86400
+        box = (-95.0, 29.0, -94.5, 29.5)
+        window = (end - 86400 - 6 * 3600, end - 86400)
+        imo = 9000000 + args.vessels // 2
+
+        def scan_box():
+            return all_records[(all_records['lon'] >= box[0]) & (all_records['lon'] <= box[2]) &
+                               (all_records['lat'] >= box[1]) & (all_records['lat'] <= box[3]) &
+                               (all_records['timestamp'] >= window[0]) & (all_records['timestamp'] <= window[1]) &
+                               numpy.isin(all_records['ship_type'], [8])]
+
+        def scan_track():
+            return all_records[(all_records['imo'] == imo) & (all_records['timestamp'] >= end - 7 * 86400)]
+
+        def query_box():
+            return store.query(box=box, start=window[0], end=window[1], ship_types=[8])
+
+        def query_track():
+            return store.track(imo, start=end - 7 * 86400)
+
+        assert len(scan_box()) == len(query_box())
+        assert len(scan_track()) == len(query_track())
+        print(f'{"query":>28} {"rows":>7} {"full scan (ms)":>15} {"store (ms)":>11}')
+        for name, scan, query in [('tankers in box, 6 hours', scan_box, query_box),
+                                  ('track of one vessel, 7 days', scan_track, query_track)]:
+            print(f'{name:>28} {len(query()):7d} {best_of(scan) * 1000.:15.1f} {best_of(query) * 1000.:11.1f}')
+
+        steps = check_interrupted_compactions(work_dir, random)
+        print(f'compaction interrupted at each of its {steps} file operations without losing or duplicating records')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the positions store',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--days', type=int, help='days of history', default=14)
+    parser.add_argument('--vessels', type=int, help='vessels per zone', default=400)
+    parser.add_argument('--interval', type=int, help='seconds between polls', default=300)
+    main(parser.parse_args())
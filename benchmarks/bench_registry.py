@@ -0,0 +1,92 @@
+"""
+Compares the vessel registry with a pickled pandas frame indexed on IMO, as loaded by a process looking up
+vessels: opening time, memory held, single lookups by IMO, MMSI and name, and joining positions.
+
+Usage:
+    python benchmarks/bench_registry.py --size 500000 --lookups 100000
+
+"""
+import argparse
+import os
+import tempfile
+
+import numpy
+import pandas
+
+from common import timed
+from shipsdb.registry import VesselRegistry
+from synthetic import make_details
+
+
+def format_rate(count: int, seconds: float) -> str:
+    return f'{count / seconds:12,.0f}/s'
+
+
+def main(args):
+    random = numpy.random.default_rng(1)
+    details = make_details(args.size)
+    details['MMSI'] = (200000000 + numpy.arange(args.size)).astype(str)
+    with tempfile.TemporaryDirectory() as work_dir:
+        details_filename = os.path.sep.join([work_dir, 'ship-db-details.csv'])
+        details.to_csv(details_filename, index=False)
+        registry_dir = os.path.sep.join([work_dir, 'registry'])
+        print(f'registry built in {timed(lambda: VesselRegistry.refresh(registry_dir, details_filename)):.2f}s')
+        registry_size = sum(os.path.getsize(os.path.sep.join([registry_dir, name]))
+                            for name in os.listdir(registry_dir))
+
+        registry = VesselRegistry(registry_dir)
+        vessels = pandas.DataFrame(registry.arrays()).set_index('imo', drop=False)
+        pickle_filename = os.path.sep.join([work_dir, 'vessels_df.pkl'])
+        vessels.to_pickle(pickle_filename)
+        frame_size = vessels.memory_usage(deep=True).sum()
+        print(f'{len(registry)} vessels: registry {registry_size / 1024 ** 2:.1f} MB mapped, '
+              f'frame {frame_size / 1024 ** 2:.1f} MB in memory')
+
+        results = dict()
+
+        def open_registry():
+            results['registry'] = VesselRegistry(registry_dir)
+
+        def open_frame():
+            results['frame'] = pandas.read_pickle(pickle_filename)
+
+        print(f'{"":>16} {"registry":>14} {"pandas":>14}')
+        print(f'{"open":>16} {timed(open_registry) * 1000.:12.2f}ms {timed(open_frame) * 1000.:12.2f}ms')
+        registry, frame = results['registry'], results['frame']
+        mmsi_frame = frame.set_index('mmsi', drop=False)
+        name_frame = frame.assign(key=frame['name'].str.upper()).set_index('key', drop=False)
+
+        imos = random.choice(frame['imo'].to_numpy(), args.lookups).tolist()
+        mmsis = random.choice(frame['mmsi'].to_numpy(), args.lookups).tolist()
+        names = random.choice(frame['name'].to_numpy(), args.lookups // 10).tolist()
+        lookups = [
+            ('by IMO', imos, registry.by_imo, lambda imo: frame.loc[imo]),
+            ('by MMSI', mmsis, registry.by_mmsi, lambda mmsi: mmsi_frame.loc[mmsi]),
+            ('by name', names, registry.by_name, lambda name: name_frame.loc[[name.upper()]]),
+        ]
+        for name, keys, registry_lookup, frame_lookup in lookups:
+            registry_seconds = timed(lambda: [registry_lookup(key) for key in keys])
+            frame_seconds = timed(lambda: [frame_lookup(key) for key in keys])
+            print(f'{name:>16} {format_rate(len(keys), registry_seconds)} {format_rate(len(keys), frame_seconds)}')
+
+        positions = pandas.DataFrame({
+            'imo': numpy.where(random.random(args.positions) < 0.9,
+                               random.choice(frame['imo'].to_numpy(), args.positions), 0),
+            'mmsi': random.choice(frame['mmsi'].to_numpy(), args.positions),
+        })
+        columns = ['flag', 'ship_type', 'deadweight', 'draught']
+        registry_seconds = timed(lambda: registry.join(positions, columns))
+        frame_seconds = timed(lambda: positions.merge(frame[['imo'] + columns].reset_index(drop=True), on='imo',
+                                                      how='left'))
+        print(f'{"join positions":>16} {format_rate(len(positions), registry_seconds)} '
+              f'{format_rate(len(positions), frame_seconds)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the vessel registry against a pandas frame',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--size', type=int, help='rows of the synthetic details export', default=200000)
+    parser.add_argument('--lookups', type=int, help='single lookups per key', default=20000)
+    parser.add_argument('--positions', type=int, help='positions joined with the vessels', default=1000000)
+    main(parser.parse_args())
@@ -0,0 +1,86 @@
+"""
+Startup time of each command of the ships CLI, run in a fresh interpreter: displaying its help, which imports the
+command and builds its arguments parser, then a few short runs against local data and the stub server. The heavy
+libraries imported by each run are listed, as they are expected to only load on the code paths using them.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+from common import SCRIPTS_DIR
+from shipsdb.cli import COMMANDS
+from stub_server import StubServer
+
+_HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow', 'bs4', 'lxml', 'aiohttp')
+
+_MARKER = 'heavy modules:'
+
+# runs the CLI, then reports the heavy modules it imported
+_LAUNCHER = f'''
+import atexit, sys
+atexit.register(lambda: print({_MARKER!r}, ','.join(name for name in {_HEAVY_MODULES!r} if name in sys.modules),
+                              file=sys.stderr))
+from shipsdb.cli import main
+sys.exit(main(sys.argv[1:]))
+'''
+
+
+def run_cli(arguments: List[str], work_dir: str) -> Tuple[float, str]:
+    """
+    :return: wall time in seconds and heavy modules imported
+    """
+    environment = dict(os.environ, PYTHONPATH=SCRIPTS_DIR)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', _LAUNCHER] + arguments, cwd=work_dir, env=environment,
+                               capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f'"ships {" ".join(arguments)}" failed: {completed.stderr[-2000:]}')
+
+    modules = [line[len(_MARKER):].strip() for line in completed.stderr.splitlines() if line.startswith(_MARKER)]
+    return seconds, modules[-1] if modules else '?'
+
+
+def report(name: str, arguments: List[str], work_dir: str, repeat: int):
+    timings, modules = list(), ''
+    for _ in range(repeat):
+        seconds, modules = run_cli(arguments, work_dir)
+        timings.append(seconds)
+
+    print(f'{name:>44} {min(timings) * 1000.:8.0f} ms  {modules or "-"}')
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as work_dir, StubServer() as server:
+        os.makedirs(os.path.sep.join([work_dir, 'output']))
+        print(f'{"":>44} {"startup":>11}  heavy modules imported')
+        report('ships --help', ['--help'], work_dir, args.repeat)
+        for name in COMMANDS:
+            report(f'{name} --help', [name, '--help'], work_dir, args.repeat)
+
+        poll = ['track-ships', '--output-dir', 'output', '--zones', 'Test', '--cycles', '1', '--fixed-rate',
+                '--rate-limit', '100', '--host-alias', f'www.marinetraffic.com={server.url}']
+        report('track-ships, single poll', poll, work_dir, args.repeat)
+        report('manage-cache stats', ['manage-cache', 'stats', 'output/urlcaching.sqlite'], work_dir, args.repeat)
+
+    environment = dict(os.environ, PYTHONPATH=SCRIPTS_DIR)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import ' + ', '.join(_HEAVY_MODULES) + ', pyarrow.parquet'],
+                   env=environment, check=True)
+    print(f'{"importing all heavy modules":>44} {(time.perf_counter() - start) * 1000.:8.0f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the startup time of the CLI commands',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--repeat', type=int, help='runs per command, the fastest one being kept', default=3)
+    main(parser.parse_args())
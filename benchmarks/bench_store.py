@@ -0,0 +1,63 @@
+"""
+Compares the columnar store against the CSV and pickle files it replaces: file size, full load time
+and time to load a few columns.
+
+Usage:
+    python benchmarks/bench_store.py --size 500000
+
+"""
+import argparse
+import csv
+import os
+import tempfile
+
+import pandas
+
+from common import timed
+from shipsdb.store import write_snapshot, read_snapshot
+from synthetic import make_details
+
+_COLUMNS = ['IMO', 'Flag', 'Deadweight']
+
+
+def load_csv_rows(filename: str):
+    with open(filename, 'r', encoding='utf-8') as csv_file:
+        return pandas.DataFrame(list(csv.DictReader(csv_file)))
+
+
+def main(args):
+    vessels = make_details(args.size)
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_filename = os.path.sep.join([work_dir, 'ship-db-details.csv'])
+        pickle_filename = os.path.sep.join([work_dir, 'vessels_df.pkl'])
+        store_dir = os.path.sep.join([work_dir, 'store'])
+        vessels.to_csv(csv_filename, index=False)
+        vessels.to_pickle(pickle_filename)
+        parquet_filename = write_snapshot(store_dir, 'details', vessels, 'oil')
+        results = [
+            ('csv (DictReader)', csv_filename,
+             lambda: load_csv_rows(csv_filename),
+             lambda: load_csv_rows(csv_filename)[_COLUMNS]),
+            ('csv (pandas)', csv_filename,
+             lambda: pandas.read_csv(csv_filename, dtype=str),
+             lambda: pandas.read_csv(csv_filename, dtype=str, usecols=_COLUMNS)),
+            ('pickle', pickle_filename,
+             lambda: pandas.read_pickle(pickle_filename),
+             lambda: pandas.read_pickle(pickle_filename)[_COLUMNS]),
+            ('parquet store', parquet_filename,
+             lambda: read_snapshot(store_dir, 'details', vessel_type='oil'),
+             lambda: read_snapshot(store_dir, 'details', columns=_COLUMNS, vessel_type='oil')),
+        ]
+        print(f'{args.size} rows, {len(vessels.columns)} columns, subset: {_COLUMNS}')
+        print(f'{"format":>18} {"size (MB)":>10} {"full (s)":>9} {"subset (s)":>11}')
+        for name, filename, load_all, load_subset in results:
+            size = os.path.getsize(filename) / 1024. ** 2
+            print(f'{name:>18} {size:10.1f} {timed(load_all):9.3f} {timed(load_subset):11.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the columnar vessels store',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--size', type=int, help='number of synthetic vessels', default=200000)
+    main(parser.parse_args())
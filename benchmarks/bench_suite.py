@@ -0,0 +1,273 @@
+"""
+Offline benchmark suite: recorded vesselfinder and marinetraffic fixtures are replayed through the stub server,
+synthetic data at scaled-up sizes goes through the scripts functions. Nothing is fetched from the remote sites
+and synthetic data is seeded, so that runs are reproducible.
+
+Results are saved as JSON, comparing them with a previous run reports the regressions:
+
+Usage:
+    python benchmarks/bench_suite.py --output baseline.json
+    python benchmarks/bench_suite.py --output current.json --compare baseline.json --tolerance 0.1
+    python benchmarks/bench_suite.py --cases extract clean_details --scale 5
+
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+from common import load_script, timed, SCRIPTS_DIR
+from shipsdb.etl import SELECTIONS, extract
+from shipsdb.fetch import configure
+from stub_server import StubServer
+from synthetic import make_details
+
+_URL_VESSELFINDER = 'https://www.vesselfinder.com'
+
+
+class Case(object):
+    """
+    A benchmarked function: setup() runs once, untimed, then each run is timed.
+    """
+
+    def __init__(self, name: str, unit: str, size: int, setup: Callable[['Context', int], Callable[[], None]]):
+        """
+
+        :param name: case name, as reported in results
+        :param unit: what size counts, as in 'pages' or 'rows'
+        :param size: amount of units processed by a run at scale 1
+        :param setup: returns the function to be timed, given the context and the scaled size
+        """
+        self.name = name
+        self.unit = unit
+        self.size = size
+        self.setup = setup
+
+
+class Context(object):
+    """
+    Scripts loaded as modules, stub server and working directory shared by the cases.
+    """
+
+    def __init__(self, server: StubServer, work_dir: str, concurrency: int):
+        self.server = server
+        self.work_dir = work_dir
+        self.concurrency = concurrency
+        self.download_vessels = load_script('download-vessels')
+        self.download_vessels_details = load_script('download-vessels-details')
+        self.clean_vessels_data = load_script('clean-vessels-data')
+        self.track_ships = load_script('track-ships')
+
+    def path(self, *names: str) -> str:
+        return os.path.sep.join([self.work_dir, *names])
+
+    def details_file(self, size: int) -> str:
+        """
+        :return: synthetic details export of the specified size
+        """
+        filename = self.path(f'ship-db-details-{size}.csv')
+        if not os.path.exists(filename):
+            make_details(size).to_csv(filename, index=False)
+
+        return filename
+
+
+def setup_load_page(context: Context, size: int):
+    def run():
+        for page in range(1, size + 1):
+            context.download_vessels.load_page(6, page)
+
+    return run
+
+
+def setup_load_pages(context: Context, size: int):
+    output_dir = context.path('load-pages')
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run():
+        context.download_vessels.load_pages(6, output_dir, page_max=size, concurrency=context.concurrency)
+
+    return run
+
+
+def setup_load_details(context: Context, size: int):
+    urls = [f'{_URL_VESSELFINDER}/vessels/details/{9000000 + count}' for count in range(size)]
+
+    def run():
+        for count, url in enumerate(urls):
+            context.download_vessels_details.load_details(url, count)
+
+    return run
+
+
+def setup_load_all_details(context: Context, size: int):
+    rows_filename = context.path('details.rows.tmp')
+
+    def run():
+        vessels = (({'IMO': str(9000000 + count)}, f'{_URL_VESSELFINDER}/vessels/details/{9000000 + count}')
+                   for count in range(size))
+        context.download_vessels_details.load_all_details(vessels, rows_filename, '2016-09-10T08:31:00',
+                                                          pool_size=context.concurrency, parse_workers=0)
+
+    return run
+
+
+def setup_poll_zone(context: Context, size: int):
+    poller = context.track_ships.ZonePoller('Houston', 9, 120., 30., 900.)
+
+    def run():
+        for _ in range(size):
+            asyncio.run(poller.poll())
+
+    return run
+
+
+def setup_extract(context: Context, size: int):
+    input_filename = context.details_file(size)
+
+    def run():
+        extract(input_filename, dict(SELECTIONS['details'], **SELECTIONS['clean']), keep_all=True)
+
+    return run
+
+
+def setup_extract_cached(context: Context, size: int):
+    input_filename = context.details_file(size)
+    cache_dir = context.path('etl')
+    extract(input_filename, SELECTIONS['details'], cache_dir=cache_dir)
+
+    def run():
+        extract(input_filename, SELECTIONS['details'], cache_dir=cache_dir)
+
+    return run
+
+
+def setup_clean_details(context: Context, size: int):
+    input_filename = context.details_file(size)
+    store_dir = context.path('store')
+
+    def run():
+        context.clean_vessels_data.clean_details(input_filename, store_dir)
+
+    return run
+
+
+CASES = [
+    Case('load_page', 'pages', 200, setup_load_page),
+    Case('load_pages', 'pages', 500, setup_load_pages),
+    Case('load_details', 'pages', 200, setup_load_details),
+    Case('load_all_details', 'pages', 500, setup_load_all_details),
+    Case('poll_zone', 'polls', 100, setup_poll_zone),
+    Case('extract', 'rows', 200000, setup_extract),
+    Case('extract_cached', 'rows', 200000, setup_extract_cached),
+    Case('clean_details', 'rows', 500000, setup_clean_details),
+]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPTS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_cases(cases: List[Case], scale: float, repeat: int, concurrency: int, latency: float) -> Dict:
+    results = dict()
+    with StubServer(delay=latency) as server, tempfile.TemporaryDirectory() as work_dir:
+        configure(rate_limit=None, connections_per_host=concurrency,
+                  host_aliases={'www.vesselfinder.com': server.url, 'www.marinetraffic.com': server.url})
+        context = Context(server, work_dir, concurrency)
+        for case in cases:
+            size = max(int(case.size * scale), 1)
+            run = case.setup(context, size)
+            requests_count = server.requests_count
+            timings = [timed(run) for _ in range(repeat)]
+            seconds = min(timings)
+            results[case.name] = {
+                'size': size,
+                'unit': case.unit,
+                'seconds': seconds,
+                'timings': timings,
+                'per_unit_ms': 1000. * seconds / size,
+                'throughput': size / seconds,
+                'requests': (server.requests_count - requests_count) // repeat,
+            }
+            print(f'{case.name:>18}: {seconds:8.3f} s  {size:9d} {case.unit:<5} {size / seconds:12,.1f} {case.unit}/s')
+
+    return results
+
+
+def compare(results: Dict, previous: Dict, tolerance: float) -> List[str]:
+    """
+    :return: names of the cases slower than in the previous run by more than the tolerance
+    """
+    regressions = list()
+    print(f'\ncompared with {previous.get("commit")} ({previous.get("created")}):')
+    for name, result in results.items():
+        previous_result = previous['results'].get(name)
+        if previous_result is None or previous_result['size'] != result['size']:
+            print(f'{name:>18}: not comparable')
+            continue
+
+        ratio = result['seconds'] / previous_result['seconds']
+        flag = ''
+        if ratio > 1. + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+
+        print(f'{name:>18}: {previous_result["seconds"]:8.3f} s -> {result["seconds"]:8.3f} s  ({ratio - 1.:+.1%}){flag}')
+
+    return regressions
+
+
+def main(args) -> int:
+    cases = [case for case in CASES if not args.cases or case.name in args.cases]
+    results = run_cases(cases, args.scale, args.repeat, args.concurrency, args.latency)
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'concurrency': args.concurrency,
+        'latency': args.latency,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print(f'results saved to "{args.output}"')
+    if args.compare is None:
+        return 0
+
+    with open(args.compare, 'r', encoding='utf-8') as previous_file:
+        previous = json.load(previous_file)
+
+    regressions = compare(results, previous, args.tolerance)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Running the offline benchmark suite',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--cases', type=str, nargs='*', choices=[case.name for case in CASES],
+                        help='cases to be run, all by default')
+    parser.add_argument('--scale', type=float, help='multiplies the size of every case', default=1.)
+    parser.add_argument('--repeat', type=int, help='runs per case, the fastest one being kept', default=3)
+    parser.add_argument('--concurrency', type=int, help='pages fetched in parallel by the crawl cases', default=4)
+    parser.add_argument('--latency', type=float, help='simulated server latency in seconds', default=0.)
+    parser.add_argument('--output', type=str, help='location of the JSON results', default='bench-suite.json')
+    parser.add_argument('--compare', type=str, help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, help='slowdown ratio reported as regression', default=0.1)
+    sys.exit(main(parser.parse_args()))
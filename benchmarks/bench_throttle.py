@@ -0,0 +1,111 @@
+"""
+Crawls the stub server, set up to reject requests beyond a given rate with status 429, for a fixed duration:
+at the former fixed rate, at a fixed rate above what the site tolerates, and with the adaptive throttle,
+then with the adaptive throttle shared by several processes through its state file.
+
+Usage:
+    python benchmarks/bench_throttle.py --site-rate 8 --duration 30
+
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from common import timed
+from shipsdb.fetch import Fetcher, FetchError
+from shipsdb.throttle import AdaptiveThrottle
+from stub_server import StubServer
+
+_HOST = 'www.vesselfinder.com'
+
+
+def crawl(server_url: str, duration: float, concurrency: int, rate: float, adaptive: bool,
+          max_rate: float, state_filename: Optional[str] = None) -> Tuple[int, int, float]:
+    """
+    :return: pages loaded, pages failed after retries, final rate
+    """
+    throttle = None
+    if adaptive:
+        throttle = AdaptiveThrottle(state_filename, initial_rate=rate, max_rate=max_rate)
+
+    fetcher = Fetcher(rate_limit=rate, connections_per_host=concurrency, retries=3, backoff=0.5,
+                      host_aliases={_HOST: server_url}, throttle=throttle)
+    end = time.monotonic() + duration
+    counts = {'loaded': 0, 'failed': 0}
+
+    def worker(worker_id: int):
+        page = 0
+        while time.monotonic() < end:
+            page += 1
+            try:
+                fetcher.open_url(f'https://{_HOST}/vessels/details/{9000000 + worker_id * 1000000 + page}')
+                counts['loaded'] += 1
+
+            except FetchError:
+                counts['failed'] += 1
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+
+    fetcher.close()
+    return counts['loaded'], counts['failed'], throttle.rate(_HOST) if throttle is not None else rate
+
+
+def _crawl_process(args):
+    return crawl(*args)
+
+
+def main(args):
+    print(f'site tolerating {args.site_rate:.0f} requests/s, crawling for {args.duration:.0f}s with '
+          f'{args.concurrency} workers')
+    print(f'{"mode":>24} {"loaded":>7} {"failed":>7} {"429":>6} {"pages/s":>8} {"final rate":>11}')
+    modes = [
+        ('fixed 1/s', dict(rate=1., adaptive=False)),
+        (f'fixed {args.max_rate:.0f}/s', dict(rate=args.max_rate, adaptive=False)),
+        ('adaptive', dict(rate=1., adaptive=True)),
+    ]
+    for name, settings in modes:
+        with StubServer(max_rate=args.site_rate) as server:
+            results = dict()
+
+            def run():
+                results['crawl'] = crawl(server.url, args.duration, args.concurrency, max_rate=args.max_rate,
+                                         **settings)
+
+            duration = timed(run)
+            loaded, failed, rate = results['crawl']
+            print(f'{name:>24} {loaded:7d} {failed:7d} {server.rejected_count:6d} {loaded / duration:8.1f} '
+                  f'{rate:11.2f}')
+
+    with StubServer(max_rate=args.site_rate) as server, tempfile.TemporaryDirectory() as work_dir:
+        state_filename = os.path.sep.join([work_dir, 'throttle-state.json'])
+        crawl_args = (server.url, args.duration, args.concurrency, 1., True, args.max_rate, state_filename)
+        results = dict()
+
+        def run_processes():
+            with multiprocessing.Pool(args.processes) as pool:
+                results['crawls'] = pool.map(_crawl_process, [crawl_args] * args.processes)
+
+        duration = timed(run_processes)
+        results = results['crawls']
+
+        loaded, failed = sum(result[0] for result in results), sum(result[1] for result in results)
+        name = f'adaptive, {args.processes} processes'
+        print(f'{name:>24} {loaded:7d} {failed:7d} {server.rejected_count:6d} {loaded / duration:8.1f} '
+              f'{results[0][2]:11.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarking the adaptive throttle against a rate limited site',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--site-rate', type=float, help='requests per second tolerated by the site', default=8.)
+    parser.add_argument('--duration', type=float, help='seconds of crawl per mode', default=30.)
+    parser.add_argument('--concurrency', type=int, help='pages fetched in parallel', default=4)
+    parser.add_argument('--max-rate', type=float, help='highest rate of the adaptive throttle', default=20.)
+    parser.add_argument('--processes', type=int, help='crawling processes sharing the throttle state', default=2)
+    main(parser.parse_args())
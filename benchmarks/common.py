@@ -0,0 +1,27 @@
+"""
+Helpers shared by the benchmarks: makes the shipsdb package importable.
+"""
+import importlib
+import os
+import sys
+import time
+
+SCRIPTS_DIR = os.path.abspath(os.path.sep.join([os.path.dirname(os.path.abspath(__file__)), os.pardir, 'scripts']))
+FIXTURES_DIR = os.path.sep.join([os.path.dirname(os.path.abspath(__file__)), 'fixtures'])
+
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+def load_script(name: str):
+    """
+    :param name: command name, as in 'download-vessels'
+    :return: command module
+    """
+    return importlib.import_module(f'shipsdb.commands.{name.replace("-", "_")}')
+
+
+def timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
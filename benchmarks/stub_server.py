@@ -0,0 +1,144 @@
+"""
+Local HTTP stand-in for the remote sites, serving recorded pages from the fixtures directory.
+
+Point the fetch layer at it through host aliases:
+    >>> with StubServer() as server:
+    ...     configure(rate_limit=None, host_aliases={'www.vesselfinder.com': server.url})
+    ...     html_text = open_url('https://www.vesselfinder.com/vessels/details/9321483')
+
+Usage, as a standalone server:
+    python benchmarks/stub_server.py --port 8000
+
+"""
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Optional, Tuple
+
+from common import FIXTURES_DIR
+
+_ROUTES = [
+    (re.compile(r'^/vessels/details/[0-9]+$'), 'vessel-details-page.html', 'text/html'),
+    (re.compile(r'^/vessels(\?.*)?$'), 'vessels-results-page.html', 'text/html'),
+    (re.compile(r'^/map/get_data_json/'), 'map-data.json', 'application/json'),
+]
+
+
+class StubServer(object):
+    """
+    Serves fixtures on a local port from a background thread.
+    """
+
+    def __init__(self, port: int = 0, routes: Optional[List[Tuple]] = None, fixtures_dir: str = FIXTURES_DIR,
+                 delay: float = 0., max_rate: Optional[float] = None):
+        """
+
+        :param port: listening port, a free one is picked if 0
+        :param routes: list of (compiled path pattern, fixture filename, content type)
+        :param fixtures_dir: location of the fixtures
+        :param delay: simulated server latency in seconds
+        :param max_rate: requests per second tolerated, answering with status 429 beyond, no limit if None
+        """
+        self._routes = _ROUTES if routes is None else routes
+        self._fixtures = dict()
+        for _, filename, _ in self._routes:
+            with open(os.path.sep.join([fixtures_dir, filename]), 'rb') as fixture_file:
+                self._fixtures[filename] = fixture_file.read()
+
+        self.requests_count = 0
+        self.rejected_count = 0
+        recent = deque()
+        recent_lock = threading.Lock()
+        stub = self
+
+        def is_rejected() -> bool:
+            if not max_rate:
+                return False
+
+            now = time.monotonic()
+            with recent_lock:
+                while recent and recent[0] < now - 1.:
+                    recent.popleft()
+
+                if len(recent) >= max_rate:
+                    stub.rejected_count += 1
+                    return True
+
+                recent.append(now)
+                return False
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests_count += 1
+                if is_rejected():
+                    self.send_response(429)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                if delay:
+                    threading.Event().wait(delay)
+
+                for pattern, filename, content_type in stub._routes:
+                    if pattern.match(self.path):
+                        content = stub._fixtures[filename]
+                        self.send_response(200)
+                        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                        self.send_header('Content-Length', str(len(content)))
+                        self.end_headers()
+                        self.wfile.write(content)
+                        return
+
+                self.send_error(404)
+
+            def log_message(self, format, *args):
+                logging.debug('stub server: ' + format, *args)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s:%(name)s:%(levelname)s:%(message)s')
+    parser = argparse.ArgumentParser(description='Serving recorded pages locally',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    parser.add_argument('--port', type=int, help='listening port', default=8000)
+    parser.add_argument('--delay', type=float, help='simulated latency in seconds', default=0.)
+    parser.add_argument('--max-rate', type=float, help='requests per second tolerated before answering 429')
+    args = parser.parse_args()
+    server = StubServer(port=args.port, delay=args.delay, max_rate=args.max_rate)
+    logging.info('serving fixtures on %s', server.url)
+    server.serve_forever()
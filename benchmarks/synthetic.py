@@ -0,0 +1,77 @@
+"""
+Synthetic vessels data at scaled-up sizes, shaped like the exports of the scripts.
+"""
+import numpy
+import pandas
+
+_FLAGS = ['Panama', 'Liberia', 'Marshall Islands', 'Malta', 'Greece', 'Singapore', 'Bahamas', 'Hong Kong',
+          'Cyprus', 'Norway', 'China', 'Japan', 'United Kingdom', 'Italy', 'India']
+_SHIP_TYPES = ['Crude Oil Tanker', 'Oil Products Tanker', 'Oil/Chemical Tanker', 'LNG Tanker', 'LPG Tanker',
+               'Bulk Carrier', 'Container Ship']
+
+
+def _with_unit(values: numpy.ndarray, unit: str, missing: numpy.ndarray, decimals: int = 0) -> numpy.ndarray:
+    formatted = numpy.char.add(numpy.round(values, decimals).astype(int if decimals == 0 else float).astype(str), unit)
+    return numpy.where(missing, '', formatted)
+
+
+def make_details(size: int, seed: int = 0) -> pandas.DataFrame:
+    """
+    Raw details rows as expected by clean_details(): numeric values as text with their unit.
+
+    :param size: number of rows
+    :param seed: random generator seed
+    :return: frame of strings
+    """
+    random = numpy.random.default_rng(seed)
+    missing = random.random((8, size)) < 0.05
+    imo = 9000000 + random.integers(0, max(size // 2, 1), size)
+    flags = random.choice(_FLAGS, size)
+    owners = numpy.where(random.random(size) < 0.9, flags, random.choice(_FLAGS, size))
+    gross_tonnage = random.gamma(2., 25000., size) + 500.
+    length = numpy.clip(gross_tonnage ** 0.33 * 6.5, 40., 400.)
+    width = numpy.clip(length / random.uniform(5.5, 7.5, size), 8., 70.)
+    length[random.random(size) < 0.001] = 3000.
+    course = random.uniform(0., 360., size)
+    speed = random.uniform(0., 18., size)
+    course_speed = numpy.char.add(numpy.char.add(numpy.round(course, 1).astype(str), '° / '),
+                                  numpy.char.add(numpy.round(speed, 1).astype(str), ' kn'))
+    return pandas.DataFrame({
+        'IMO': numpy.where(random.random(size) < 0.01, '', imo.astype(str)),
+        'Name': numpy.char.add('VESSEL ', imo.astype(str)),
+        'Flag': flags,
+        'ship_country_owner': owners,
+        'Ship type': random.choice(_SHIP_TYPES, size),
+        'Built': numpy.where(missing[0], '', random.integers(1970, 2017, size).astype(str)),
+        'Current draught': _with_unit(random.uniform(5., 22., size), ' m', missing[1], 1),
+        'Draught': _with_unit(random.uniform(8., 23., size), ' m', missing[2], 1),
+        'Deadweight': _with_unit(gross_tonnage * 1.7, ' t', missing[3]),
+        'Gross Tonnage': _with_unit(gross_tonnage, ' t', missing[4]),
+        'Net Tonnage': _with_unit(gross_tonnage * 0.6, ' t', missing[5]),
+        'GT': _with_unit(gross_tonnage, ' t', missing[4]),
+        'Course/Speed': numpy.where(missing[6], '-', course_speed),
+        'Size': numpy.where(missing[7], '', numpy.char.add(numpy.char.add(length.astype(int).astype(str), ' x '),
+                                                           numpy.char.add(width.astype(int).astype(str), ' m'))),
+        'Crude (bbl)': '',
+        'last_report_ts': 'Sep 10, 2016 08:31 UTC',
+    })
+
+
+def make_vessels(size: int, seed: int = 0) -> pandas.DataFrame:
+    """
+    Rows as produced by load_page() in download-vessels.py.
+    """
+    random = numpy.random.default_rng(seed)
+    gross_tons = (random.gamma(2., 25000., size) + 500.).astype(int)
+    length = numpy.clip(gross_tons ** 0.33 * 6.5, 40., 400.).astype(int)
+    return pandas.DataFrame({
+        'country': random.choice(_FLAGS, size),
+        'dead-weight-tons': (gross_tons * 1.7).astype(int),
+        'gross-tons': gross_tons,
+        'imo': (9000000 + numpy.arange(size)).astype(str),
+        'length_meters': length,
+        'name': numpy.char.add('VESSEL ', numpy.arange(size).astype(str)),
+        'type': random.choice(_SHIP_TYPES, size),
+        'width_meters': (length / 6.5).astype(int),
+        'year-built': random.integers(1970, 2017, size),
+    })
@@ -0,0 +1,7 @@
+import sys
+
+from shipsdb.cli import run_command
+
+
+if __name__ == '__main__':
+    sys.exit(run_command('detect-cargo-events'))
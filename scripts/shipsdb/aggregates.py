@@ -0,0 +1,285 @@
+"""
+Materialized fleet aggregates.
+
+Rollups of vessel counts, Gross Tonnage, Deadweight and Deadweight-implied barrels are computed once per
+cleaned vessels snapshot (scope 'fleet') and once per interval for the vessels present in each tracking zone
+(scope: the zone slug), then stored in a SQLite file, so that dashboard queries become lookups:
+
+    >>> aggregates = FleetAggregates('output/aggregates.sqlite')
+    >>> aggregates.update_fleet('output/store')
+    >>> aggregates.update_zones(PositionStore('output/positions'), 'output/store')
+    >>> aggregates.share('size_class', 'large', 'gross_tonnage')
+    >>> aggregates.lookup('all', scope='houston')
+
+Only snapshots and intervals not aggregated yet are processed by the updates.
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+
+from shipsdb.cargo import tonnes_to_barrels
+from shipsdb.lazy import lazy_import
+from shipsdb.positions import PositionStore
+from shipsdb.store import list_snapshots, read_snapshot
+
+pandas = lazy_import('pandas')
+
+__all__ = ['FleetAggregates', 'DIMENSIONS', 'size_class']
+
+# dimension name: column of the cleaned vessels
+DIMENSIONS = {
+    'ship_type': 'Ship type',
+    'size_class': 'size_class',
+    'flag': 'Flag',
+}
+
+_MEASURES = ('vessels', 'gross_tonnage', 'deadweight', 'barrels')
+
+_PARTICULARS = ['IMO', 'Ship type', 'Flag', 'Length', 'Gross Tonnage', 'Deadweight']
+
+_UNKNOWN = 'unknown'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    scope TEXT NOT NULL,
+    vessel_type TEXT NOT NULL,
+    as_of TEXT NOT NULL,
+    PRIMARY KEY (scope, vessel_type, as_of)
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    scope TEXT NOT NULL,
+    vessel_type TEXT NOT NULL,
+    as_of TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    vessels INTEGER NOT NULL,
+    gross_tonnage REAL NOT NULL,
+    deadweight REAL NOT NULL,
+    barrels REAL NOT NULL,
+    PRIMARY KEY (scope, vessel_type, dimension, as_of, key)
+);
+'''
+
+
+def size_class(vessels: pandas.DataFrame) -> numpy.ndarray:
+    """
+    Size classes from the README criteria, first matching class wins:
+        small: GT < 120
+        large: Length > 250 and GT > 80000
+        selected: Length > 200 or GT > 60000, the details selection of shipsdb.etl
+        other: the rest
+    """
+    gross_tonnage = vessels['Gross Tonnage'].to_numpy(dtype=numpy.float64, na_value=numpy.nan)
+    length = vessels['Length'].to_numpy(dtype=numpy.float64, na_value=numpy.nan)
+    return numpy.select([gross_tonnage < 120., (length > 250.) & (gross_tonnage > 80000.),
+                         (length > 200.) | (gross_tonnage > 60000.)],
+                        ['small', 'large', 'selected'], default='other')
+
+
+class FleetAggregates(object):
+    """
+    Thread-safe: a single connection is shared behind a lock.
+    """
+
+    def __init__(self, filename: str, cargo_ratio: float = 0.8, density: float = 0.85,
+                 table13: Optional[float] = None):
+        """
+
+        :param filename: location of the SQLite file
+        :param cargo_ratio: cargo capacity as a fraction of the Deadweight
+        :param density: cargo density in t/m3 used for barrels
+        :param table13: API Table 13 factor in metric tonnes per barrel, overrides the density
+        """
+        self._cargo_ratio = cargo_ratio
+        self._density = density
+        self._table13 = table13
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def rollup(self, vessels: pandas.DataFrame) -> List[Tuple]:
+        """
+        :param vessels: cleaned vessels, one row per vessel
+        :return: (dimension, key, vessels, gross tonnage, deadweight, barrels) rows, the 'all' dimension
+        holding the totals
+        """
+        deadweight = pandas.to_numeric(vessels['Deadweight'], errors='coerce').fillna(0.)
+        measures = pandas.DataFrame({
+            'vessels': 1,
+            'gross_tonnage': pandas.to_numeric(vessels['Gross Tonnage'], errors='coerce').fillna(0.),
+            'deadweight': deadweight,
+            'barrels': tonnes_to_barrels(deadweight * self._cargo_ratio, self._density, self._table13),
+        }, index=vessels.index)
+        totals = measures.sum()
+        rows = [('all', '', int(totals['vessels'])) + tuple(float(totals[name]) for name in _MEASURES[1:])]
+        keys = dict(vessels[[column for column in DIMENSIONS.values() if column != 'size_class']]
+                    .astype(object).fillna(_UNKNOWN).items(), size_class=size_class(vessels))
+        for dimension, column in DIMENSIONS.items():
+            grouped = measures.groupby(numpy.asarray(keys[column], dtype=object)).sum()
+            rows.extend((dimension, str(key), int(values['vessels'])) +
+                        tuple(float(values[name]) for name in _MEASURES[1:])
+                        for key, values in grouped.iterrows())
+
+        return rows
+
+    def _aggregated(self, scope: str, vessel_type: str) -> List[str]:
+        with self._lock:
+            cursor = self._connection.execute('SELECT as_of FROM sources WHERE scope = ? AND vessel_type = ? '
+                                              'ORDER BY as_of', (scope, vessel_type))
+            return [as_of for as_of, in cursor.fetchall()]
+
+    def _insert(self, scope: str, vessel_type: str, as_of: str, rows: List[Tuple]):
+        with self._lock, self._connection:
+            self._connection.execute('BEGIN')
+            self._connection.execute('DELETE FROM rollups WHERE scope = ? AND vessel_type = ? AND as_of = ?',
+                                     (scope, vessel_type, as_of))
+            self._connection.executemany('INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                         [(scope, vessel_type, as_of) + row for row in rows])
+            self._connection.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)', (scope, vessel_type, as_of))
+
+    def update_fleet(self, store_dir: str) -> int:
+        """
+        Aggregates the cleaned vessels snapshots not aggregated yet.
+
+        :return: number of snapshots aggregated
+        """
+        count = 0
+        for vessel_type, snapshot_dates in list_snapshots(store_dir, 'cleaned').items():
+            aggregated = set(self._aggregated('fleet', vessel_type))
+            for snapshot_date in snapshot_dates:
+                if snapshot_date.isoformat() in aggregated:
+                    continue
+
+                vessels = read_snapshot(store_dir, 'cleaned', columns=_PARTICULARS, vessel_type=vessel_type,
+                                        snapshot_date=snapshot_date)
+                self._insert('fleet', vessel_type, snapshot_date.isoformat(), self.rollup(vessels))
+                logging.info('aggregated %d %s vessels of %s', len(vessels), vessel_type, snapshot_date)
+                count += 1
+
+        return count
+
+    def update_zones(self, position_store: PositionStore, store_dir: str, interval: int = 3600,
+                     until: Optional[int] = None) -> int:
+        """
+        Aggregates the vessels present in each zone at the end of each interval not aggregated yet, the vessels
+        being matched by IMO with the latest cleaned snapshots.
+
+        :param position_store: tracker output
+        :param store_dir: location of the columnar vessels store
+        :param interval: seconds between two zone rollups
+        :param until: latest time to aggregate in epoch seconds, defaults to now
+        :return: number of zone rollups computed
+        """
+        try:
+            particulars = read_snapshot(store_dir, 'cleaned', columns=_PARTICULARS)
+            particulars = particulars.drop_duplicates('IMO', keep='last')
+            particulars = particulars[particulars['IMO'].str.isdigit()]
+            particulars.index = particulars['IMO'].astype(numpy.int64)
+
+        except FileNotFoundError:
+            logging.warning('no cleaned vessels in "%s", zone rollups will only count vessels', store_dir)
+            particulars = pandas.DataFrame(columns=_PARTICULARS, index=pandas.Index([], dtype=numpy.int64))
+
+        if until is None:
+            until = int(time.time())
+
+        count = 0
+        for zone in sorted({zone for zone, _ in position_store.partitions()}):
+            last_received = position_store.last_received(zone)
+            aggregated = self._aggregated(zone, '')
+            if aggregated:
+                # as_of is stored as naive UTC, which timestamp() would take as local time
+                last_as_of = datetime.datetime.fromisoformat(aggregated[-1]).replace(tzinfo=datetime.timezone.utc)
+                start = int(last_as_of.timestamp()) + interval
+
+            else:
+                first_day = position_store.partitions([zone])[0][1]
+                start = int(datetime.datetime(first_day.year, first_day.month, first_day.day,
+                                              tzinfo=datetime.timezone.utc).timestamp()) + interval
+
+            for at in range(start - start % interval, min(until, last_received or 0) + 1, interval):
+                vessels = position_store.snapshot(zone, at)
+                vessels = particulars.reindex(vessels['imo'].to_numpy(dtype=numpy.int64))
+                as_of = datetime.datetime.fromtimestamp(at, datetime.timezone.utc).replace(tzinfo=None)
+                self._insert(zone, '', as_of.isoformat(), self.rollup(vessels))
+                count += 1
+
+            logging.info('aggregated zone %s up to %s', zone,
+                         datetime.datetime.fromtimestamp(min(until, last_received or 0), datetime.timezone.utc))
+
+        return count
+
+    def lookup(self, dimension: str = 'all', scope: str = 'fleet', vessel_type: Optional[str] = None,
+               as_of: Optional[str] = None) -> pandas.DataFrame:
+        """
+        :param dimension: 'all' for totals, or one of DIMENSIONS
+        :param scope: 'fleet' or a zone slug
+        :param vessel_type: store partition of the vessels for the fleet scope, all partitions by default
+        :param as_of: snapshot date or zone rollup time in ISO format, defaults to the latest
+        :return: measures by key, summed over vessel types
+        """
+        vessel_types = [''] if scope != 'fleet' else ([vessel_type] if vessel_type is not None else
+                                                      list(self._vessel_types(scope)))
+        rows = list()
+        with self._lock:
+            for current_type in vessel_types:
+                selected = as_of
+                if selected is None:
+                    cursor = self._connection.execute('SELECT MAX(as_of) FROM sources WHERE scope = ? AND '
+                                                      'vessel_type = ?', (scope, current_type))
+                    selected, = cursor.fetchone()
+
+                cursor = self._connection.execute('SELECT key, vessels, gross_tonnage, deadweight, barrels '
+                                                  'FROM rollups WHERE scope = ? AND vessel_type = ? AND '
+                                                  'dimension = ? AND as_of = ?',
+                                                  (scope, current_type, dimension, selected))
+                rows.extend(cursor.fetchall())
+
+        measures = pandas.DataFrame(rows, columns=['key'] + list(_MEASURES))
+        return measures.groupby('key').sum()
+
+    def _vessel_types(self, scope: str) -> List[str]:
+        cursor = self._connection.execute('SELECT DISTINCT vessel_type FROM sources WHERE scope = ?', (scope,))
+        return [vessel_type for vessel_type, in cursor.fetchall()]
+
+    def share(self, dimension: str, key: str, measure: str = 'gross_tonnage', scope: str = 'fleet',
+              vessel_type: Optional[str] = None) -> float:
+        """
+        Share of the total of a measure for a key, as in the share of Gross Tonnage of large vessels.
+        """
+        values = self.lookup(dimension, scope, vessel_type)
+        total = self.lookup('all', scope, vessel_type)[measure].sum()
+        return float(values[measure].get(key, 0.) / total) if total else numpy.nan
+
+    def history(self, scope: str, dimension: str = 'all', key: str = '', measure: str = 'barrels',
+                vessel_type: str = '') -> pandas.Series:
+        """
+        :return: measure over time for a key, as in the barrels present in a zone
+        """
+        if measure not in _MEASURES:
+            raise ValueError(f'unknown measure "{measure}", expecting one of {_MEASURES}')
+
+        with self._lock:
+            cursor = self._connection.execute(f'SELECT as_of, {measure} FROM rollups WHERE scope = ? AND '
+                                              f'vessel_type = ? AND dimension = ? AND key = ? ORDER BY as_of',
+                                              (scope, vessel_type, dimension, key))
+            rows = cursor.fetchall()
+
+        return pandas.Series(dict(rows), name=measure, dtype=numpy.float64)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            cursor = self._connection.execute('SELECT scope, COUNT(*) FROM sources GROUP BY scope')
+            return dict(cursor.fetchall())
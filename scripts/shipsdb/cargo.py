@@ -0,0 +1,199 @@
+"""
+Incremental detection of cargo operations from draught changes.
+
+A tanker loading sits deeper in the water and one discharging rides higher: CargoEventDetector follows the
+reported draught of each vessel, one update at a time, and emits a loading or discharge event when the
+draught settles at a new value. Each vessel only needs a few values of state, so that new updates never
+require going back over the history.
+
+A new draught is confirmed once reported by the specified number of consecutive updates. Positions stored by
+DeltaIngester only include changes, a steady draught being stored a single time: those are fed with a single
+confirmation, the draught threshold of the ingester already leaving out small variations.
+
+The cargo moved is estimated from the Deadweight, assuming the draught varies linearly between ballast and
+summer draught, then converted to barrels either with an oil density or with an API Table 13 factor
+(metric tonnes per barrel, from about 0.11 for light gasoline to 0.16 for marine fuel oil):
+
+    >>> detector = CargoEventDetector(particulars={9330812: (105000., 14.8)}, density=0.85)
+    >>> for imo, timestamp, draught, zone, speed in updates:
+    ...     event = detector.update(imo, timestamp, draught, zone, speed)
+
+"""
+import math
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+__all__ = ['CargoEvent', 'CargoEventDetector', 'tonnes_to_barrels']
+
+_BARRELS_PER_CUBIC_METER = 6.28981
+
+
+class CargoEvent(NamedTuple):
+    imo: int
+    kind: str
+    zone: Optional[str]
+    timestamp: int
+    draught_before: float
+    draught_after: float
+    tonnes: float
+    barrels: float
+
+
+def tonnes_to_barrels(tonnes: float, density: Optional[float] = 0.85, table13: Optional[float] = None) -> float:
+    """
+    :param tonnes: cargo weight in metric tonnes
+    :param density: cargo density in t/m3, used when no Table 13 factor is specified
+    :param table13: API Table 13 factor in metric tonnes per barrel
+    :return: cargo volume in barrels
+    """
+    if table13:
+        return tonnes / table13
+
+    return tonnes / density * _BARRELS_PER_CUBIC_METER
+
+
+class _VesselState(object):
+    __slots__ = ('draught', 'max_draught', 'pending', 'pending_count', 'pending_timestamp', 'port_zone')
+
+    def __init__(self):
+        self.draught = None
+        self.max_draught = 0.
+        self.pending = None
+        self.pending_count = 0
+        self.pending_timestamp = None
+        self.port_zone = None
+
+
+class CargoEventDetector(object):
+
+    def __init__(self, particulars: Optional[Dict[int, Tuple[float, float]]] = None, min_change: float = 1.,
+                 confirmations: int = 2, moored_speed: float = 1., ballast_ratio: float = 0.4,
+                 cargo_ratio: float = 0.8, density: float = 0.85, table13: Optional[float] = None):
+        """
+
+        :param particulars: (Deadweight in tonnes, summer draught in meters) by IMO
+        :param min_change: smallest draught change in meters considered as cargo operation
+        :param confirmations: number of consecutive updates the new draught must be reported for
+        :param moored_speed: speed in knots below which a vessel is considered at berth or at anchor
+        :param ballast_ratio: ballast draught as a fraction of the summer draught
+        :param cargo_ratio: cargo capacity as a fraction of the Deadweight, the rest being fuel, stores, water...
+        :param density: cargo density in t/m3
+        :param table13: API Table 13 factor in metric tonnes per barrel, overrides the density
+        """
+        self._particulars = particulars or dict()
+        self._min_change = min_change
+        self._confirmations = max(confirmations, 1)
+        self._moored_speed = moored_speed
+        self._ballast_ratio = ballast_ratio
+        self._cargo_ratio = cargo_ratio
+        self._density = density
+        self._table13 = table13
+        self._vessels = dict()
+
+    def __len__(self) -> int:
+        return len(self._vessels)
+
+    def set_particulars(self, imo: int, deadweight: float, summer_draught: Optional[float] = None):
+        self._particulars[imo] = (deadweight, summer_draught)
+
+    def update(self, imo: int, timestamp: int, draught: Optional[float], zone: Optional[str] = None,
+               speed: Optional[float] = None) -> Optional[CargoEvent]:
+        """
+        Updates must be fed by increasing timestamp for each vessel.
+
+        :param imo: vessel IMO
+        :param timestamp: report time in epoch seconds
+        :param draught: reported draught in meters
+        :param zone: tracking zone the vessel is in, if any
+        :param speed: speed in knots, used to locate where the vessel was moored
+        :return: an event when the update confirms a new draught
+        """
+        state = self._vessels.get(imo)
+        if state is None:
+            state = _VesselState()
+            self._vessels[imo] = state
+
+        if zone is not None and speed is not None and speed < self._moored_speed:
+            state.port_zone = zone
+
+        if draught is None or not draught > 0.:
+            return None
+
+        if draught > state.max_draught:
+            state.max_draught = draught
+
+        if state.draught is None:
+            state.draught = draught
+            return None
+
+        if abs(draught - state.draught) < self._min_change:
+            state.pending = None
+            state.pending_count = 0
+            return None
+
+        if state.pending is not None and abs(draught - state.pending) < self._min_change / 2.:
+            state.pending_count += 1
+
+        else:
+            state.pending = draught
+            state.pending_count = 1
+            state.pending_timestamp = timestamp
+
+        if state.pending_count < self._confirmations:
+            return None
+
+        draught_before = state.draught
+        state.draught = draught
+        state.pending = None
+        state.pending_count = 0
+        tonnes = self.cargo_tonnes(imo, draught_before, draught, state.max_draught)
+        return CargoEvent(imo=imo, kind=('discharge', 'load')[draught > draught_before],
+                          zone=state.port_zone if state.port_zone is not None else zone,
+                          timestamp=state.pending_timestamp, draught_before=draught_before, draught_after=draught,
+                          tonnes=tonnes, barrels=tonnes_to_barrels(tonnes, self._density, self._table13))
+
+    def update_many(self, updates: Iterable[Tuple[int, int, float, Optional[str], Optional[float]]]) -> List[CargoEvent]:
+        """
+        :param updates: (imo, timestamp, draught, zone, speed) tuples
+        :return: events emitted
+        """
+        update = self.update
+        events = list()
+        for imo, timestamp, draught, zone, speed in updates:
+            event = update(imo, timestamp, draught, zone, speed)
+            if event is not None:
+                events.append(event)
+
+        return events
+
+    def cargo_tonnes(self, imo: int, draught_before: float, draught_after: float,
+                     max_draught_observed: float = 0.) -> float:
+        """
+        Cargo weight corresponding to a draught change, NaN when the Deadweight is unknown.
+        """
+        deadweight, summer_draught = self._particulars.get(imo, (None, None))
+        if not deadweight or deadweight != deadweight:
+            return math.nan
+
+        if not summer_draught or summer_draught != summer_draught:
+            summer_draught = max_draught_observed
+
+        immersion = summer_draught * (1. - self._ballast_ratio)
+        fraction = min(1., abs(draught_after - draught_before) / immersion)
+        return fraction * self._cargo_ratio * deadweight
+
+    def state(self) -> Dict[int, List]:
+        """
+        :return: state of each vessel, in a JSON serializable form
+        """
+        return {imo: [state.draught, state.max_draught, state.pending, state.pending_count, state.pending_timestamp,
+                      state.port_zone] for imo, state in self._vessels.items()}
+
+    def restore(self, vessels: Dict[int, List]):
+        """
+        Restores the state of vessels as returned by state().
+        """
+        for imo, values in vessels.items():
+            state = _VesselState()
+            (state.draught, state.max_draught, state.pending, state.pending_count, state.pending_timestamp,
+             state.port_zone) = values
+            self._vessels[int(imo)] = state
@@ -0,0 +1,93 @@
+"""
+Single entry point of the ships DB scripts, installed as the "ships" command:
+
+    $ ships download-vessels --output-dir output 6
+    $ ships download-vessels-details --input-dir output --output-dir output --incremental
+    $ ships track-ships --zones Houston --cycles 1
+
+Only the module of the command being run is imported, heavy dependencies (pandas, pyarrow, BeautifulSoup,
+aiohttp) being themselves loaded on first use, see shipsdb.lazy.
+"""
+import argparse
+import importlib
+import logging
+import sys
+from typing import List, Optional
+
+__all__ = ['COMMANDS', 'main', 'run_command', 'load_command']
+
+# command name: (module, summary), summaries being duplicated here so that listing commands imports none of them
+COMMANDS = {
+    'download-vessels': ('shipsdb.commands.download_vessels', 'imports vessels lists from online DB'),
+    'download-vessels-details': ('shipsdb.commands.download_vessels_details', 'imports vessels details from online DB'),
+    'clean-vessels-data': ('shipsdb.commands.clean_vessels_data', 'cleans up raw exports'),
+    'track-ships': ('shipsdb.commands.track_ships', 'tracks vessels positions from online map'),
+    'detect-cargo-events': ('shipsdb.commands.detect_cargo_events', 'detects loadings and discharges from draught changes'),
+    'detect-zone-events': ('shipsdb.commands.detect_zone_events', 'detects vessels entering and leaving zones'),
+    'update-aggregates': ('shipsdb.commands.update_aggregates', 'maintains fleet capacity aggregates'),
+    'manage-cache': ('shipsdb.commands.manage_cache', 'manages the pages cache'),
+    'manage-registry': ('shipsdb.commands.manage_registry', 'manages the registry of vessels static attributes'),
+    'manage-history': ('shipsdb.commands.manage_history', 'records crawls of vessels lists, diffs them'),
+}
+
+_LOG_FORMAT = '%(asctime)s:%(name)s:%(levelname)s:%(message)s'
+
+
+def load_command(name: str):
+    """
+    :param name: command name, as in 'download-vessels'
+    :return: command module
+    """
+    return importlib.import_module(COMMANDS[name][0])
+
+
+def setup_logging(level: int, log_filename: Optional[str] = None):
+    logging.basicConfig(level=level, format=_LOG_FORMAT)
+    logging.getLogger('requests').setLevel(logging.WARNING)
+    if log_filename is not None:
+        file_handler = logging.FileHandler(log_filename, mode='w')
+        file_handler.setFormatter(logging.Formatter(_LOG_FORMAT))
+        logging.getLogger().addHandler(file_handler)
+
+
+def run_command(name: str, argv: Optional[List[str]] = None, prog: Optional[str] = None) -> int:
+    """
+    Parses the arguments of a command and runs it.
+
+    :param name: command name
+    :param argv: command line arguments, defaults to sys.argv
+    :param prog: program name displayed in help messages
+    :return: exit status, 1 if the command failed
+    """
+    command = load_command(name)
+    parser = argparse.ArgumentParser(prog=prog, description=command.DESCRIPTION,
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter
+                                     )
+    command.add_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_logging(getattr(command, 'LOG_LEVEL', logging.INFO), getattr(command, 'LOG_FILENAME', None))
+    try:
+        command.main(args)
+
+    except Exception:
+        logging.exception('uncaught error')
+        return 1
+
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog='ships', description='Vessels DB creation and monitoring',
+                                     epilog='commands:\n' + '\n'.join(f'  {name:<26} {summary}' for name, (_, summary)
+                                                                      in COMMANDS.items()),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter
+                                     )
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command', help='see below, "ships <command> -h" '
+                                                                                     'for its arguments')
+    args = parser.parse_args(argv[:1])
+    return run_command(args.command, argv[1:], prog=f'ships {args.command}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""
+Commands of the ships CLI, one module per command exposing:
+    - DESCRIPTION: one line summary
+    - add_arguments(parser): declares the command line arguments
+    - main(args): runs the command with the parsed arguments
+    - LOG_LEVEL, LOG_FILENAME: optional logging settings, INFO on the console only by default
+
+Modules are imported by the CLI when their command runs, so that the other commands do not pay for them.
+"""
@@ -0,0 +1,103 @@
+import argparse
+import logging
+import os
+
+from shipsdb.etl import SELECTIONS, extract, parse_selections
+from shipsdb.lazy import lazy_import
+from shipsdb.store import write_snapshot
+
+numpy = lazy_import('numpy')
+pandas = lazy_import('pandas')
+
+DESCRIPTION = 'Clean up raw exports'
+
+LOG_LEVEL = logging.DEBUG
+
+LOG_FILENAME = 'clean-vessels-data.log'
+
+_UNIT_COLUMNS = {
+    'Current draught': ' m',
+    'Deadweight': ' t',
+    'Draught': ' m',
+    'Gross Tonnage': ' t',
+    'Net Tonnage': ' t',
+}
+
+
+def extract_unique(values, pattern):
+    """
+    Regular expression extraction, only evaluated once per distinct value.
+    """
+    codes, uniques = pandas.factorize(values)
+    extracted = pandas.Series(uniques, dtype=values.dtype).str.extract(pattern)
+    return extracted.take(codes).set_axis(values.index)
+
+
+def last_valid(vessels, key):
+    """
+    Same as vessels.groupby(key).last(), gathering the last non-null value of each column through its row position.
+    """
+    codes, keys = pandas.factorize(vessels[key], sort=True)
+    positions = pandas.Series(numpy.arange(len(vessels)))
+    columns = dict()
+    for column in vessels.columns.drop(key):
+        values = vessels[column]
+        valid = values.notna().to_numpy()
+        last_positions = positions[valid].groupby(codes[valid]).max().reindex(range(len(keys)), fill_value=-1)
+        columns[column] = pandas.api.extensions.take(values.array, last_positions.to_numpy(), allow_fill=True)
+
+    return pandas.DataFrame(columns, index=pandas.Index(keys, name=key))
+
+
+def clean_details_frame(details):
+    """
+    Cleans raw details, one column at a time.
+
+    :param details: raw details as strings, as read from ship-db-details.csv
+    :return: typed vessels indexed by IMO, without duplicates nor outliers
+    """
+    vessels = details[(details['IMO'] != '') & (details['ship_country_owner'] == details['Flag'])].copy()
+    vessels['Built'] = vessels['Built'].mask(vessels['Built'].isna() | (vessels['Built'] == ''), numpy.nan)
+    for column, unit in _UNIT_COLUMNS.items():
+        values = vessels[column]
+        vessels[column] = values.str[:-2].where(values.str.endswith(unit), numpy.nan)
+
+    course_speed = extract_unique(vessels['Course/Speed'], r'^([0-9]+)\W+([0-9\.]+)')
+    length_width = extract_unique(vessels['Size'], r'^([0-9]+)\sx\s([0-9]+)')
+    vessels = vessels.drop(columns=['GT', 'Size', 'Course/Speed', 'Crude (bbl)'])
+    vessels['Course'], vessels['Speed'] = course_speed[0], course_speed[1]
+    vessels['Length'], vessels['Width'] = length_width[0], length_width[1]
+
+    vessels = last_valid(vessels, 'IMO')
+    numeric_columns = ['Course', 'Current draught', 'Draught', 'Width', 'Length', 'Deadweight',
+                       'Gross Tonnage', 'Net Tonnage', 'Speed']
+    vessels[numeric_columns] = vessels[numeric_columns].apply(pandas.to_numeric)
+    vessels = vessels[vessels['Width'] < vessels['Width'].mean() + 6. * vessels['Width'].std()]
+    vessels = vessels[vessels['Length'] < vessels['Length'].mean() + 6. * vessels['Width'].std()]
+    return vessels
+
+
+def clean_details(input_filename='output/ship-db-details.csv', store_dir='output/store'):
+    details = pandas.read_csv(input_filename, dtype=str, keep_default_na=False, engine='pyarrow')
+    vessels = clean_details_frame(details)
+    write_snapshot(store_dir, 'cleaned', vessels.reset_index(), 'oil')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--input-dir', type=str, help='location of input directory', default='.')
+    parser.add_argument('--input-file', type=str, help='name of the input CSV file', default='ship-db.csv')
+    parser.add_argument('--store-dir', type=str, help='location of the columnar store, caching extracted vessels',
+                        default='output/store')
+    parser.add_argument('--chunk-size', type=int, help='rows of the input file parsed at once', default=100000)
+    parser.add_argument('--selection', type=str, action='append', default=[],
+                        help='overrides the oil or lng selection, as in lng="GT > 80000 & `Ship type`.str.contains(\'LNG\')"')
+
+
+def main(args):
+    input_filename = os.sep.join((args.input_dir, args.input_file))
+    selections = dict(SELECTIONS['clean'], **parse_selections(args.selection))
+    outputs = extract(input_filename, selections, chunk_size=args.chunk_size,
+                      cache_dir=os.path.sep.join([args.store_dir, 'etl']))
+    for name, vessels in outputs.items():
+        print(name)
+        print(vessels.describe())
@@ -0,0 +1,102 @@
+import argparse
+import csv
+import json
+import logging
+import os
+from typing import Dict, Tuple
+
+from shipsdb.cargo import CargoEvent, CargoEventDetector
+from shipsdb.positions import PositionStore
+from shipsdb.store import read_snapshot
+
+DESCRIPTION = 'Detecting tankers loading and discharging from draught changes'
+
+LOG_LEVEL = logging.DEBUG
+
+LOG_FILENAME = 'detect-cargo-events.log'
+
+
+def load_particulars(store_dir: str) -> Dict[int, Tuple[float, float]]:
+    """
+    :return: (Deadweight, summer draught) by IMO from the latest cleaned snapshot
+    """
+    try:
+        vessels = read_snapshot(store_dir, 'cleaned', columns=['IMO', 'Deadweight', 'Draught'])
+
+    except FileNotFoundError:
+        logging.warning('no cleaned vessels in "%s", cargo volumes will not be estimated', store_dir)
+        return dict()
+
+    vessels = vessels[vessels['IMO'].str.isdigit()]
+    return {int(imo): (deadweight, draught) for imo, deadweight, draught
+            in zip(vessels['IMO'], vessels['Deadweight'], vessels['Draught'])}
+
+
+def load_state(state_filename: str, detector: CargoEventDetector) -> int:
+    """
+    :return: poll time of the latest position already processed
+    """
+    if not os.path.exists(state_filename):
+        return 0
+
+    with open(state_filename, 'r', encoding='utf-8') as state_file:
+        state = json.load(state_file)
+
+    detector.restore(state['vessels'])
+    return state['received']
+
+
+def save_state(state_filename: str, detector: CargoEventDetector, received: int):
+    with open(state_filename + '.tmp', 'w', encoding='utf-8') as state_file:
+        json.dump({'received': received, 'vessels': detector.state()}, state_file)
+
+    os.replace(state_filename + '.tmp', state_filename)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--positions-dir', type=str, help='location of the positions store',
+                        default='output/positions')
+    parser.add_argument('--store-dir', type=str, help='location of the columnar vessels store', default='output/store')
+    parser.add_argument('--output-dir', type=str, help='location of output directory', default='output')
+    parser.add_argument('--min-change', type=float, help='smallest draught change in meters', default=1.)
+    # the tracker only stores positions that changed, a moored vessel's new draught being stored once until it moves:
+    # waiting for more than one stored report would delay loadings at berth or at anchor until departure
+    parser.add_argument('--confirmations', type=int,
+                        help='consecutive stored reports confirming a new draught, 2 or more filters out single '
+                             'misreported draughts when every poll is stored', default=1)
+    parser.add_argument('--density', type=float, help='cargo density in t/m3', default=0.85)
+    parser.add_argument('--table13', type=float, help='API Table 13 factor in tonnes per barrel, overrides density')
+    parser.add_argument('--lookback', type=float, help='age in hours of the oldest report expected in a poll',
+                        default=24.)
+
+
+def main(args):
+    if not os.path.exists(args.output_dir):
+        logging.info('creating output directory "%s"', os.path.abspath(args.output_dir))
+        os.makedirs(args.output_dir)
+
+    detector = CargoEventDetector(load_particulars(args.store_dir), min_change=args.min_change,
+                                  confirmations=args.confirmations, density=args.density, table13=args.table13)
+    state_filename = os.path.sep.join([args.output_dir, 'cargo-events.state.json'])
+    last_received = load_state(state_filename, detector)
+    start = last_received - int(args.lookback * 3600) if last_received else None
+    positions = PositionStore(args.positions_dir).query(start=start)
+    positions = positions[(positions['received'] > last_received) & (positions['imo'] > 0)]
+    positions = positions.sort_values(['timestamp', 'received'], kind='stable')
+    logging.info('processing %d new positions of %d vessels', len(positions), positions['imo'].nunique())
+    events = detector.update_many(zip(positions['imo'].tolist(), positions['timestamp'].tolist(),
+                                      positions['draught'].astype(float).round(2).tolist(), positions['zone'].tolist(),
+                                      positions['speed'].tolist()))
+
+    events_filename = os.path.sep.join([args.output_dir, 'cargo-events.csv'])
+    is_new = not os.path.exists(events_filename)
+    with open(events_filename, 'a', encoding='utf-8', newline='') as events_file:
+        csv_writer = csv.writer(events_file)
+        if is_new:
+            csv_writer.writerow(CargoEvent._fields)
+
+        csv_writer.writerows(events)
+
+    logging.info('%d events appended to "%s"', len(events), events_filename)
+    if len(positions) > 0:
+        save_state(state_filename, detector, int(positions['received'].max()))
@@ -0,0 +1,74 @@
+import argparse
+import json
+import logging
+import os
+
+from shipsdb.geofence import EVENT_COLUMNS, Geofence, ZoneEventDetector, TRACKING_ZONES, load_zones
+from shipsdb.positions import PositionStore
+
+DESCRIPTION = 'Detecting vessels entering and leaving zones'
+
+LOG_LEVEL = logging.DEBUG
+
+LOG_FILENAME = 'detect-zone-events.log'
+
+
+def load_state(state_filename: str, detector: ZoneEventDetector) -> int:
+    """
+    :return: poll time of the latest position already processed
+    """
+    if not os.path.exists(state_filename):
+        return 0
+
+    with open(state_filename, 'r', encoding='utf-8') as state_file:
+        state = json.load(state_file)
+
+    detector.restore(state['vessels'])
+    return state['received']
+
+
+def save_state(state_filename: str, detector: ZoneEventDetector, received: int):
+    with open(state_filename + '.tmp', 'w', encoding='utf-8') as state_file:
+        json.dump({'received': received, 'vessels': detector.state()}, state_file)
+
+    os.replace(state_filename + '.tmp', state_filename)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--positions-dir', type=str, help='location of the positions store',
+                        default='output/positions')
+    parser.add_argument('--zones-file', type=str,
+                        help='JSON or GeoJSON zones definitions, first zone containing a position winning, '
+                             'defaults to the tracking zones')
+    parser.add_argument('--output-dir', type=str, help='location of output directory', default='output')
+    parser.add_argument('--lookback', type=float, help='age in hours of the oldest report expected in a poll',
+                        default=24.)
+
+
+def main(args):
+    if not os.path.exists(args.output_dir):
+        logging.info('creating output directory "%s"', os.path.abspath(args.output_dir))
+        os.makedirs(args.output_dir)
+
+    if args.zones_file is not None:
+        zones = load_zones(args.zones_file)
+
+    else:
+        zones = [zone for zone_name, zone in TRACKING_ZONES.items() if zone_name != 'Test']
+
+    detector = ZoneEventDetector(Geofence(zones))
+    state_filename = os.path.sep.join([args.output_dir, 'zone-events.state.json'])
+    last_received = load_state(state_filename, detector)
+    start = last_received - int(args.lookback * 3600) if last_received else None
+    # departure records tell about vessels leaving the polled zones, whose later positions are not stored
+    positions = PositionStore(args.positions_dir).query(start=start, departures=True)
+    positions = positions[positions['received'] > last_received]
+    logging.info('processing %d new positions against %d zones', len(positions), len(zones))
+    events = detector.update(positions)
+
+    events_filename = os.path.sep.join([args.output_dir, 'zone-events.csv'])
+    is_new = not os.path.exists(events_filename)
+    events[EVENT_COLUMNS].to_csv(events_filename, mode='a', header=is_new, index=False)
+    logging.info('%d events appended to "%s"', len(events), events_filename)
+    if len(positions) > 0:
+        save_state(state_filename, detector, int(positions['received'].max()))
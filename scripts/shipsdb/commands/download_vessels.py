@@ -0,0 +1,330 @@
+import argparse
+import csv
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from string import Template
+from typing import Dict, Optional, Tuple
+
+from shipsdb import metrics
+from shipsdb.lazy import lazy_import
+from shipsdb.parsing import get_parser, available_parsers, DEFAULT_PARSER
+from shipsdb.store import write_csv_snapshot
+from shipsdb.history import VesselHistory
+from shipsdb.fetch import configure, set_cache_path, open_url, invalidate_key, report_soft_block
+from shipsdb.throttle import AdaptiveThrottle
+from shipsdb.workqueue import WorkQueue
+
+bs4 = lazy_import('bs4')
+
+DESCRIPTION = 'Importing vessels from online DB'
+
+LOG_LEVEL = logging.DEBUG
+
+LOG_FILENAME = 'output/download-vessels.log'
+
+_VESSEL_TYPES = {
+    'All Cargos': '4',
+    'All Tankers': '6',
+    'Crude Oil Tankers': 601
+}
+
+_URL_BASE = 'https://www.vesselfinder.com'
+_URL_SEARCH_TEMPLATE = Template(_URL_BASE + '/vessels?type=$vessel_type&page=$page_count')
+_URL_INDEX = f'{_URL_BASE}/vessels'
+
+_SHARD_KIND = 'vessels'
+
+_CSV_FIELDS = sorted(['country', 'name', 'type', 'imo', 'year-built', 'gross-tons', 'dead-weight-tons',
+                      'length_meters', 'width_meters'])
+
+
+def load_index():
+    html_text = open_url(_URL_INDEX)
+    html = bs4.BeautifulSoup(html_text, 'html.parser')
+    vessel_types = {int(option['value']): option.text for option in sorted(html.find(id='advsearch-ship-type').find_all('option'), key=lambda item:int(item['value']))}
+    for vessel_type_code, vessel_type_name in vessel_types.items():
+        print(f'- {vessel_type_code} : {vessel_type_name}')
+
+
+def load_page(vessel_type_code: int, page_current: int, parser: Optional[str] = None):
+    """
+    Loads a single page of search results.
+
+    :param vessel_type_code:
+    :param page_current: index of the page, starting at 1
+    :param parser: name of the parsing backend, defaults to the fastest one available
+    :return: list of vessels found in the page, index of the last page as reported by the site
+    """
+    if page_current <= 0:
+        raise IndexError(f'invalid page index {page_current}')
+
+    url = _URL_SEARCH_TEMPLATE.substitute({'vessel_type': vessel_type_code, 'page_count': page_current})
+    html_text = open_url(url)
+    try:
+        with metrics.stage('parse'):
+            page_content, page_last = get_parser(parser).parse_results(html_text)
+
+        logging.info('processed page %s (last: %s)', page_current, page_last)
+
+    except Exception:
+        metrics.increment('parse_failures')
+        logging.exception('failed to load page %s', page_current)
+        invalidate_key(url)
+        report_soft_block(url)
+        raise
+
+    return page_content, page_last
+
+
+def read_checkpoint(checkpoint_filename: str) -> Optional[Tuple[int, Optional[int], Optional[int]]]:
+    """
+    :param checkpoint_filename:
+    :return: last completed page, last page available and size in bytes of the output file once that page was
+    written (None for checkpoints recorded without it), None if no checkpoint was recorded
+    """
+    if not os.path.exists(checkpoint_filename):
+        return None
+
+    with open(checkpoint_filename, 'r', encoding='utf-8') as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+
+    return checkpoint['page'], checkpoint['page_last'], checkpoint.get('offset')
+
+
+def write_checkpoint(checkpoint_filename: str, page: int, page_last: Optional[int], offset: int):
+    checkpoint_filename_tmp = checkpoint_filename + '.tmp'
+    with open(checkpoint_filename_tmp, 'w', encoding='utf-8') as checkpoint_file:
+        json.dump({'page': page, 'page_last': page_last, 'offset': offset}, checkpoint_file)
+
+    os.replace(checkpoint_filename_tmp, checkpoint_filename)
+
+
+def load_pages(vessel_type_code: int, output_dir: str, page_max: Optional[int] = None, page_start: int = 1,
+               concurrency: int = 1, resume: bool = False,
+               parser: Optional[str] = None):
+    """
+    Loads all result pages for the specified vessel type.
+
+    The first page tells how many pages are available, the remaining ones are then fetched
+    by a pool of workers sharing the rate limit of the fetch layer. Rows are appended to the output
+    file in page order as soon as a page is available and the last completed page is recorded
+    in a checkpoint file, removed once the crawl is complete, along with the size of the output file at
+    that point: rows written after the checkpoint are truncated on resume, so that they are not duplicated.
+
+    :param vessel_type_code:
+    :param output_dir:
+    :param page_max: last page to be loaded, defaults to the last page available
+    :param page_start: first page to be loaded
+    :param concurrency: number of pages fetched in parallel
+    :param resume: restarts from the page following the last checkpoint, if any
+    :param parser: name of the parsing backend
+    :return:
+    """
+    output_filename = os.path.sep.join([output_dir, f'ship-db-{vessel_type_code}.csv'])
+    checkpoint_filename = os.path.sep.join([output_dir, f'ship-db-{vessel_type_code}.checkpoint'])
+    checkpoint = read_checkpoint(checkpoint_filename) if resume else None
+    if checkpoint is not None and os.path.exists(output_filename) \
+            and checkpoint[2] is not None and os.path.getsize(output_filename) >= checkpoint[2]:
+        page_done, page_last, offset = checkpoint
+        logging.info('resuming vessel type %s after page %s (last: %s)', vessel_type_code, page_done, page_last)
+        # drops rows of pages written after the checkpoint, possibly partially
+        with open(output_filename, 'r+b') as ship_db:
+            ship_db.truncate(offset)
+
+        page_start = page_done + 1
+        mode = 'a'
+
+    else:
+        if checkpoint is not None:
+            logging.warning('checkpoint of vessel type %s does not match the output file, restarting',
+                            vessel_type_code)
+
+        page_last = None
+        mode = 'w'
+
+    with open(output_filename, mode, encoding='utf-8', newline='') as ship_db:
+        csv_writer = csv.DictWriter(ship_db, _CSV_FIELDS)
+        if mode == 'w':
+            csv_writer.writeheader()
+
+        def write_page(page, page_results):
+            with metrics.stage('write'):
+                csv_writer.writerows(page_results)
+                ship_db.flush()
+                write_checkpoint(checkpoint_filename, page, page_last, os.fstat(ship_db.fileno()).st_size)
+
+            metrics.increment('rows_written', len(page_results))
+
+        if page_last is None or page_start <= page_last:
+            page_results, page_last = load_page(vessel_type_code, page_start, parser=parser)
+            write_page(page_start, page_results)
+
+        page_end = page_start
+        if page_last is not None:
+            page_end = page_last if page_max is None else min(page_last, page_max)
+
+        logging.info('loading pages %s to %s using %d workers', page_start, page_end, concurrency)
+        workers_count = max(concurrency, 1)
+        with ThreadPoolExecutor(max_workers=workers_count) as executor:
+            # bounded window of pending pages, so that memory does not grow with the amount of pages
+            pending = deque()
+            for page in range(page_start + 1, page_end + 1):
+                future = executor.submit(load_page, vessel_type_code, page, parser=parser)
+                pending.append((page, future))
+                if len(pending) >= 2 * workers_count:
+                    page_done, future = pending.popleft()
+                    write_page(page_done, future.result()[0])
+
+            while pending:
+                page_done, future = pending.popleft()
+                write_page(page_done, future.result()[0])
+
+    os.remove(checkpoint_filename)
+
+
+def load_shard(shard: Dict, concurrency: int = 1, parser: Optional[str] = None) -> bytes:
+    """
+    Loads the range of pages of a shard.
+
+    :param shard: payload of the shard, as submitted by load_pages_distributed()
+    :param concurrency: number of pages fetched in parallel
+    :param parser: name of the parsing backend
+    :return: rows as JSON lines, in page order
+    """
+    page_first, page_last = shard['pages']
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        pages = executor.map(lambda page: load_page(shard['vessel_type'], page, parser=parser)[0],
+                             range(page_first, page_last + 1))
+        rows = (row for page_results in pages for row in page_results)
+        return ''.join(json.dumps(row, default=str) + '\n' for row in rows).encode('utf-8')
+
+
+def load_pages_distributed(vessel_type_code: int, output_dir: str, queue: WorkQueue, shard_size: int,
+                           concurrency: int = 1, resume: bool = False, parser: Optional[str] = None):
+    """
+    Distributed version of load_pages(): the pages are split into shards of the work queue, processed by this
+    process along with the workers, the output file being written from the shards in page order once all
+    of them are complete.
+
+    :param vessel_type_code:
+    :param output_dir:
+    :param queue: work queue shared with the workers
+    :param shard_size: number of pages per shard
+    :param concurrency: number of pages fetched in parallel
+    :param resume: keeps the shards completed by a previous run
+    :param parser: name of the parsing backend
+    :return:
+    """
+    page_last = load_page(vessel_type_code, 1, parser=parser)[1] or 1
+    job = f'vessels-{vessel_type_code}'
+    shards = [{'vessel_type': vessel_type_code, 'pages': [page, min(page + shard_size - 1, page_last)]}
+              for page in range(1, page_last + 1, shard_size)]
+    remaining = queue.submit(job, _SHARD_KIND, shards, resume=resume)
+    logging.info('job %s: %d shards of %d pages, %d to be processed', job, len(shards), shard_size, remaining)
+    queue.work(_SHARD_KIND, lambda shard: load_shard(shard, concurrency, parser), job=job)
+
+    output_filename = os.path.sep.join([output_dir, f'ship-db-{vessel_type_code}.csv'])
+    with open(output_filename, 'w', encoding='utf-8', newline='') as ship_db:
+        csv_writer = csv.DictWriter(ship_db, _CSV_FIELDS)
+        csv_writer.writeheader()
+        for output in queue.outputs(job):
+            with metrics.stage('write'):
+                rows = [json.loads(line) for line in output.decode('utf-8').splitlines()]
+                csv_writer.writerows(rows)
+
+            metrics.increment('rows_written', len(rows))
+
+
+def download(args):
+    if args.list_vessel_types:
+        load_index()
+
+    elif args.worker:
+        if args.queue is None:
+            raise ValueError('worker mode requires a work queue')
+
+        queue = WorkQueue(args.queue, lease=args.lease)
+        completed = queue.work(_SHARD_KIND, lambda shard: load_shard(shard, args.concurrency, args.parser),
+                               wait=args.wait)
+        logging.info('completed %d shards', completed)
+
+    else:
+        if not os.path.exists(args.output_dir):
+            logging.info(f'creating output directory "{os.path.abspath(args.output_dir)}"')
+            os.makedirs(args.output_dir)
+
+        if len(args.vessel_type_codes) == 0:
+            logging.warning('no vessel type code specified')
+
+        for code in set(args.vessel_type_codes):
+            with metrics.profiled(f'download-vessels-{code}', args.profile, args.output_dir):
+                if args.queue is None:
+                    load_pages(code, args.output_dir, page_max=None, page_start=1,
+                               concurrency=args.concurrency, resume=args.resume,
+                               parser=args.parser)
+
+                else:
+                    load_pages_distributed(code, args.output_dir, WorkQueue(args.queue, lease=args.lease),
+                                           args.shard_size, concurrency=args.concurrency, resume=args.resume,
+                                           parser=args.parser)
+
+            store_dir = args.store_dir or os.path.sep.join([args.output_dir, 'store'])
+            csv_filename = os.path.sep.join([args.output_dir, f'ship-db-{code}.csv'])
+            VesselHistory(store_dir, code).record_csv(csv_filename)
+            if args.full_snapshot:
+                snapshot_filename = write_csv_snapshot(store_dir, 'vessels', csv_filename, code)
+                logging.info('stored snapshot "%s"', snapshot_filename)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--list-vessel-types', action='store_true', help='only displays available vessel types')
+    parser.add_argument('--output-dir', type=str, help='location of output directory', default='.')
+    parser.add_argument('--output_file', type=str, help='name of the output CSV file', default='vessels-<type code>.csv')
+    parser.add_argument('--concurrency', type=int, help='number of pages fetched in parallel', default=1)
+    parser.add_argument('--rate-limit', type=float, help='requests per second sent to the site, initial rate unless fixed',
+                        default=1.)
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help='keeps the rate limit fixed instead of adapting it to the site responses')
+    parser.add_argument('--max-rate', type=float, help='highest rate in requests per second the adaptive rate can reach',
+                        default=10.)
+    parser.add_argument('--throttle-state', type=str,
+                        help='adaptive rate state file shared by the scripts, defaults to <output dir>/throttle-state.json')
+    parser.add_argument('--store-dir', type=str, help='location of the columnar store, defaults to <output dir>/store')
+    parser.add_argument('--full-snapshot', action='store_true',
+                        help='also stores a full copy of the crawl in the store, besides the vessels history')
+    parser.add_argument('--resume', action='store_true', help='restarts an interrupted crawl from its last checkpoint')
+    parser.add_argument('--parser', type=str, help='HTML parsing backend', choices=available_parsers(),
+                        default=DEFAULT_PARSER)
+    parser.add_argument('--metrics-file', type=str, help='location of the Prometheus metrics text file')
+    parser.add_argument('--metrics-interval', type=float, help='seconds between two metrics summaries', default=60.)
+    parser.add_argument('--profile', type=str, choices=metrics.PROFILERS,
+                        help='profiles the crawl loop, reports being saved in the output directory')
+    parser.add_argument('--queue', type=str,
+                        help='location of the work queue shared with workers (SQLite file), enables the distributed mode')
+    parser.add_argument('--worker', action='store_true',
+                        help='only processes shards of the work queue, the output files being written by the coordinator')
+    parser.add_argument('--shard-size', type=int, help='pages per shard in distributed mode', default=20)
+    parser.add_argument('--wait', type=float, help='seconds a worker waits for new shards before exiting', default=60.)
+    parser.add_argument('--lease', type=float, help='seconds a shard stays with a worker without news from it',
+                        default=300.)
+    parser.add_argument('vessel_type_codes', type=int, nargs='*', help='codes of the vessel type')
+
+
+def main(args):
+    set_cache_path(os.path.sep.join([args.output_dir, 'urlcaching.sqlite']))
+    throttle = None
+    if not args.fixed_rate:
+        throttle = AdaptiveThrottle(args.throttle_state or os.path.sep.join([args.output_dir, 'throttle-state.json']),
+                                    initial_rate=args.rate_limit, max_rate=args.max_rate)
+
+    configure(rate_limit=args.rate_limit, connections_per_host=args.concurrency, throttle=throttle)
+
+    metrics.start_reporting(args.metrics_interval, args.metrics_file)
+    try:
+        download(args)
+
+    finally:
+        metrics.stop_reporting()
@@ -0,0 +1,417 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import csv
+import json
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+from shipsdb import metrics
+from shipsdb.etl import SELECTIONS, extract, parse_selections
+from shipsdb.fetch import configure, set_cache_path, open_url, invalidate_key, report_soft_block
+from shipsdb.lazy import lazy_import
+from shipsdb.parsing import get_parser, available_parsers, DEFAULT_PARSER
+from shipsdb.store import write_snapshot, write_csv_snapshot
+from shipsdb.throttle import AdaptiveThrottle
+from shipsdb.workqueue import WorkQueue
+
+pandas = lazy_import('pandas')
+
+DESCRIPTION = 'Importing vessels details from online DB'
+
+LOG_FILENAME = 'download-vessels-details.log'
+
+_URL_BASE = 'https://www.vesselfinder.com'
+
+_FETCHED_TS_FIELD = 'details_fetched_ts'
+
+_REPORT_TS_FORMAT = '%b %d, %Y %H:%M UTC'
+
+_SHARD_KIND = 'details'
+
+
+def extract_details(html_text: str, parser: Optional[str] = None) -> Optional[Dict]:
+    """
+    Parses a details page: CPU bound, runs in the parsing processes when there are any.
+
+    :return: details, None if the page format is invalid
+    """
+    params = get_parser(parser).parse_details(html_text)
+    if params is None:
+        return None
+
+    net_tonnage = params['Net Tonnage']
+    if net_tonnage and net_tonnage.endswith(' t'):
+        net_tonnage = net_tonnage[:-2]
+
+    params['NT'] = net_tonnage
+
+    deadweight = params['Deadweight']
+    if deadweight and deadweight.endswith(' t'):
+        deadweight = deadweight[:-2]
+
+    params['DW'] = deadweight
+
+    del params['Deadweight']
+    del params['Net Tonnage']
+    del params['Gross Tonnage']
+    del params['Crude (bbl)']
+    del params['Size']
+    return dict(params)
+
+
+def load_details(url, load_id, parser=None, parse_pool: Optional[Executor] = None):
+    logging.info('processing url: %s', url)
+    html_text = open_url(url)
+    # timed from the fetching thread, so that round-trips to the parsing processes are included
+    with metrics.stage('parse'):
+        if parse_pool is None:
+            details = extract_details(html_text, parser)
+
+        else:
+            details = parse_pool.submit(extract_details, html_text, parser).result()
+
+    if details is None:
+        metrics.increment('parse_failures')
+        logging.warning('invalid format for page: "%s"', url)
+        invalidate_key(url)
+        report_soft_block(url)
+        return load_id, dict()
+
+    return load_id, details
+
+
+def merge_details(vessel: Dict, details: Dict, fetched_ts: str):
+    """
+    Updates the vessel row with freshly fetched details.
+    """
+    for param_name in details:
+        value = details[param_name]
+        if param_name in ('Draught', 'Current draught'):
+            if value and value.endswith(' m'):
+                value = value[:-2]
+
+            else:
+                value = None
+
+        vessel[param_name] = value
+
+    if 'last_report_ts' in details:
+        vessel[_FETCHED_TS_FIELD] = fetched_ts
+
+
+def load_previous_details(details_filename: str) -> Dict[str, Dict]:
+    """
+    :param details_filename: output of a previous run
+    :return: rows indexed by IMO
+    """
+    if not os.path.exists(details_filename):
+        return dict()
+
+    with open(details_filename, 'r', encoding='utf-8') as csv_file:
+        return {row['IMO']: row for row in csv.DictReader(csv_file) if row['IMO'] != ''}
+
+
+def parse_report_ts(last_report_ts: Optional[str]) -> Optional[datetime]:
+    """
+    :param last_report_ts: time of the last AIS report as displayed in details pages, e.g. "Sep 10, 2016 08:31 UTC"
+    :return: naive UTC time, None if missing or invalid
+    """
+    try:
+        return datetime.strptime(last_report_ts, _REPORT_TS_FORMAT)
+
+    except (TypeError, ValueError):
+        return None
+
+
+def is_fresh(previous_row: Dict, max_age: timedelta, now: datetime) -> bool:
+    """
+    Vessels details are fresh when they were fetched within the freshness window and their last AIS report
+    is within that window as well: pages without a report or with an outdated one are fetched again on
+    the next run.
+
+    :param now: naive UTC time
+    """
+    fetched_ts = previous_row.get(_FETCHED_TS_FIELD)
+    last_report = parse_report_ts(previous_row.get('last_report_ts'))
+    if not fetched_ts or last_report is None:
+        return False
+
+    return now - datetime.fromisoformat(fetched_ts) < max_age and now - last_report < max_age
+
+
+def select_vessels(vessels_oil: pandas.DataFrame, previous_details: Dict[str, Dict], max_age: timedelta,
+                   now: datetime, head: Optional[int] = None) -> Iterator[Tuple[Dict, Optional[str]]]:
+    """
+    :return: generator of (vessel row, details url), the url being None for vessels whose details are fresh
+    """
+    for count, vessel_row_data in enumerate(vessels_oil.iterrows()):
+        vessel = vessel_row_data[1].to_dict()
+        previous_row = previous_details.get(vessel['IMO'])
+        if previous_row is not None:
+            # static input columns are refreshed, details are kept until fetched again
+            vessel = dict(previous_row, **vessel)
+
+        url = None
+        ship_details_url_path = vessel['ship_details_url_path']
+        if previous_row is None or not is_fresh(previous_row, max_age, now):
+            if ship_details_url_path.startswith('/vessels'):
+                url = _URL_BASE + ship_details_url_path
+                if previous_row is not None:
+                    invalidate_key(url)
+
+        yield vessel, url
+        if head is not None and count >= head:
+            break
+
+
+def _process_context() -> multiprocessing.context.BaseContext:
+    """
+    Parsing processes are started while the fetch, event loop and metrics threads are running: forking then could
+    copy a lock held by one of them into the child, so that they are started from a clean server process instead.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+
+    return multiprocessing.get_context('spawn')
+
+
+def load_all_details(vessels: Iterator[Tuple[Dict, Optional[str]]], rows_filename: str, fetched_ts: str,
+                     pool_size: int = 1, parse_workers: int = 0, parser: Optional[str] = None) -> set:
+    """
+    Fetches details with a pool of threads and parses them with a pool of processes, rows being written in input
+    order to a JSON lines file as soon as they are complete. At most a few rows per worker are in flight, so that
+    memory does not depend on the size of the fleet.
+
+    :param vessels: (vessel row, details url) pairs, as produced by select_vessels()
+    :param rows_filename: intermediate file receiving one JSON row per vessel
+    :param fetched_ts: fetch time recorded in rows whose details were loaded
+    :param pool_size: number of pages fetched in parallel
+    :param parse_workers: number of parsing processes, pages being parsed by the fetching threads if 0
+    :param parser: name of the parsing backend
+    :return: names of all fields found in rows
+    """
+    fields = set()
+    fetch_count, count = 0, 0
+    window = 4 * max(pool_size, parse_workers, 1)
+    parse_pool = ProcessPoolExecutor(parse_workers, mp_context=_process_context()) if parse_workers > 0 \
+        else contextlib.nullcontext()
+    with open(rows_filename, 'w', encoding='utf-8') as rows_file, \
+            ThreadPoolExecutor(max_workers=max(pool_size, 1)) as fetch_pool, parse_pool:
+        pending = deque()
+
+        def write_next():
+            vessel, future = pending.popleft()
+            if future is not None:
+                _, details = future.result()
+                merge_details(vessel, details, fetched_ts)
+
+            with metrics.stage('write'):
+                fields.update(vessel)
+                rows_file.write(json.dumps(vessel, default=str) + '\n')
+
+        for vessel, url in vessels:
+            future = None
+            if url is not None:
+                future = fetch_pool.submit(load_details, url, count, parser=parser,
+                                           parse_pool=parse_pool if parse_workers > 0 else None)
+                fetch_count += 1
+
+            pending.append((vessel, future))
+            count += 1
+            # backpressure: waits for the oldest row once the window is full
+            while pending and (len(pending) >= window or pending[0][1] is None or pending[0][1].done()):
+                write_next()
+
+        while pending:
+            write_next()
+
+    logging.info('fetched details for %d vessels out of %d', fetch_count, count)
+    return fields
+
+
+def write_details(rows_filename: str, details_filename: str, fields: set):
+    with open(rows_filename, 'r', encoding='utf-8') as rows_file, \
+            open(details_filename, 'w', encoding='utf-8') as ship_db:
+        csv_writer = csv.DictWriter(ship_db, sorted(fields))
+        csv_writer.writeheader()
+        with metrics.stage('write-csv'):
+            for line in rows_file:
+                csv_writer.writerow(json.loads(line))
+                metrics.increment('rows_written')
+
+
+def load_shard(shard: Dict, rows_filename: str, pool_size: int = 1, parse_workers: int = 0,
+               parser: Optional[str] = None) -> bytes:
+    """
+    Loads the details of the vessels of a shard.
+
+    :param shard: payload of the shard, as submitted by load_all_details_distributed()
+    :param rows_filename: intermediate file receiving the rows of the shard
+    :return: rows as JSON lines, in input order
+    """
+    vessels = list()
+    for vessel, url, refresh in shard['vessels']:
+        if refresh:
+            invalidate_key(url)
+
+        vessels.append((vessel, url))
+
+    load_all_details(iter(vessels), rows_filename, shard['fetched_ts'], pool_size, parse_workers, parser=parser)
+    with open(rows_filename, 'rb') as rows_file:
+        output = rows_file.read()
+
+    os.remove(rows_filename)
+    return output
+
+
+def load_all_details_distributed(vessels: Iterator[Tuple[Dict, Optional[str]]], previous_details: Dict[str, Dict],
+                                 rows_filename: str, fetched_ts: str, queue: WorkQueue, shard_size: int,
+                                 pool_size: int = 1, parse_workers: int = 0, parser: Optional[str] = None,
+                                 resume: bool = False) -> set:
+    """
+    Distributed version of load_all_details(): vessels are split into shards of the work queue, processed by this
+    process along with the workers, the rows file being written from the shards in input order once all of them
+    are complete.
+
+    :param vessels: (vessel row, details url) pairs, as produced by select_vessels()
+    :param previous_details: rows of the previous run, whose pages are fetched again by workers
+    :param queue: work queue shared with the workers
+    :param shard_size: number of vessels per shard
+    :param resume: keeps the shards completed by a previous run
+    :return: names of all fields found in rows
+    """
+    vessels = [(json.loads(json.dumps(vessel, default=str)), url, url is not None and vessel['IMO'] in previous_details)
+               for vessel, url in vessels]
+    shards = [{'fetched_ts': fetched_ts, 'vessels': vessels[start:start + shard_size]}
+              for start in range(0, len(vessels), shard_size)]
+    remaining = queue.submit('details', _SHARD_KIND, shards, resume=resume)
+    logging.info('job details: %d shards of %d vessels, %d to be processed', len(shards), shard_size, remaining)
+    queue.work(_SHARD_KIND, lambda shard: load_shard(shard, rows_filename + '.shard', pool_size, parse_workers,
+                                                     parser), job='details')
+
+    fields = set()
+    with open(rows_filename, 'w', encoding='utf-8') as rows_file:
+        for output in queue.outputs('details'):
+            lines = output.decode('utf-8')
+            for line in lines.splitlines():
+                fields.update(json.loads(line))
+
+            rows_file.write(lines)
+
+    return fields
+
+
+def download_details(args):
+    queue = WorkQueue(args.queue, lease=args.lease) if args.queue is not None else None
+    rows_filename = os.path.sep.join([args.output_dir, 'ship-db-details.rows.tmp'])
+    if args.worker:
+        if queue is None:
+            raise ValueError('worker mode requires a work queue')
+
+        completed = queue.work(_SHARD_KIND, lambda shard: load_shard(shard, rows_filename, args.pool_size,
+                                                                     args.parse_workers, args.parser), wait=args.wait)
+        logging.info('completed %d shards', completed)
+        return
+
+    input_filename = os.sep.join((args.input_dir, args.input_file))
+    store_dir = args.store_dir or os.path.sep.join([args.output_dir, 'store'])
+    selections = dict(SELECTIONS['details'], **parse_selections(args.selection))
+    outputs = extract(input_filename, selections, chunk_size=args.chunk_size,
+                      cache_dir=os.path.sep.join([store_dir, 'etl']))
+    vessels_oil, vessels_lng = outputs['oil'], outputs['lng']
+    write_snapshot(store_dir, 'details', vessels_lng, 'lng')
+
+    details_filename = os.path.sep.join([args.output_dir, 'ship-db-details.csv'])
+    previous_details = load_previous_details(details_filename) if args.incremental else dict()
+    now = datetime.utcnow().replace(microsecond=0)
+    max_age = timedelta(hours=args.max_age)
+
+    vessels = select_vessels(vessels_oil, previous_details, max_age, now, args.head)
+    with metrics.profiled('download-vessels-details', args.profile, args.output_dir):
+        if queue is None:
+            fields = load_all_details(vessels, rows_filename, now.isoformat(), args.pool_size, args.parse_workers,
+                                      parser=args.parser)
+
+        else:
+            fields = load_all_details_distributed(vessels, previous_details, rows_filename, now.isoformat(), queue,
+                                                  args.shard_size, args.pool_size, args.parse_workers,
+                                                  parser=args.parser, resume=args.resume)
+
+    write_details(rows_filename, details_filename, fields)
+    os.remove(rows_filename)
+
+    snapshot_filename = write_csv_snapshot(store_dir, 'details', details_filename, 'oil')
+    logging.info('stored snapshot "%s"', snapshot_filename)
+
+    logging.info('completed tasks')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--input-dir', type=str, help='location of input directory', default='.')
+    parser.add_argument('--input-file', type=str, help='name of the input CSV file', default='ship-db.csv')
+    parser.add_argument('--output-dir', type=str, help='location of output directory', default='.')
+    parser.add_argument('--head', type=int, help='processes only the indicated amount of lines from input file')
+    parser.add_argument('--pool-size', type=int, help='number of pages fetched in parallel', default=1)
+    parser.add_argument('--parse-workers', type=int, help='number of parsing processes, 0 parses in the fetching threads',
+                        default=os.cpu_count() or 1)
+    parser.add_argument('--rate-limit', type=float, help='requests per second sent to the site, initial rate unless fixed',
+                        default=1.)
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help='keeps the rate limit fixed instead of adapting it to the site responses')
+    parser.add_argument('--max-rate', type=float, help='highest rate in requests per second the adaptive rate can reach',
+                        default=10.)
+    parser.add_argument('--throttle-state', type=str,
+                        help='adaptive rate state file shared by the scripts, defaults to <output dir>/throttle-state.json')
+    parser.add_argument('--parser', type=str, help='HTML parsing backend', choices=available_parsers(),
+                        default=DEFAULT_PARSER)
+    parser.add_argument('--store-dir', type=str, help='location of the columnar store, defaults to <output dir>/store')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetches new vessels and those past the freshness window, others are kept from the previous output')
+    parser.add_argument('--max-age', type=float, help='freshness window in hours for incremental mode', default=7 * 24.)
+
+    parser.add_argument('--chunk-size', type=int, help='rows of the input file parsed at once', default=100000)
+    parser.add_argument('--selection', type=str, action='append', default=[],
+                        help='overrides the oil or lng selection, as in oil="GT > 80000 & `Ship type`.str.contains(\'Oil\')"')
+    parser.add_argument('--metrics-file', type=str, help='location of the Prometheus metrics text file')
+    parser.add_argument('--metrics-interval', type=float, help='seconds between two metrics summaries', default=60.)
+    parser.add_argument('--profile', type=str, choices=metrics.PROFILERS,
+                        help='profiles the crawl loop, reports being saved in the output directory')
+
+    parser.add_argument('--queue', type=str,
+                        help='location of the work queue shared with workers (SQLite file), enables the distributed mode')
+    parser.add_argument('--worker', action='store_true',
+                        help='only processes shards of the work queue, the output files being written by the coordinator')
+    parser.add_argument('--shard-size', type=int, help='vessels per shard in distributed mode', default=200)
+    parser.add_argument('--lease', type=float, help='seconds a shard stays with a worker without news from it',
+                        default=300.)
+    parser.add_argument('--wait', type=float, help='seconds a worker waits for new shards before exiting', default=60.)
+    parser.add_argument('--resume', action='store_true', help='keeps the shards completed by an interrupted distributed run')
+
+    parser.add_argument('output_file', type=str, nargs='?', help='name of the output CSV file', default='vessels-details.csv')
+
+
+def main(args):
+    set_cache_path(os.path.sep.join([args.output_dir, 'urlcaching-details.sqlite']))
+    throttle = None
+    if not args.fixed_rate:
+        throttle = AdaptiveThrottle(args.throttle_state or os.path.sep.join([args.output_dir, 'throttle-state.json']),
+                                    initial_rate=args.rate_limit, max_rate=args.max_rate)
+
+    configure(rate_limit=args.rate_limit, connections_per_host=args.pool_size, throttle=throttle)
+    if not os.path.exists(args.output_dir):
+        logging.info('creating output directory "%s"', os.path.abspath(args.output_dir))
+        os.makedirs(args.output_dir)
+
+    metrics.start_reporting(args.metrics_interval, args.metrics_file)
+    try:
+        download_details(args)
+
+    finally:
+        metrics.stop_reporting()
@@ -0,0 +1,51 @@
+import argparse
+import logging
+
+from shipsdb.pagecache import PageCache
+
+DESCRIPTION = 'Managing the pages cache'
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+
+        size /= 1024.
+
+    return f'{size:.1f} TB'
+
+
+def show_stats(cache: PageCache):
+    stats = cache.stats()
+    print(f'{stats["filename"]}: {stats["entries"]} entries, {format_size(stats["size"])} stored '
+          f'({format_size(stats["file_size"])} on disk, limit: {format_size(stats["max_size"])})')
+    for kind, kind_stats in stats['kinds'].items():
+        ratio = kind_stats['raw_size'] / kind_stats['size'] if kind_stats['size'] else 0.
+        print(f'- {kind}: {kind_stats["entries"]} entries ({kind_stats["expired"]} expired), '
+              f'{format_size(kind_stats["size"])} compressed (x{ratio:.1f})')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_stats = subparsers.add_parser('stats', help='displays the cache content by kind of page')
+    parser_stats.add_argument('cache_file', type=str, help='location of the cache file')
+    parser_stats.set_defaults(max_size=None)
+    parser_prune = subparsers.add_parser('prune', help='removes expired and least recently used entries')
+    parser_prune.add_argument('cache_file', type=str, help='location of the cache file')
+    parser_prune.add_argument('--max-size', type=int, help='size limit in MB, defaults to 2048')
+    parser_prune.add_argument('--vacuum', action='store_true', help='reclaims the freed disk space')
+
+
+def main(args):
+    settings = dict() if args.max_size is None else {'max_size': args.max_size * 1024 ** 2}
+    cache = PageCache(args.cache_file, **settings)
+    if args.command == 'stats':
+        show_stats(cache)
+
+    elif args.command == 'prune':
+        expired, evicted = cache.prune(vacuum=args.vacuum)
+        logging.info('removed %d expired entries, evicted %d entries', expired, evicted)
+        show_stats(cache)
+
+    cache.close()
@@ -0,0 +1,72 @@
+import argparse
+import datetime
+import logging
+import os
+
+from shipsdb.history import VesselHistory
+
+DESCRIPTION = 'Managing the history of the vessels lists'
+
+
+def record(args):
+    history = VesselHistory(args.store_dir, args.vessel_type)
+    csv_filename = args.input_file or os.path.sep.join([args.input_dir, f'ship-db-{args.vessel_type}.csv'])
+    history.record_csv(csv_filename, args.date)
+
+
+def crawls(args):
+    for crawl_date in VesselHistory(args.store_dir, args.vessel_type).crawls():
+        print(crawl_date.isoformat())
+
+
+def diff(args):
+    differences = VesselHistory(args.store_dir, args.vessel_type).diff(args.since, args.until)
+    print(differences.summary())
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for name, vessels in differences._asdict().items():
+            filename = os.path.sep.join([args.output_dir, f'ship-db-{args.vessel_type}-{name}.csv'])
+            vessels.to_csv(filename, index=False)
+            logging.info('saved %d rows to "%s"', len(vessels), filename)
+
+    else:
+        for column, changes in differences.changed.groupby('column', sort=True):
+            print(f'\n{column}:')
+            print(changes.drop(columns='column').to_string(index=False, max_rows=args.max_rows))
+
+
+def as_of(args):
+    vessels = VesselHistory(args.store_dir, args.vessel_type).as_of(args.date)
+    vessels.to_csv(args.output_file, index=False)
+    logging.info('saved %d vessels to "%s"', len(vessels), args.output_file)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--store-dir', type=str, help='location of the columnar store', default='output/store')
+    parser.add_argument('--vessel-type', type=int, help='code of the vessel type', default=6)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_record = subparsers.add_parser('record', help='records a crawl exported by download-vessels.py')
+    parser_record.add_argument('--input-dir', type=str, help='location of input directory', default='output')
+    parser_record.add_argument('--input-file', type=str, help='crawl export, defaults to ship-db-<vessel type>.csv '
+                                                             'in the input directory')
+    parser_record.add_argument('--date', type=datetime.date.fromisoformat, help='date of the crawl, defaults to today')
+    parser_record.set_defaults(func=record)
+    parser_crawls = subparsers.add_parser('crawls', help='lists the dates of the recorded crawls')
+    parser_crawls.set_defaults(func=crawls)
+    parser_diff = subparsers.add_parser('diff', help='displays vessels added, removed and changed between two dates')
+    parser_diff.add_argument('--since', type=datetime.date.fromisoformat, required=True,
+                             help='date of the previous fleet (YYYY-MM-DD)')
+    parser_diff.add_argument('--until', type=datetime.date.fromisoformat,
+                             help='date of the current fleet, defaults to the latest crawl')
+    parser_diff.add_argument('--output-dir', type=str, help='saves the added, removed and changed vessels as CSV files')
+    parser_diff.add_argument('--max-rows', type=int, help='changes displayed per column', default=20)
+    parser_diff.set_defaults(func=diff)
+    parser_as_of = subparsers.add_parser('as-of', help='exports the fleet as of a date')
+    parser_as_of.add_argument('--date', type=datetime.date.fromisoformat,
+                              help='date of the fleet, defaults to the latest crawl')
+    parser_as_of.add_argument('--output-file', type=str, help='CSV file the fleet is saved to', default='fleet.csv')
+    parser_as_of.set_defaults(func=as_of)
+
+
+def main(args):
+    args.func(args)
@@ -0,0 +1,51 @@
+import argparse
+import logging
+import os
+
+from shipsdb.lazy import lazy_import
+from shipsdb.positions import PositionStore
+from shipsdb.registry import VesselRegistry
+
+pandas = lazy_import('pandas')
+
+DESCRIPTION = 'Managing the registry of vessels static attributes'
+
+
+def refresh(args):
+    registry = VesselRegistry.refresh(args.registry_dir, os.path.sep.join([args.input_dir, args.input_file]))
+    logging.info('registry "%s" refreshed with %d vessels', args.registry_dir, len(registry))
+    if args.positions_dir is not None:
+        positions = PositionStore(args.positions_dir).query()
+        positions = positions[(positions['imo'] > 0) & (positions['mmsi'] > 0)].sort_values('received', kind='stable')
+        registry = registry.learn_mmsi(positions['imo'].to_numpy(), positions['mmsi'].to_numpy())
+        logging.info('learnt MMSI from %d positions', len(positions))
+
+
+def lookup(args):
+    registry = VesselRegistry(args.registry_dir)
+    vessels = [registry.by_imo(imo) for imo in args.imo] + [registry.by_mmsi(mmsi) for mmsi in args.mmsi]
+    for name in args.name:
+        vessels += registry.by_name(name)
+
+    vessels = [vessel for vessel in vessels if vessel is not None]
+    print(pandas.DataFrame(vessels).to_string(index=False) if vessels else 'no vessel found')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--registry-dir', type=str, help='location of the registry', default='output/registry')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_refresh = subparsers.add_parser('refresh', help='rebuilds the registry from the vessels details')
+    parser_refresh.add_argument('--input-dir', type=str, help='location of input directory', default='output')
+    parser_refresh.add_argument('--input-file', type=str, help='vessels details as saved by download-vessels-details.py',
+                                default='ship-db-details.csv')
+    parser_refresh.add_argument('--positions-dir', type=str, help='position store MMSI are learnt from')
+    parser_refresh.set_defaults(func=refresh)
+    parser_lookup = subparsers.add_parser('lookup', help='displays vessels by IMO, MMSI or name')
+    parser_lookup.add_argument('--imo', type=int, nargs='*', default=[], help='IMO numbers')
+    parser_lookup.add_argument('--mmsi', type=int, nargs='*', default=[], help='MMSI numbers')
+    parser_lookup.add_argument('--name', type=str, nargs='*', default=[], help='vessel names, case being ignored')
+    parser_lookup.set_defaults(func=lookup)
+
+
+def main(args):
+    args.func(args)
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import math
+import os
+import time
+from string import Template
+from typing import Dict, List, Optional, Tuple
+
+from shipsdb import metrics
+from shipsdb.fetch import configure, open_url, fetch_all
+from shipsdb.geofence import Geofence, Zone, TRACKING_ZONES, load_zones
+from shipsdb.ingestion import DeltaIngester
+from shipsdb.positions import PositionStore
+from shipsdb.throttle import AdaptiveThrottle
+
+DESCRIPTION = 'Tracking vessels positions from online map'
+
+LOG_LEVEL = logging.DEBUG
+
+LOG_FILENAME = 'track-ships.log'
+
+_VESSEL_TYPES = {
+    'Cargo ships': '4',
+    'Tanker': '6'
+}
+
+_URL_BASE = 'https://www.marinetraffic.com'
+_URL_MAP_TEMPLATE = Template(_URL_BASE +
+                             '/map/get_data_json/sw_x:$sw_x/sw_y:$sw_y/ne_x:$ne_x/ne_y:$ne_y/zoom:$zoom/station:0')
+
+
+def map_url(south_west_x, south_west_y, north_east_x, north_east_y, zoom):
+    south_west_x, north_east_x = ((north_east_x, south_west_x), (south_west_x, north_east_x))[south_west_x < north_east_x]
+    south_west_y, north_east_y = ((north_east_y, south_west_y), (south_west_y, north_east_y))[south_west_y < north_east_y]
+    return _URL_MAP_TEMPLATE.substitute(
+        {
+            'sw_x': south_west_x,
+            'sw_y': south_west_y,
+            'ne_x': north_east_x,
+            'ne_y': north_east_y,
+            'zoom': zoom,
+        }
+    )
+
+
+def load_map(south_west_x, south_west_y, north_east_x, north_east_y, zoom):
+    url = map_url(south_west_x, south_west_y, north_east_x, north_east_y, zoom)
+    html_text = open_url(url)
+    return html_text
+
+
+def get_tracking_zone(zone_name):
+    """
+    :return: south west x, south west y, north east x, north east y of the tracking zone
+    """
+    return TRACKING_ZONES[zone_name].bounds
+
+
+def tile_span(zoom: int) -> float:
+    """
+    Largest side in degrees of a box loaded in a single request at the specified zoom level.
+    """
+    return 1440. / 2 ** zoom
+
+
+def tile_zone(south_west_x, south_west_y, north_east_x, north_east_y, zoom) -> List[Tuple[float, float, float, float]]:
+    """
+    Splits a bounding box into tiles small enough to be loaded at the specified zoom level.
+
+    :return: list of (south west x, south west y, north east x, north east y)
+    """
+    min_x, max_x = sorted((south_west_x, north_east_x))
+    min_y, max_y = sorted((south_west_y, north_east_y))
+    span = tile_span(zoom)
+    count_x = max(1, math.ceil((max_x - min_x) / span))
+    count_y = max(1, math.ceil((max_y - min_y) / span))
+    step_x, step_y = (max_x - min_x) / count_x, (max_y - min_y) / count_y
+    tiles = list()
+    for index_x in range(count_x):
+        for index_y in range(count_y):
+            tiles.append((round(min_x + index_x * step_x, 5), round(min_y + index_y * step_y, 5),
+                          round(min_x + (index_x + 1) * step_x, 5), round(min_y + (index_y + 1) * step_y, 5)))
+
+    return tiles
+
+
+def _parse_float(value, scale: float = 1.) -> Optional[float]:
+    try:
+        return float(value) / scale
+
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_map_data(json_text: str, received: float) -> List[Dict]:
+    """
+    Extracts positions from a get_data_json payload.
+
+    :param json_text: remote response
+    :param received: reception time in epoch seconds, position timestamps being relative to it
+    :return: position records
+    """
+    payload = json.loads(json_text)
+    rows = payload.get('data', dict()).get('rows') if isinstance(payload, dict) else None
+    if rows is None:
+        metrics.increment('parse_failures')
+        logging.warning('invalid format for map data: "%s"', json_text[:200])
+        return list()
+
+    positions = list()
+    for row in rows:
+        lat, lon = _parse_float(row.get('LAT')), _parse_float(row.get('LON'))
+        if lat is None or lon is None:
+            continue
+
+        elapsed = _parse_float(row.get('ELAPSED')) or 0.
+        heading = _parse_float(row.get('HEADING'))
+        positions.append({
+            'timestamp': int(received - 60. * elapsed),
+            'received': int(received),
+            'ship_id': row.get('SHIP_ID'),
+            'mmsi': row.get('MMSI'),
+            'imo': row.get('IMO'),
+            'name': row.get('SHIPNAME'),
+            'ship_type': row.get('SHIPTYPE'),
+            'lat': lat,
+            'lon': lon,
+            'speed': _parse_float(row.get('SPEED'), 10.),
+            'course': _parse_float(row.get('COURSE')),
+            'heading': None if heading == 511 else heading,
+            'draught': _parse_float(row.get('DRAUGHT'), 10.),
+            'destination': row.get('DESTINATION'),
+        })
+
+    return positions
+
+
+class ZonePoller(object):
+    """
+    Polls a single zone, adapting the polling interval to the amount of vessels under way.
+    """
+
+    def __init__(self, zone_name: str, zoom: int, interval: float, min_interval: float, max_interval: float,
+                 moving_reference: int = 20, moving_speed: float = 0.5, zone: Optional[Zone] = None):
+        """
+
+        :param zone_name: name of the tracking zone
+        :param zoom: zoom level of the map requests
+        :param interval: polling interval in seconds for moving_reference vessels under way
+        :param min_interval: lower bound of the polling interval
+        :param max_interval: upper bound of the polling interval
+        :param moving_reference: amount of vessels under way corresponding to the base interval
+        :param moving_speed: speed in knots above which a vessel is considered under way
+        :param zone: shape of the zone, polled through its bounding box, defaults to the tracking zone of that name
+        """
+        self.zone_name = zone_name
+        self.zone = zone if zone is not None else TRACKING_ZONES[zone_name]
+        self._geofence = Geofence([self.zone], max_cells=4096)
+        self.tiles = tile_zone(*self.zone.bounds, zoom)
+        self.urls = [map_url(*tile, zoom) for tile in self.tiles]
+        self.interval = interval
+        self._base_interval = interval
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._moving_reference = moving_reference
+        self._moving_speed = moving_speed
+
+    def adapt_interval(self, positions: List[Dict]):
+        moving = sum(1 for position in positions if (position['speed'] or 0.) > self._moving_speed)
+        interval = self._base_interval * math.sqrt(self._moving_reference / max(moving, 1))
+        self.interval = min(self._max_interval, max(self._min_interval, interval))
+
+    async def poll(self) -> Tuple[int, List[Dict]]:
+        """
+        Loads all tiles in parallel, vessels seen on several tiles being only kept once, and those outside the
+        zone shape left out.
+
+        :return: poll time in epoch seconds and positions
+        """
+        received = time.time()
+        payloads = await fetch_all(self.urls)
+        positions = dict()
+        with metrics.stage('parse'):
+            for payload in payloads:
+                for position in parse_map_data(payload, received):
+                    positions[position['ship_id'] or (position['lat'], position['lon'])] = position
+
+            positions = list(positions.values())
+            inside = self._geofence.contains(self.zone_name, [position['lon'] for position in positions],
+                                             [position['lat'] for position in positions])
+
+        return int(received), [position for position, kept in zip(positions, inside) if kept]
+
+
+async def track_zone(poller: ZonePoller, ingester: DeltaIngester, position_store: PositionStore,
+                     cycles: Optional[int] = None):
+    count = 0
+    compacted_day = None
+    while cycles is None or count < cycles:
+        start = time.monotonic()
+        try:
+            received, positions = await poller.poll()
+            with metrics.stage('write'):
+                written = ingester.ingest(poller.zone_name, positions, received)
+
+            metrics.increment('rows_written', written)
+            poller.adapt_interval(positions)
+            today = datetime.datetime.now(datetime.timezone.utc).date()
+            if today != compacted_day:
+                compacted = await asyncio.to_thread(position_store.compact, poller.zone_name, today)
+                logging.info('compacted %d partitions for zone %s', compacted, poller.zone_name)
+                compacted_day = today
+
+        except Exception:
+            logging.exception('failed to poll zone %s', poller.zone_name)
+            positions, written = list(), 0
+
+        latency = time.monotonic() - start
+        logging.info('polled zone %s: %d positions from %d tiles in %.2fs, %d changes stored, next poll in %.0fs',
+                     poller.zone_name, len(positions), len(poller.tiles), latency, written, poller.interval)
+        if latency > poller.interval:
+            logging.warning('polling zone %s took longer than its interval (%.2fs > %.0fs)',
+                            poller.zone_name, latency, poller.interval)
+
+        count += 1
+        if cycles is None or count < cycles:
+            await asyncio.sleep(max(0., poller.interval - latency))
+
+
+async def track_zones(pollers: List[ZonePoller], ingester: DeltaIngester, position_store: PositionStore,
+                      cycles: Optional[int] = None):
+    await asyncio.gather(*[track_zone(poller, ingester, position_store, cycles) for poller in pollers])
+    logging.info('stored %d changes out of %d positions', ingester.stored_count, ingester.received_count)
+
+
+def track(args):
+    if not os.path.exists(args.output_dir):
+        logging.info('creating output directory "%s"', os.path.abspath(args.output_dir))
+        os.makedirs(args.output_dir)
+
+    tracking_zones = dict(TRACKING_ZONES)
+    if args.zones_file is not None:
+        tracking_zones.update((zone.name, zone) for zone in load_zones(args.zones_file))
+
+    zones = args.zones or [zone_name for zone_name in tracking_zones if zone_name != 'Test']
+    unknown = [zone_name for zone_name in zones if zone_name not in tracking_zones]
+    if unknown:
+        raise ValueError(f'unknown tracking zones {unknown}, available: {sorted(tracking_zones)}')
+
+    pollers = [ZonePoller(zone_name, args.zoom, args.interval, args.min_interval, args.max_interval,
+                          zone=tracking_zones[zone_name])
+               for zone_name in zones]
+    position_store = PositionStore(os.path.sep.join([args.output_dir, 'positions']))
+    ingester = DeltaIngester(position_store, position_threshold=args.position_threshold,
+                             speed_threshold=args.speed_threshold, course_threshold=args.course_threshold,
+                             draught_threshold=args.draught_threshold, keyframe_interval=args.keyframe_interval)
+    with metrics.profiled('track-ships', args.profile, args.output_dir):
+        asyncio.run(track_zones(pollers, ingester, position_store, args.cycles))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--output-dir', type=str, help='location of output directory', default='.')
+    parser.add_argument('--zones', type=str, nargs='*',
+                        help=f'tracking zones among {", ".join(TRACKING_ZONES)} and those of the zones file, '
+                             f'defaults to all but Test')
+    parser.add_argument('--zones-file', type=str,
+                        help='JSON or GeoJSON file of additional zones, polled through their bounding box')
+    parser.add_argument('--zoom', type=int, help='zoom level of the map requests', default=9)
+    parser.add_argument('--interval', type=float, help='base polling interval in seconds', default=120.)
+    parser.add_argument('--min-interval', type=float, help='shortest polling interval in seconds', default=30.)
+    parser.add_argument('--max-interval', type=float, help='longest polling interval in seconds', default=900.)
+    parser.add_argument('--cycles', type=int, help='number of polls per zone, unlimited by default')
+    parser.add_argument('--position-threshold', type=float, help='distance in meters a vessel must move to be stored',
+                        default=50.)
+    parser.add_argument('--speed-threshold', type=float, help='speed change in knots to be stored', default=0.5)
+    parser.add_argument('--course-threshold', type=float, help='course change in degrees to be stored', default=10.)
+    parser.add_argument('--draught-threshold', type=float, help='draught change in meters to be stored', default=0.05)
+    parser.add_argument('--keyframe-interval', type=int, help='seconds between two full snapshots of a zone',
+                        default=6 * 3600)
+    parser.add_argument('--rate-limit', type=float, help='requests per second sent to the site, initial rate unless fixed',
+                        default=1.)
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help='keeps the rate limit fixed instead of adapting it to the site responses')
+    parser.add_argument('--max-rate', type=float, help='highest rate in requests per second the adaptive rate can reach',
+                        default=10.)
+    parser.add_argument('--throttle-state', type=str,
+                        help='adaptive rate state file shared by the scripts, defaults to <output dir>/throttle-state.json')
+    parser.add_argument('--host-alias', type=str, action='append', default=[],
+                        help='redirects requests for a host, as in www.marinetraffic.com=http://localhost:8000')
+    parser.add_argument('--metrics-file', type=str, help='location of the Prometheus metrics text file')
+    parser.add_argument('--metrics-interval', type=float, help='seconds between two metrics summaries', default=60.)
+    parser.add_argument('--profile', type=str, choices=metrics.PROFILERS,
+                        help='profiles the polling loop, reports being saved in the output directory')
+
+
+def main(args):
+    throttle = None
+    if not args.fixed_rate:
+        throttle = AdaptiveThrottle(args.throttle_state or os.path.sep.join([args.output_dir, 'throttle-state.json']),
+                                    initial_rate=args.rate_limit, max_rate=args.max_rate, burst=4)
+
+    configure(rate_limit=args.rate_limit, burst=4, throttle=throttle,
+              host_aliases=dict(alias.split('=', 1) for alias in args.host_alias))
+
+    metrics.start_reporting(args.metrics_interval, args.metrics_file)
+    try:
+        track(args)
+
+    finally:
+        metrics.stop_reporting()
@@ -0,0 +1,51 @@
+import argparse
+import logging
+
+from shipsdb.aggregates import FleetAggregates, DIMENSIONS
+from shipsdb.positions import PositionStore
+
+DESCRIPTION = 'Maintaining fleet capacity aggregates'
+
+
+def show(aggregates: FleetAggregates, dimension: str, scope: str):
+    measures = aggregates.lookup(dimension, scope)
+    if measures.empty:
+        print(f'no aggregates for scope "{scope}"')
+        return
+
+    total = measures['gross_tonnage'].sum()
+    for key, values in measures.sort_values('gross_tonnage', ascending=False).iterrows():
+        share = values['gross_tonnage'] / total if total else 0.
+        print(f'{key or "total":>32} {int(values["vessels"]):7d} vessels  GT {values["gross_tonnage"]:14,.0f} '
+              f'({share:6.1%})  DWT {values["deadweight"]:14,.0f}  {values["barrels"] / 1e6:9.1f} M bbl')
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--aggregates-file', type=str, help='location of the aggregates file',
+                        default='output/aggregates.sqlite')
+    parser.add_argument('--density', type=float, help='cargo density in t/m3 used for barrels', default=0.85)
+    parser.add_argument('--table13', type=float, help='API Table 13 factor in tonnes per barrel, overrides density')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_update = subparsers.add_parser('update', help='aggregates new vessels snapshots and zone positions')
+    parser_update.add_argument('--store-dir', type=str, help='location of the columnar vessels store',
+                               default='output/store')
+    parser_update.add_argument('--positions-dir', type=str, help='location of the positions store',
+                               default='output/positions')
+    parser_update.add_argument('--interval', type=float, help='minutes between two zone rollups', default=60.)
+    parser_show = subparsers.add_parser('show', help='displays the latest aggregates')
+    parser_show.add_argument('--dimension', type=str, choices=['all'] + list(DIMENSIONS), default='size_class')
+    parser_show.add_argument('--scope', type=str, help='"fleet" or a zone, as in "houston"', default='fleet')
+
+
+def main(args):
+    aggregates = FleetAggregates(args.aggregates_file, density=args.density, table13=args.table13)
+    if args.command == 'update':
+        snapshots = aggregates.update_fleet(args.store_dir)
+        zone_rollups = aggregates.update_zones(PositionStore(args.positions_dir), args.store_dir,
+                                               interval=int(args.interval * 60))
+        logging.info('aggregated %d fleet snapshots and %d zone rollups', snapshots, zone_rollups)
+
+    elif args.command == 'show':
+        show(aggregates, args.dimension, args.scope)
+
+    aggregates.close()
@@ -0,0 +1,194 @@
+"""
+Single pass extraction of the raw vessels export (ship-db.csv).
+
+The export is read once, in chunks of rows, parsing gross tonnage and size into numeric columns. Every chunk
+is then fanned out to the selections, each one a filter expression evaluated with DataFrame.eval():
+
+    >>> outputs = extract('output/ship-db.csv', SELECTIONS['details'], keep_all=True)
+    >>> vessels_oil, vessels_lng, vessels = outputs['oil'], outputs['lng'], outputs['all']
+
+Outputs can be saved as Parquet files in a cache directory, next to a manifest recording the size and
+modification time of the export and the selections: chained runs over an unchanged export then load the
+outputs without parsing the CSV again.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional
+
+from shipsdb.lazy import lazy_import
+
+pandas = lazy_import('pandas')
+
+__all__ = ['SELECTIONS', 'ALL', 'read_export', 'extract', 'parse_selections']
+
+ALL = 'all'
+
+# selections of the scripts, as filter expressions over the parsed export
+SELECTIONS = {
+    'details': {
+        'oil': '(Length > 200 | GT > 60000) & ~`Ship type`.str.contains("LNG")',
+        'lng': '(Length > 200 | GT > 60000) & `Ship type`.str.contains("LNG")',
+    },
+    'clean': {
+        'oil': '(Length < 400) & (GT > 80000) & `Ship type`.str.contains("Oil")',
+        'lng': '(Length < 400) & (GT > 80000) & `Ship type`.str.contains("LNG")',
+    },
+}
+
+_SIZE_PATTERN = r'^([0-9]+)\sx\s([0-9]+)'
+
+_NUMERIC_COLUMNS = ('GT', 'Length', 'Width')
+
+
+def parse_selections(definitions: List[str]) -> Dict[str, str]:
+    """
+    :param definitions: selections as in "oil=GT > 80000"
+    :return: filter expressions by output name
+    """
+    selections = dict()
+    for definition in definitions:
+        name, separator, expression = definition.partition('=')
+        if not separator or not name.strip() or not expression.strip():
+            raise ValueError(f'invalid selection "{definition}", expecting <name>=<expression>')
+
+        selections[name.strip()] = expression.strip()
+
+    return selections
+
+
+def _parse_chunk(chunk: pandas.DataFrame, skip_empty_imo: bool) -> pandas.DataFrame:
+    if skip_empty_imo:
+        chunk = chunk[chunk['IMO'].str.strip() != '']
+
+    chunk = chunk.copy()
+    gross_tonnage = chunk['GT'].str.strip()
+    chunk['GT'] = pandas.to_numeric(gross_tonnage.str[:-2].where(gross_tonnage.str.endswith(' t')),
+                                    errors='coerce').astype(float)
+    length_width = chunk['Size'].str.strip().str.extract(_SIZE_PATTERN).astype(float)
+    chunk = chunk.drop(columns=['Size'])
+    chunk['Length'], chunk['Width'] = length_width[0], length_width[1]
+    return chunk
+
+
+def _concat(frames: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """
+    Numeric columns without missing values are integers, as when building the frame from rows.
+    """
+    if not frames:
+        return pandas.DataFrame()
+
+    frame = pandas.concat(frames, ignore_index=True)
+    for column in _NUMERIC_COLUMNS:
+        if len(frame) > 0 and frame[column].notna().all():
+            frame[column] = frame[column].astype('int64')
+
+    return frame
+
+
+def read_export(input_filename: str, chunk_size: int = 100000, skip_empty_imo: bool = True) -> Iterator[pandas.DataFrame]:
+    """
+    Streams the export as parsed chunks: text columns are kept as read, GT is parsed from "<tonnage> t" and
+    Size from "<length> x <width> m" into Length and Width, missing values being NaN.
+
+    :param input_filename: location of the export
+    :param chunk_size: number of rows per chunk
+    :param skip_empty_imo: drops vessels without IMO
+    :return: generator of frames
+    """
+    with pandas.read_csv(input_filename, dtype=str, keep_default_na=False, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield _parse_chunk(chunk, skip_empty_imo)
+
+
+def _source_signature(input_filename: str, selections: Dict[str, str], keep_all: bool,
+                      skip_empty_imo: bool) -> Dict:
+    status = os.stat(input_filename)
+    return {
+        'source': os.path.abspath(input_filename),
+        'size': status.st_size,
+        'mtime_ns': status.st_mtime_ns,
+        'selections': selections,
+        'keep_all': keep_all,
+        'skip_empty_imo': skip_empty_imo,
+    }
+
+
+def _cache_location(cache_dir: str, signature: Dict) -> str:
+    key = hashlib.sha1(json.dumps([signature['source'], signature['selections'], signature['keep_all'],
+                                   signature['skip_empty_imo']], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.sep.join([cache_dir, key])
+
+
+def _load_cached(location: str, signature: Dict) -> Optional[Dict[str, pandas.DataFrame]]:
+    manifest_filename = os.path.sep.join([location, 'manifest.json'])
+    if not os.path.exists(manifest_filename):
+        return None
+
+    with open(manifest_filename, 'r', encoding='utf-8') as manifest_file:
+        if json.load(manifest_file) != signature:
+            return None
+
+    return {name: pandas.read_parquet(os.path.sep.join([location, f'{name}.parquet'])) for name in
+            list(signature['selections']) + ([ALL] if signature['keep_all'] else [])}
+
+
+def _save_cached(location: str, signature: Dict, outputs: Dict[str, pandas.DataFrame]):
+    location_tmp = location + '.tmp'
+    shutil.rmtree(location_tmp, ignore_errors=True)
+    os.makedirs(location_tmp)
+    for name, frame in outputs.items():
+        frame.to_parquet(os.path.sep.join([location_tmp, f'{name}.parquet']), index=False)
+
+    with open(os.path.sep.join([location_tmp, 'manifest.json']), 'w', encoding='utf-8') as manifest_file:
+        json.dump(signature, manifest_file)
+
+    shutil.rmtree(location, ignore_errors=True)
+    os.replace(location_tmp, location)
+
+
+def extract(input_filename: str, selections: Dict[str, str], keep_all: bool = False, chunk_size: int = 100000,
+            skip_empty_imo: bool = True, cache_dir: Optional[str] = None) -> Dict[str, pandas.DataFrame]:
+    """
+    Reads the export once, every chunk being filtered by each selection.
+
+    :param input_filename: location of the export
+    :param selections: filter expressions by output name, see SELECTIONS
+    :param keep_all: also outputs the unfiltered rows, under the ALL name
+    :param chunk_size: number of rows parsed at once
+    :param skip_empty_imo: drops vessels without IMO
+    :param cache_dir: location of the outputs cache, disabled if None
+    :return: frames by output name, in input order, numeric columns being integers when no value is missing
+    """
+    if keep_all and ALL in selections:
+        raise ValueError(f'selection name "{ALL}" is reserved for the unfiltered output')
+
+    signature = None
+    if cache_dir is not None:
+        signature = _source_signature(input_filename, selections, keep_all, skip_empty_imo)
+        outputs = _load_cached(_cache_location(cache_dir, signature), signature)
+        if outputs is not None:
+            logging.info('loaded %s from cache for "%s"', ', '.join(outputs), input_filename)
+            return outputs
+
+    chunks = {name: list() for name in list(selections) + ([ALL] if keep_all else [])}
+    rows_count = 0
+    for chunk in read_export(input_filename, chunk_size, skip_empty_imo):
+        rows_count += len(chunk)
+        for name, expression in selections.items():
+            chunks[name].append(chunk[chunk.eval(expression, engine='python').fillna(False).astype(bool)])
+
+        if keep_all:
+            chunks[ALL].append(chunk)
+
+    outputs = {name: _concat(frames) for name, frames in chunks.items()}
+    logging.info('extracted %s from %d rows of "%s"',
+                 ', '.join(f'{len(frame)} {name}' for name, frame in outputs.items()), rows_count, input_filename)
+    if cache_dir is not None:
+        _save_cached(_cache_location(cache_dir, signature), signature, outputs)
+
+    return outputs
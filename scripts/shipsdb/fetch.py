@@ -0,0 +1,353 @@
+"""
+Shared HTTP fetch layer.
+
+Requests go through a single pooled aiohttp session running on a background event loop, so that
+connections are kept alive and reused across calls, whichever thread they come from.
+Each host gets its own token bucket rate limiter and a bounded number of connections, failed
+requests are retried with an exponential backoff.
+
+Caching follows the webscrapetools.urlcaching semantics: once set_cache_path() has been called,
+responses are stored and subsequent calls for the same URL are served from the cache, without
+consuming any rate limit token, until they expire (see PageCache).
+
+Instead of a fixed rate, an AdaptiveThrottle (see shipsdb.throttle) can adjust the rate of each host
+to its responses, pages found blocked by the caller being reported through report_soft_block().
+
+Time spent waiting for tokens and downloading, bytes fetched and cache hits are recorded in
+shipsdb.metrics.
+
+    >>> set_cache_path('./output/urlcaching.sqlite')
+    >>> configure(rate_limit=2., connections_per_host=4)
+    >>> html_text = open_url('https://www.vesselfinder.com/vessels')
+
+From a coroutine:
+    >>> pages = await fetch_all(urls)
+
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from shipsdb import metrics
+from shipsdb.lazy import lazy_import
+from shipsdb.pagecache import PageCache
+from shipsdb.throttle import AdaptiveThrottle
+
+aiohttp = lazy_import('aiohttp')
+
+__all__ = ['configure', 'get_fetcher', 'open_url', 'fetch', 'fetch_all', 'set_cache_path', 'get_cache',
+           'invalidate_key', 'is_cached', 'report_soft_block', 'Fetcher', 'TokenBucket', 'FetchError']
+
+_HEADERS_BROWSER = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'}
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    pass
+
+
+_cache = None
+
+
+def set_cache_path(cache_filename: str, **kwargs):
+    """
+    Enables caching, see PageCache for the available settings.
+
+    :param cache_filename: location of the SQLite cache file
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+
+    _cache = PageCache(cache_filename, **kwargs)
+
+
+def get_cache() -> Optional[PageCache]:
+    return _cache
+
+
+def invalidate_key(key: str):
+    if _cache is not None:
+        _cache.delete(key)
+
+
+def is_cached(key: str) -> bool:
+    return _cache is not None and key in _cache
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter, to be used from the event loop thread only.
+    """
+
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        """
+
+        :param rate: number of tokens added per second, no limit if None or 0
+        :param burst: maximum number of tokens that can be accumulated
+        """
+        self._rate = rate
+        self._capacity = float(max(burst, 1))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self._rate:
+            return
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1.:
+                    self._tokens -= 1.
+                    return
+
+                await asyncio.sleep((1. - self._tokens) / self._rate)
+
+
+class Fetcher(object):
+    """
+    Pooled HTTP client running its own event loop in a background thread.
+    """
+
+    def __init__(self, rate_limit: Optional[float] = 1., burst: int = 1, connections_per_host: int = 4,
+                 retries: int = 3, backoff: float = 1., timeout: float = 30.,
+                 host_aliases: Optional[Dict[str, str]] = None, throttle: Optional[AdaptiveThrottle] = None):
+        """
+
+        :param rate_limit: maximum number of requests per second and per host, no limit if None or 0
+        :param burst: number of requests allowed in a burst before the rate limit applies
+        :param connections_per_host: size of the connection pool for each host
+        :param retries: number of attempts after the first failure
+        :param backoff: initial waiting period in seconds, doubled after each failure
+        :param timeout: total timeout in seconds for a single request
+        :param host_aliases: maps hosts (as in "www.vesselfinder.com") to alternative base urls
+               (as in "http://localhost:8000"), cache keys remain the original urls
+        :param throttle: adaptive rate control replacing the fixed rate limit and burst
+        """
+        self._rate_limit = rate_limit
+        self._burst = burst
+        self._connections_per_host = connections_per_host
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+        self._host_aliases = host_aliases or dict()
+        self._throttle = throttle
+        self._buckets = dict()
+        self._session = None
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='fetcher-loop', daemon=True)
+                self._thread.start()
+
+        return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self._connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, headers=_HEADERS_BROWSER,
+                                                  timeout=aiohttp.ClientTimeout(total=self._timeout))
+
+        return self._session
+
+    def _get_bucket(self, host: str) -> TokenBucket:
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self._rate_limit, self._burst)
+
+        return self._buckets[host]
+
+    def _resolve(self, url: str) -> str:
+        parts = urlsplit(url)
+        alias = self._host_aliases.get(parts.netloc)
+        if alias is None:
+            return url
+
+        alias_parts = urlsplit(alias)
+        return urlunsplit((alias_parts.scheme, alias_parts.netloc, parts.path, parts.query, parts.fragment))
+
+    async def _acquire(self, host: str):
+        with metrics.stage('throttle'):
+            if self._throttle is not None:
+                await self._throttle.acquire(host)
+
+            else:
+                await self._get_bucket(host).acquire()
+
+    def _record(self, host: str, status: Optional[int], start: float, retry_after: Optional[float] = None):
+        if self._throttle is not None:
+            self._throttle.record(host, status, time.monotonic() - start, retry_after)
+
+    async def _download(self, url: str) -> str:
+        host = urlsplit(url).netloc
+        request_url = self._resolve(url)
+        for attempt in range(self._retries + 1):
+            await self._acquire(host)
+            delay = self._backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            start = time.monotonic()
+            try:
+                with metrics.stage('network'):
+                    async with self._get_session().get(request_url) as response:
+                        if response.status not in _RETRY_STATUSES:
+                            body = await response.read()
+                            self._record(host, response.status, start)
+                            metrics.increment('pages_fetched')
+                            metrics.increment('bytes_fetched', len(body))
+                            return await response.text()
+
+                        error = FetchError(f'status {response.status} for url {url}')
+                        retry_after = response.headers.get('Retry-After', '')
+                        retry_after = float(retry_after) if retry_after.isdigit() else None
+                        self._record(host, response.status, start, retry_after)
+                        if retry_after is not None:
+                            delay = max(delay, retry_after)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                self._record(host, None, start)
+                error = err
+
+            if attempt < self._retries:
+                metrics.increment('fetch_retries')
+                logging.warning('failed to load url %s (%s), retrying in %.1fs', url, error, delay)
+                await asyncio.sleep(delay)
+
+        raise FetchError(f'failed to load url {url} after {self._retries + 1} attempts') from error
+
+    def _submit(self, url: str):
+        return asyncio.run_coroutine_threadsafe(self._download(url), self._get_loop())
+
+    @staticmethod
+    def _read_cache(url: str) -> Optional[str]:
+        if _cache is None:
+            return None
+
+        with metrics.stage('cache'):
+            content = _cache.get(url)
+
+        metrics.increment('cache_misses' if content is None else 'cache_hits')
+        return content
+
+    def report_soft_block(self, url: str):
+        """
+        Tells the throttle a page from the url host was blocked despite a successful status.
+        """
+        if self._throttle is not None:
+            self._throttle.soft_block(urlsplit(url).netloc)
+
+    def _write_cache(self, url: str, content: str, rejection_marker: Optional[str]):
+        if rejection_marker is not None and rejection_marker in content:
+            self.report_soft_block(url)
+            raise FetchError(f'rejected, failed to load url {url}')
+
+        if _cache is not None:
+            with metrics.stage('cache'):
+                _cache.put(url, content)
+
+    def open_url(self, url: str, rejection_marker: Optional[str] = None) -> str:
+        """
+        Loads the specified url, from cache when available.
+        Safe to be called from any thread.
+
+        :param url: target url
+        :param rejection_marker: raises error if response contains specified marker
+        :return: remote response as text
+        """
+        content = self._read_cache(url)
+        if content is None:
+            content = self._submit(url).result()
+            self._write_cache(url, content, rejection_marker)
+
+        return content
+
+    async def fetch(self, url: str, rejection_marker: Optional[str] = None) -> str:
+        """
+        Same as open_url(), to be awaited from any event loop.
+        """
+        content = self._read_cache(url)
+        if content is None:
+            content = await asyncio.wrap_future(self._submit(url))
+            self._write_cache(url, content, rejection_marker)
+
+        return content
+
+    async def fetch_all(self, urls: Iterable[str], rejection_marker: Optional[str] = None) -> List[str]:
+        return await asyncio.gather(*[self.fetch(url, rejection_marker) for url in urls])
+
+    async def _close_session(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def close(self):
+        if self._loop is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(self._close_session(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def configure(**kwargs) -> Fetcher:
+    """
+    Replaces the default fetcher, see Fetcher for the available settings.
+    """
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is not None:
+            _fetcher.close()
+
+        _fetcher = Fetcher(**kwargs)
+        return _fetcher
+
+
+def get_fetcher() -> Fetcher:
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher()
+
+        return _fetcher
+
+
+def report_soft_block(url: str):
+    get_fetcher().report_soft_block(url)
+
+
+def open_url(url: str, rejection_marker: Optional[str] = None) -> str:
+    return get_fetcher().open_url(url, rejection_marker)
+
+
+async def fetch(url: str, rejection_marker: Optional[str] = None) -> str:
+    return await get_fetcher().fetch(url, rejection_marker)
+
+
+async def fetch_all(urls: Iterable[str], rejection_marker: Optional[str] = None) -> List[str]:
+    return await get_fetcher().fetch_all(urls, rejection_marker)
+
+
+@atexit.register
+def _close():
+    if _fetcher is not None:
+        _fetcher.close()
@@ -0,0 +1,414 @@
+"""
+Geofencing of vessel positions against tracking zones and arbitrary polygons.
+
+A zone is made of one or more rings of (lon, lat) vertices, combined with the even-odd rule so that a ring
+inside another one cuts a hole. Zones are loaded from a JSON file, either a list of boxes and polygons or a
+GeoJSON feature collection of Polygon and MultiPolygon features named by their "name" property:
+
+    {"zones": [
+        {"name": "Port of Houston", "polygon": [[-95.28, 29.72], [-95.00, 29.76], [-94.98, 29.60], ...]},
+        {"name": "Sabine Pass", "polygons": [[[-93.90, 29.80], ...], [[-93.85, 29.70], ...]]},
+        {"name": "Houston", "box": [[-95.45, 29.83], [-93.60, 28.70]]}
+    ]}
+
+Geofence classifies positions in bulk. A grid laid over the zones tells for each cell whether it lies inside a
+zone, outside all of them or on the boundary of some: most positions are classified by a table lookup, only
+those in boundary cells going through an exact point in polygon test against the few edges crossing their grid
+row. Zones may overlap, the first zone containing a position wins: specific areas (a port) are to be listed
+before the zones enclosing them (a bay).
+
+    >>> geofence = Geofence(load_zones('zones.json'))
+    >>> zones = geofence.classify(positions['lon'].to_numpy(), positions['lat'].to_numpy())
+    >>> detector = ZoneEventDetector(geofence)
+    >>> events = detector.update(store.query(start=t1, end=t2, departures=True))
+
+Longitudes are expected in [-180, 180], zones crossing the antimeridian are not supported.
+"""
+from __future__ import annotations
+
+import json
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy
+
+from shipsdb.lazy import lazy_import
+from shipsdb.positions import vessel_keys
+
+pandas = lazy_import('pandas')
+
+__all__ = ['Zone', 'Geofence', 'ZoneEventDetector', 'TRACKING_ZONES', 'EVENT_COLUMNS', 'box', 'load_zones']
+
+EVENT_COLUMNS = ['timestamp', 'event', 'zone', 'ship_id', 'mmsi', 'imo', 'name', 'lat', 'lon']
+
+ENTRY = 'entry'
+EXIT = 'exit'
+
+# zone index of the positions outside all zones
+_OUTSIDE = -1
+
+# vessels not seen yet, for the events detector
+_UNKNOWN = -2
+
+
+class Zone(NamedTuple):
+    name: str
+    # arrays of (lon, lat) vertices, closed or not
+    rings: Tuple[numpy.ndarray, ...]
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """
+        :return: min lon, min lat, max lon, max lat
+        """
+        vertices = numpy.concatenate(self.rings)
+        return (float(vertices[:, 0].min()), float(vertices[:, 1].min()),
+                float(vertices[:, 0].max()), float(vertices[:, 1].max()))
+
+
+def _ring(vertices) -> numpy.ndarray:
+    ring = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 2)
+    if len(ring) < 3:
+        raise ValueError(f'a ring needs at least 3 vertices: {vertices}')
+
+    return ring
+
+
+def box(name: str, corner, opposite_corner) -> Zone:
+    """
+    :param name: zone name
+    :param corner: (lon, lat) of any corner
+    :param opposite_corner: (lon, lat) of the opposite corner
+    :return: rectangular zone
+    """
+    min_lon, max_lon = sorted((corner[0], opposite_corner[0]))
+    min_lat, max_lat = sorted((corner[1], opposite_corner[1]))
+    return Zone(name, (_ring([(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)]),))
+
+
+TRACKING_ZONES = {zone.name: zone for zone in [
+    box('Houston', (-95.45, 29.83), (-93.60, 28.70)),
+    box('Corpus Christi', (-96.20, 26.90), (-97.60, 28.30)),
+    box('New Orleans', (-91.00, 30.50), (-88.30, 28.85)),
+    box('Los Angeles', (-117.80, 33.46), (-118.60, 34.00)),
+    box('Test', (-94, 18), (-89, 23)),
+]}
+
+
+def _geojson_zones(features: List[Dict]) -> List[Zone]:
+    zones = list()
+    for count, feature in enumerate(features):
+        geometry = feature.get('geometry') or dict()
+        name = (feature.get('properties') or dict()).get('name') or f'zone-{count}'
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+
+        else:
+            raise ValueError(f'unsupported geometry for zone "{name}": {geometry.get("type")}')
+
+        zones.append(Zone(name, tuple(_ring(ring) for polygon in polygons for ring in polygon)))
+
+    return zones
+
+
+def load_zones(filename: str) -> List[Zone]:
+    """
+    :param filename: zones definitions, as a list of zones or a GeoJSON feature collection
+    :return: zones in file order, which is also their priority order
+    """
+    with open(filename, 'r', encoding='utf-8') as zones_file:
+        definitions = json.load(zones_file)
+
+    if definitions.get('type') == 'FeatureCollection':
+        return _geojson_zones(definitions['features'])
+
+    zones = list()
+    for definition in definitions['zones']:
+        if 'box' in definition:
+            zones.append(box(definition['name'], *definition['box']))
+
+        elif 'polygon' in definition:
+            zones.append(Zone(definition['name'], (_ring(definition['polygon']),)))
+
+        elif 'polygons' in definition:
+            zones.append(Zone(definition['name'], tuple(_ring(ring) for ring in definition['polygons'])))
+
+        else:
+            raise ValueError(f'zone "{definition.get("name")}" has no box, polygon or polygons')
+
+    return zones
+
+
+def _expand(counts: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    :return: for each item of the expansion, index of the item it comes from and rank within that item
+    """
+    counts = numpy.maximum(counts, 0)
+    origins = numpy.repeat(numpy.arange(len(counts)), counts)
+    ranks = numpy.arange(len(origins)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return origins, ranks
+
+
+class Geofence(object):
+    """
+    Point in zone classification of positions in bulk, the first zone containing a position winning.
+    """
+
+    def __init__(self, zones: Sequence[Zone], max_cells: int = 1 << 20):
+        """
+
+        :param zones: zones in priority order
+        :param max_cells: size of the grid laid over the zones, a finer grid leaving fewer positions to exact tests
+        """
+        if not zones:
+            raise ValueError('no zone to geofence')
+
+        self.zones = list(zones)
+        self.names = [zone.name for zone in self.zones]
+        if len(set(self.names)) != len(self.names):
+            raise ValueError(f'duplicated zone names in {self.names}')
+
+        self._index = {name: count for count, name in enumerate(self.names)}
+        bounds = numpy.array([zone.bounds for zone in self.zones])
+        self._min_lon, self._min_lat = bounds[:, 0].min(), bounds[:, 1].min()
+        width = max(bounds[:, 2].max() - self._min_lon, 1e-6)
+        height = max(bounds[:, 3].max() - self._min_lat, 1e-6)
+        self._cell_size = math.sqrt(width * height / max_cells)
+        self._columns = int(math.floor(width / self._cell_size)) + 1
+        self._rows = int(math.floor(height / self._cell_size)) + 1
+        self._build_edges()
+        self._build_cells()
+
+    def _grid(self, lon: numpy.ndarray, lat: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :return: column and row in the grid, as floats, NaN and out of grid positions included
+        """
+        return (lon - self._min_lon) / self._cell_size, (lat - self._min_lat) / self._cell_size
+
+    def _build_edges(self):
+        """
+        Edges of all zones, then the non-horizontal ones by zone and grid row, for the point in polygon tests.
+        """
+        edges = list()
+        for count, zone in enumerate(self.zones):
+            for ring in zone.rings:
+                closed = ring if numpy.array_equal(ring[0], ring[-1]) else numpy.vstack([ring, ring[:1]])
+                edges.append(numpy.column_stack([closed[:-1], closed[1:], numpy.full(len(closed) - 1, count)]))
+
+        edges = numpy.concatenate(edges)
+        self._edges = edges[:, :4]
+        self._edge_zones = edges[:, 4].astype(numpy.int64)
+
+        x0, y0, x1, y1 = self._edges.T
+        sloped = numpy.flatnonzero(y0 != y1)
+        row_first = numpy.floor(self._grid(x0, numpy.minimum(y0, y1))[1][sloped]).astype(numpy.int64)
+        row_last = numpy.floor(self._grid(x0, numpy.maximum(y0, y1))[1][sloped]).astype(numpy.int64)
+        row_first, row_last = numpy.clip(row_first, 0, self._rows - 1), numpy.clip(row_last, 0, self._rows - 1)
+        origins, ranks = _expand(row_last - row_first + 1)
+        edge_ids = sloped[origins]
+        bands = self._edge_zones[edge_ids] * self._rows + row_first[origins] + ranks
+        order = numpy.argsort(bands, kind='stable')
+        self._band_edges = edge_ids[order]
+        self._band_start = numpy.searchsorted(bands[order], numpy.arange(len(self.zones) * self._rows + 1))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            self._slopes = numpy.where(y0 != y1, (x1 - x0) / (y1 - y0), 0.)
+
+    def _contains_many(self, zones: numpy.ndarray, lon: numpy.ndarray, lat: numpy.ndarray) -> numpy.ndarray:
+        """
+        Exact even-odd test of each position against its own zone, counting the edges crossed by a ray going
+        east, only edges of the grid row of the position being candidates.
+
+        :param zones: zone index of each position
+        :param lon: longitudes of positions inside the grid
+        :param lat: latitudes of positions inside the grid
+        :return: whether each position is inside its zone
+        """
+        rows = numpy.floor(self._grid(lon, lat)[1]).astype(numpy.int64)
+        bands = zones * self._rows + numpy.clip(rows, 0, self._rows - 1)
+        starts = self._band_start[bands]
+        points, ranks = _expand(self._band_start[bands + 1] - starts)
+        edges = self._band_edges[starts[points] + ranks]
+        x0, y0, y1 = self._edges[edges, 0], self._edges[edges, 1], self._edges[edges, 3]
+        point_lon, point_lat = lon[points], lat[points]
+        crossed = ((y0 > point_lat) != (y1 > point_lat)) & \
+                  (point_lon < x0 + (point_lat - y0) * self._slopes[edges])
+        return numpy.bincount(points[crossed], minlength=len(zones)) % 2 == 1
+
+    def _boundary_cells(self, zone: int) -> numpy.ndarray:
+        """
+        Cells crossed by the edges of a zone, widened by a small margin so that rounding errors stay on the safe
+        side: positions in these cells need an exact test.
+
+        :return: cell indexes, with duplicates
+        """
+        margin = self._cell_size * 1e-6
+        x0, y0, x1, y1 = self._edges[self._edge_zones == zone].T
+        row_first = numpy.floor(self._grid(x0, numpy.minimum(y0, y1) - margin)[1]).astype(numpy.int64)
+        row_last = numpy.floor(self._grid(x0, numpy.maximum(y0, y1) + margin)[1]).astype(numpy.int64)
+        row_first, row_last = numpy.clip(row_first, 0, self._rows - 1), numpy.clip(row_last, 0, self._rows - 1)
+        edges, ranks = _expand(row_last - row_first + 1)
+        rows = row_first[edges] + ranks
+        x0, y0, x1, y1 = x0[edges], y0[edges], x1[edges], y1[edges]
+
+        # part of each edge within the row band
+        band_low = self._min_lat + rows * self._cell_size
+        low = numpy.maximum(numpy.minimum(y0, y1), band_low)
+        high = numpy.minimum(numpy.maximum(y0, y1), band_low + self._cell_size)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            slopes = numpy.where(y0 != y1, (x1 - x0) / (y1 - y0), 0.)
+
+        lon_low = numpy.where(y0 != y1, x0 + (low - y0) * slopes, numpy.minimum(x0, x1))
+        lon_high = numpy.where(y0 != y1, x0 + (high - y0) * slopes, numpy.maximum(x0, x1))
+        column_first = numpy.floor(self._grid(numpy.minimum(lon_low, lon_high) - margin, low)[0]).astype(numpy.int64)
+        column_last = numpy.floor(self._grid(numpy.maximum(lon_low, lon_high) + margin, low)[0]).astype(numpy.int64)
+        column_first = numpy.clip(column_first, 0, self._columns - 1)
+        column_last = numpy.clip(column_last, 0, self._columns - 1)
+        segments, ranks = _expand(column_last - column_first + 1)
+        return rows[segments] * self._columns + column_first[segments] + ranks
+
+    def _build_cells(self):
+        """
+        Class of each grid cell: index of the zone containing the whole cell, _OUTSIDE, or a candidate when the
+        cell is on the boundary of a zone, coded as -2 - candidate. A candidate is a zone to be tested exactly
+        and the class to fall back on if the position is outside, possibly another candidate.
+        """
+        cells = numpy.full(self._rows * self._columns, _OUTSIDE, dtype=numpy.int32)
+        candidate_zones, candidate_fallbacks = list(), list()
+        # lowest priority first, so that zones listed first override the others
+        for zone in reversed(range(len(self.zones))):
+            min_lon, min_lat, max_lon, max_lat = self.zones[zone].bounds
+            column_first, row_first = [int(value) for value in numpy.floor(self._grid(min_lon, min_lat))]
+            column_last, row_last = [int(value) for value in numpy.floor(self._grid(max_lon, max_lat))]
+            rows, columns = numpy.meshgrid(numpy.arange(max(row_first, 0), min(row_last, self._rows - 1) + 1),
+                                           numpy.arange(max(column_first, 0), min(column_last, self._columns - 1) + 1),
+                                           indexing='ij')
+            box_cells = (rows * self._columns + columns).ravel()
+            boundary = numpy.unique(self._boundary_cells(zone))
+            interior = box_cells[~numpy.isin(box_cells, boundary)]
+            # cells without any edge are entirely inside or outside, as their center
+            center_lon = self._min_lon + (interior % self._columns + 0.5) * self._cell_size
+            center_lat = self._min_lat + (interior // self._columns + 0.5) * self._cell_size
+            inside = self._contains_many(numpy.full(len(interior), zone, dtype=numpy.int64), center_lon, center_lat)
+
+            fallbacks, inverse = numpy.unique(cells[boundary], return_inverse=True)
+            first_candidate = len(candidate_zones)
+            candidate_zones.extend([zone] * len(fallbacks))
+            candidate_fallbacks.extend(fallbacks.tolist())
+            cells[boundary] = -2 - (first_candidate + inverse.ravel())
+            cells[interior[inside]] = zone
+
+        self._cells = cells
+        self._candidate_zones = numpy.array(candidate_zones, dtype=numpy.int64)
+        self._candidate_fallbacks = numpy.array(candidate_fallbacks, dtype=numpy.int32)
+
+    def classify(self, lon, lat) -> numpy.ndarray:
+        """
+        :param lon: longitudes of the positions
+        :param lat: latitudes of the positions
+        :return: index in self.names of the first zone containing each position, -1 if none or no coordinates
+        """
+        lon = numpy.asarray(lon, dtype=numpy.float64)
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        columns, rows = self._grid(lon, lat)
+        in_grid = (columns >= 0.) & (columns < self._columns) & (rows >= 0.) & (rows < self._rows)
+        classes = numpy.full(len(lon), _OUTSIDE, dtype=numpy.int32)
+        if in_grid.all():
+            classes = self._cells[rows.astype(numpy.int64) * self._columns + columns.astype(numpy.int64)]
+
+        else:
+            classes[in_grid] = self._cells[rows[in_grid].astype(numpy.int64) * self._columns +
+                                           columns[in_grid].astype(numpy.int64)]
+
+        pending = numpy.flatnonzero(classes < _OUTSIDE)
+        while len(pending) > 0:
+            candidates = -2 - classes[pending]
+            zones = self._candidate_zones[candidates]
+            inside = self._contains_many(zones, lon[pending], lat[pending])
+            classes[pending] = numpy.where(inside, zones, self._candidate_fallbacks[candidates])
+            pending = pending[classes[pending] < _OUTSIDE]
+
+        return classes
+
+    def contains(self, name: str, lon, lat) -> numpy.ndarray:
+        """
+        :param name: zone name
+        :param lon: longitudes of the positions
+        :param lat: latitudes of the positions
+        :return: whether each position is inside the zone, regardless of the other zones
+        """
+        zone = self._index[name]
+        lon = numpy.asarray(lon, dtype=numpy.float64)
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        min_lon, min_lat, max_lon, max_lat = self.zones[zone].bounds
+        candidates = numpy.flatnonzero((lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat))
+        inside = numpy.zeros(len(lon), dtype=bool)
+        inside[candidates] = self._contains_many(numpy.full(len(candidates), zone, dtype=numpy.int64),
+                                                 lon[candidates], lat[candidates])
+        return inside
+
+
+class ZoneEventDetector(object):
+    """
+    Entries into and exits from zones, from the successive positions of each vessel. The zone of each vessel
+    is kept between updates, the first position of a vessel only telling where it is. Departure records
+    (without coordinates) of vessels no longer reported in their tracking zone count as positions outside
+    all zones: the tracker only keeps positions inside the zone it polls, so that vessels leaving it are
+    only known from those records.
+    """
+
+    def __init__(self, geofence: Geofence):
+        self._geofence = geofence
+        # vessel key: zone index
+        self._zones: Dict[int, int] = dict()
+
+    def update(self, positions: pandas.DataFrame) -> pandas.DataFrame:
+        """
+        :param positions: positions more recent than those of the previous update, with POSITION_FIELDS columns,
+        including departure records as returned by PositionStore.query(departures=True)
+        :return: events with EVENT_COLUMNS, by increasing timestamp, exits before entries, exits from departure
+        records having no coordinates
+        """
+        keys = vessel_keys(positions)
+        order = numpy.lexsort((positions['timestamp'].to_numpy(), keys))
+        positions, keys = positions.iloc[order].reset_index(drop=True), keys[order]
+        zones = self._geofence.classify(positions['lon'].to_numpy(), positions['lat'].to_numpy())
+
+        first = numpy.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        last = numpy.ones(len(keys), dtype=bool)
+        last[:-1] = first[1:]
+        previous = numpy.empty(len(zones), dtype=numpy.int32)
+        previous[1:] = zones[:-1]
+        previous[first] = [self._zones.get(key, _UNKNOWN) for key in keys[first].tolist()]
+        changed = (zones != previous) & (previous != _UNKNOWN)
+        self._zones.update(zip(keys[last].tolist(), zones[last].tolist()))
+
+        events = list()
+        for event, rows, event_zones in ((EXIT, numpy.flatnonzero(changed & (previous >= 0)), previous),
+                                         (ENTRY, numpy.flatnonzero(changed & (zones >= 0)), zones)):
+            selected = positions.iloc[rows]
+            events.append(pandas.DataFrame({
+                'timestamp': selected['timestamp'].to_numpy(),
+                'event': event,
+                'zone': numpy.asarray(self._geofence.names, dtype=object)[event_zones[rows]],
+                **{name: selected[name].to_numpy() for name in EVENT_COLUMNS[3:]},
+            }))
+
+        return pandas.concat(events, ignore_index=True).sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+    def state(self) -> Dict[str, Optional[str]]:
+        """
+        :return: zone name by vessel key, None when outside all zones, as JSON serializable values
+        """
+        return {str(key): self._geofence.names[zone] if zone >= 0 else None for key, zone in self._zones.items()}
+
+    def restore(self, state: Dict[str, Optional[str]]):
+        """
+        Restores the state of the vessels, zones no longer defined counting as outside.
+        """
+        index = {name: count for count, name in enumerate(self._geofence.names)}
+        self._zones = {int(key): index.get(name, _OUTSIDE) if name is not None else _OUTSIDE
+                       for key, name in state.items()}
@@ -0,0 +1,313 @@
+"""
+Versioned history of the vessels lists crawled by download-vessels.py, keyed on IMO:
+    <root>/history/vessel_type=<code>/crawl=<YYYY-MM-DD>.parquet  versions of the vessels added or changed by a
+                                                                   crawl, and tombstones of the vessels it dropped
+    <root>/history/vessel_type=<code>/head.parquet                the fleet as of the latest crawl
+
+Every row carries a content hash of its attributes. A new crawl is compared with the head by a hash join on IMO,
+so that only new versions and removals are stored rather than a full copy per crawl. The fleet as of an earlier
+date is rebuilt by replaying the crawls up to that date, the last version of each vessel winning.
+
+    >>> history = VesselHistory('output/store', vessel_type=6)
+    >>> changes = history.record_csv('output/ship-db-6.csv')
+    >>> reflagged = changes.changed[changes.changed['column'] == 'country']
+    >>> fleet = history.as_of(datetime.date(2024, 1, 1))
+    >>> changes = history.diff(datetime.date(2024, 1, 1))
+
+"""
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+import numpy
+
+from shipsdb.lazy import lazy_import
+from shipsdb.store import apply_schema
+
+pandas = lazy_import('pandas')
+pyarrow = lazy_import('pyarrow', 'pyarrow.compute', 'pyarrow.parquet')
+
+__all__ = ['VesselHistory', 'VesselDiff', 'row_hashes', 'KEY']
+
+KEY = 'imo'
+
+_HASH = 'row_hash'
+
+# between the attributes of a row when hashing it
+_SEPARATOR = '\x1f'
+
+_REMOVED = 'removed'
+
+_HEAD = 'head.parquet'
+
+# schema metadata of the head, telling which crawl it reflects
+_HEAD_CRAWL = b'crawl'
+
+_CHANGED_COLUMNS = [KEY, 'column', 'previous', 'current']
+
+
+class VesselDiff(NamedTuple):
+    """
+    added: vessels in the current state only
+    removed: vessels in the previous state only, as last seen
+    changed: one row per changed attribute of the vessels in both states: imo, column, previous, current
+    """
+    added: pandas.DataFrame
+    removed: pandas.DataFrame
+    changed: pandas.DataFrame
+
+    def summary(self) -> str:
+        counts = self.changed['column'].value_counts()
+        details = ', '.join(f'{column}: {count}' for column, count in counts.items())
+        vessels_changed = self.changed[KEY].nunique()
+        return f'{len(self.added)} added, {len(self.removed)} removed, {vessels_changed} changed' + \
+            (f' ({details})' if details else '')
+
+
+def row_hashes(vessels: pandas.DataFrame) -> numpy.ndarray:
+    """
+    Content hashes of the rows, from their attributes as text in column name order, the key being left out.
+
+    :param vessels: rows as read from the CSV export, values as strings
+    :return: unsigned 64 bits hashes
+    """
+    columns = sorted(column for column in vessels.columns if column != KEY)
+    values = [pyarrow.compute.cast(pyarrow.array(vessels[column], from_pandas=True), pyarrow.large_string())
+              .fill_null('') for column in columns]
+    rows = pyarrow.compute.binary_join_element_wise(*values, pyarrow.scalar(_SEPARATOR, pyarrow.large_string()))
+    return pandas.util.hash_array(rows.to_numpy(zero_copy_only=False), categorize=False)
+
+
+def _prepare(vessels: pandas.DataFrame) -> pyarrow.Table:
+    """
+    Drops rows without IMO and duplicated IMO, then converts to the 'vessels' schema with the row hashes.
+    """
+    keys = vessels[KEY].astype(object).where(vessels[KEY].notna(), '').astype(str).str.strip()
+    valid = (keys != '').to_numpy()
+    if not valid.all():
+        logging.warning('ignoring %d vessels without IMO', (~valid).sum())
+
+    vessels = vessels[valid].assign(**{KEY: keys[valid]})
+    duplicated = vessels[KEY].duplicated().to_numpy()
+    if duplicated.any():
+        logging.warning('ignoring %d duplicated IMO, first row kept', duplicated.sum())
+        vessels = vessels[~duplicated]
+
+    vessels = vessels.reset_index(drop=True)
+    table = apply_schema(vessels, 'vessels')
+    table = table.append_column(_HASH, pyarrow.array(row_hashes(vessels), type=pyarrow.uint64()))
+    return table.append_column(_REMOVED, pyarrow.array(numpy.zeros(len(vessels), dtype=bool)))
+
+
+def _keys(table: Optional[pyarrow.Table]) -> pandas.DataFrame:
+    """
+    :return: IMO and position of each row
+    """
+    if table is None:
+        return pandas.DataFrame({KEY: pandas.Series([], dtype=object), 'position': pandas.Series([], dtype=numpy.int64)})
+
+    return pandas.DataFrame({KEY: table[KEY].to_numpy(zero_copy_only=False), 'position': numpy.arange(len(table))})
+
+
+def _differs(before: pandas.Series, after: pandas.Series) -> numpy.ndarray:
+    missing_before, missing_after = before.isna().to_numpy(), after.isna().to_numpy()
+    before_values, after_values = before.to_numpy(dtype=object), after.to_numpy(dtype=object)
+    before_values[missing_before] = None
+    after_values[missing_after] = None
+    return numpy.where(missing_before | missing_after, missing_before != missing_after, before_values != after_values)
+
+
+def _to_frame(table: pyarrow.Table) -> pandas.DataFrame:
+    return table.drop_columns([column for column in (_HASH, _REMOVED) if column in table.column_names]).to_pandas()
+
+
+def _compare(previous: Optional[pyarrow.Table],
+             current: pyarrow.Table) -> Tuple[VesselDiff, numpy.ndarray, numpy.ndarray]:
+    """
+    Hash join of two states on IMO, linear in their sizes.
+
+    :return: differences, positions in the current state of the new versions, positions in the previous state
+    of the removed vessels
+    """
+    keys = _keys(previous).merge(_keys(current), on=KEY, how='outer', suffixes=('_previous', '_current'),
+                                 indicator=True)
+    added_positions = numpy.sort(keys.loc[keys['_merge'] == 'right_only', 'position_current'].to_numpy(numpy.int64))
+    removed_positions = numpy.sort(keys.loc[keys['_merge'] == 'left_only', 'position_previous'].to_numpy(numpy.int64))
+    both = keys[keys['_merge'] == 'both'].sort_values('position_current')
+    both_previous = both['position_previous'].to_numpy(numpy.int64)
+    both_current = both['position_current'].to_numpy(numpy.int64)
+    changed = previous[_HASH].to_numpy()[both_previous] != current[_HASH].to_numpy()[both_current] \
+        if previous is not None else numpy.zeros(0, dtype=bool)
+    changed_previous, changed_current = both_previous[changed], both_current[changed]
+
+    changes = list()
+    if len(changed_current) > 0:
+        rows_previous = _to_frame(previous.take(changed_previous))
+        rows_current = _to_frame(current.take(changed_current))
+        for column in [name for name in rows_current.columns if name != KEY] + \
+                      [name for name in rows_previous.columns if name not in rows_current.columns]:
+            before = rows_previous[column] if column in rows_previous.columns else \
+                pandas.Series(None, index=rows_previous.index, dtype=object)
+            after = rows_current[column] if column in rows_current.columns else \
+                pandas.Series(None, index=rows_current.index, dtype=object)
+            differs = _differs(before, after)
+            if differs.any():
+                changes.append(pandas.DataFrame({
+                    KEY: rows_current[KEY].to_numpy(dtype=object)[differs],
+                    'column': column,
+                    'previous': before.to_numpy(dtype=object)[differs],
+                    'current': after.to_numpy(dtype=object)[differs],
+                }))
+
+    changed_frame = pandas.concat(changes, ignore_index=True) if changes else \
+        pandas.DataFrame({column: pandas.Series([], dtype=object) for column in _CHANGED_COLUMNS})
+    removed = _to_frame(previous.take(removed_positions)) if previous is not None else \
+        _to_frame(current.slice(0, 0))
+    differences = VesselDiff(added=_to_frame(current.take(added_positions)), removed=removed, changed=changed_frame)
+    versions = numpy.sort(numpy.concatenate([added_positions, changed_current]))
+    return differences, versions, removed_positions
+
+
+class VesselHistory(object):
+    """
+    History of the vessels list of a single vessel type.
+    """
+
+    def __init__(self, root: str, vessel_type: Union[int, str]):
+        """
+
+        :param root: location of the columnar store
+        :param vessel_type: vessel type code, as passed to download-vessels.py
+        """
+        self.directory = os.path.sep.join([root, 'history', f'vessel_type={vessel_type}'])
+
+    def _crawl_filename(self, crawl_date: datetime.date) -> str:
+        return os.path.sep.join([self.directory, f'crawl={crawl_date.isoformat()}.parquet'])
+
+    def crawls(self) -> List[datetime.date]:
+        """
+        :return: dates of the recorded crawls, oldest first
+        """
+        if not os.path.exists(self.directory):
+            return list()
+
+        return sorted(datetime.date.fromisoformat(name[len('crawl='):-len('.parquet')])
+                      for name in os.listdir(self.directory) if name.startswith('crawl=') and name.endswith('.parquet'))
+
+    def _replay(self, crawls: List[datetime.date]) -> Optional[pyarrow.Table]:
+        """
+        :return: state after the crawls, None if there is none
+        """
+        if not crawls:
+            return None
+
+        versions = pyarrow.concat_tables([pyarrow.parquet.read_table(self._crawl_filename(crawl_date))
+                                          for crawl_date in crawls], promote_options='default')
+        keys = pandas.Series(versions[KEY].to_numpy(zero_copy_only=False))
+        latest = numpy.sort(keys.drop_duplicates(keep='last').index.to_numpy())
+        versions = versions.take(latest)
+        return versions.filter(pyarrow.compute.invert(versions[_REMOVED]))
+
+    def _head(self) -> Optional[pyarrow.Table]:
+        """
+        :return: state after the latest crawl, None if no crawl was recorded
+        """
+        crawls = self.crawls()
+        if not crawls:
+            return None
+
+        head_filename = os.path.sep.join([self.directory, _HEAD])
+        if os.path.exists(head_filename):
+            head = pyarrow.parquet.read_table(head_filename)
+            if (head.schema.metadata or dict()).get(_HEAD_CRAWL) == crawls[-1].isoformat().encode():
+                return head
+
+        # interrupted between writing the crawl and the head
+        logging.warning('head of "%s" is outdated, replaying the crawls', self.directory)
+        head = self._replay(crawls)
+        self._write(head, crawls[-1], head_filename)
+        return head
+
+    def _state(self, as_of: Optional[datetime.date]) -> pyarrow.Table:
+        crawls = self.crawls()
+        selected = [crawl_date for crawl_date in crawls if as_of is None or crawl_date <= as_of]
+        if not selected:
+            raise FileNotFoundError(f'no crawl recorded in "{self.directory}"' +
+                                    (f' on or before {as_of.isoformat()}' if as_of is not None else ''))
+
+        if selected[-1] == crawls[-1]:
+            return self._head()
+
+        return self._replay(selected)
+
+    @staticmethod
+    def _write(table: pyarrow.Table, crawl_date: datetime.date, filename: str):
+        table = table.replace_schema_metadata({_HEAD_CRAWL: crawl_date.isoformat().encode()})
+        filename_tmp = filename + '.tmp'
+        pyarrow.parquet.write_table(table, filename_tmp, compression='zstd')
+        os.replace(filename_tmp, filename)
+
+    def as_of(self, as_of: Optional[datetime.date] = None) -> pandas.DataFrame:
+        """
+        :param as_of: date of the fleet, defaults to the latest crawl
+        :return: vessels as listed by the latest crawl on or before the date
+        :raise FileNotFoundError: if no crawl was recorded by then
+        """
+        return _to_frame(self._state(as_of))
+
+    def diff(self, since: datetime.date, until: Optional[datetime.date] = None) -> VesselDiff:
+        """
+        :param since: date of the previous state
+        :param until: date of the current state, defaults to the latest crawl
+        :return: differences between the fleets as of both dates
+        """
+        return _compare(self._state(since), self._state(until))[0]
+
+    def record(self, vessels: pandas.DataFrame, crawl_date: Optional[datetime.date] = None) -> VesselDiff:
+        """
+        Stores a crawl, replacing a previous one for the same date.
+
+        :param vessels: rows of the crawl, values as strings as read from the CSV export
+        :param crawl_date: defaults to today
+        :return: differences with the previous crawl
+        :raise ValueError: if a later crawl is already recorded
+        """
+        if crawl_date is None:
+            crawl_date = datetime.date.today()
+
+        crawls = self.crawls()
+        if crawls and crawl_date < crawls[-1]:
+            raise ValueError(f'crawl of {crawl_date.isoformat()} is older than the latest one recorded '
+                             f'({crawls[-1].isoformat()})')
+
+        if crawls and crawl_date == crawls[-1]:
+            previous = self._replay(crawls[:-1])
+
+        else:
+            previous = self._head()
+
+        current = _prepare(vessels)
+        differences, versions, removed = _compare(previous, current)
+        crawl = current.take(versions)
+        if len(removed) > 0:
+            tombstones = previous.take(removed)
+            tombstones = tombstones.set_column(tombstones.schema.get_field_index(_REMOVED), _REMOVED,
+                                               pyarrow.array(numpy.ones(len(tombstones), dtype=bool)))
+            crawl = pyarrow.concat_tables([crawl, tombstones], promote_options='default')
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(crawl, crawl_date, self._crawl_filename(crawl_date))
+        self._write(current, crawl_date, os.path.sep.join([self.directory, _HEAD]))
+        logging.info('recorded crawl of %s in "%s": %s', crawl_date.isoformat(), self.directory,
+                     differences.summary())
+        return differences
+
+    def record_csv(self, csv_filename: str, crawl_date: Optional[datetime.date] = None) -> VesselDiff:
+        """
+        Stores a crawl from the CSV export of download-vessels.py.
+        """
+        vessels = pandas.read_csv(csv_filename, dtype=str, keep_default_na=False, na_values=[''])
+        return self.record(vessels, crawl_date)
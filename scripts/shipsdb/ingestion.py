@@ -0,0 +1,136 @@
+"""
+Delta ingestion of polled positions.
+
+Successive polls of a zone mostly return the same vessels in the same state. DeltaIngester keeps the last
+stored state of each vessel and only passes on to the positions store the vessels that appeared, moved, or
+changed speed, course, draught or destination beyond its thresholds, along with departure records (without
+coordinates) for the vessels no longer reported. A keyframe holding the state of all vessels of the zone is
+stored at regular intervals, so that PositionStore.snapshot() rebuilds the state of a zone at any time from
+the latest keyframe and the changes following it. With zero thresholds the rebuilt snapshots are identical
+to the polls, except for the report time of vessels whose new reports did not change anything; otherwise
+each vessel is within the thresholds of its polled state.
+
+    >>> ingester = DeltaIngester(PositionStore('output/positions'), position_threshold=50.)
+    >>> ingester.ingest('Houston', positions, received)
+    >>> vessels = store.snapshot('Houston', received)
+
+"""
+import logging
+from typing import Dict, Iterable
+
+import numpy
+
+from shipsdb.positions import PositionStore, RECORD_DTYPE, to_records, vessel_keys
+
+__all__ = ['DeltaIngester']
+
+_EARTH_RADIUS = 6371000.
+
+# course over ground is not significant below this speed in knots
+_COURSE_MIN_SPEED = 1.
+
+
+def _distance(lat_from, lon_from, lat_to, lon_to) -> numpy.ndarray:
+    """
+    Equirectangular approximation in meters, accurate enough for the distances between two polls.
+    """
+    lat_from, lon_from = numpy.radians(lat_from.astype(numpy.float64)), numpy.radians(lon_from.astype(numpy.float64))
+    lat_to, lon_to = numpy.radians(lat_to.astype(numpy.float64)), numpy.radians(lon_to.astype(numpy.float64))
+    x = (lon_to - lon_from) * numpy.cos((lat_from + lat_to) / 2.)
+    y = lat_to - lat_from
+    return _EARTH_RADIUS * numpy.sqrt(x * x + y * y)
+
+
+def _differs(previous: numpy.ndarray, current: numpy.ndarray, threshold: float) -> numpy.ndarray:
+    """
+    :return: True where values differ by more than the threshold or only one of them is missing
+    """
+    with numpy.errstate(invalid='ignore'):
+        return (numpy.abs(current - previous) > threshold) | (numpy.isnan(current) != numpy.isnan(previous))
+
+
+class DeltaIngester(object):
+
+    def __init__(self, store: PositionStore, position_threshold: float = 50., speed_threshold: float = 0.5,
+                 course_threshold: float = 10., draught_threshold: float = 0.05, keyframe_interval: int = 6 * 3600):
+        """
+
+        :param store: destination of the changes
+        :param position_threshold: distance in meters
+        :param speed_threshold: speed difference in knots
+        :param course_threshold: course difference in degrees, ignored for vessels slower than 1 knot
+        :param draught_threshold: draught difference in meters
+        :param keyframe_interval: seconds between two keyframes of a zone
+        """
+        self._store = store
+        self._position_threshold = position_threshold
+        self._speed_threshold = speed_threshold
+        self._course_threshold = course_threshold
+        self._draught_threshold = draught_threshold
+        self._keyframe_interval = keyframe_interval
+        self._states = dict()
+        self._keyframes = dict()
+        self.received_count = 0
+        self.stored_count = 0
+
+    def state(self, zone: str) -> numpy.ndarray:
+        """
+        :return: last stored records of the vessels currently in the zone, sorted by vessel key
+        """
+        return self._states.get(zone, numpy.empty(0, dtype=RECORD_DTYPE))
+
+    def ingest(self, zone: str, positions: Iterable[Dict], received: int) -> int:
+        """
+        :param zone: name of the tracking zone
+        :param positions: complete poll of the zone, records with POSITION_FIELDS keys
+        :param received: poll time in epoch seconds
+        :return: number of records stored
+        """
+        return self.ingest_records(zone, to_records(positions), received)
+
+    def ingest_records(self, zone: str, records: numpy.ndarray, received: int) -> int:
+        """
+        Same as ingest() for records with RECORD_DTYPE.
+        """
+        keys, last_rows = numpy.unique(vessel_keys(records)[::-1], return_index=True)
+        records = records[::-1][last_rows]
+        state = self.state(zone)
+        state_keys = vessel_keys(state)
+        found = numpy.isin(keys, state_keys)
+        previous = state[numpy.searchsorted(state_keys, keys[found])]
+        current = records[found]
+        moving = (current['speed'] >= _COURSE_MIN_SPEED) & (previous['speed'] >= _COURSE_MIN_SPEED)
+        course_change = numpy.abs((current['course'] - previous['course'] + 180.) % 360. - 180.)
+        changed = numpy.ones(len(records), dtype=bool)
+        changed[found] = ((_distance(previous['lat'], previous['lon'], current['lat'], current['lon']) >
+                           self._position_threshold) |
+                          _differs(previous['speed'], current['speed'], self._speed_threshold) |
+                          (moving & (course_change > self._course_threshold)) |
+                          _differs(previous['draught'], current['draught'], self._draught_threshold) |
+                          (previous['destination'] != current['destination']))
+
+        departures = state[~numpy.isin(state_keys, keys)].copy()
+        departures['timestamp'] = received
+        departures['received'] = received
+        departures['lat'] = numpy.nan
+        departures['lon'] = numpy.nan
+
+        # unchanged vessels keep their stored state, so that slow drifts are eventually detected
+        next_state = records.copy()
+        next_state[numpy.flatnonzero(found)[~changed[found]]] = previous[~changed[found]]
+        self._states[zone] = next_state
+
+        changes = numpy.concatenate([records[changed], departures])
+        if len(changes) > 0:
+            self._store.append_records(zone, changes)
+
+        last_keyframe = self._keyframes.get(zone)
+        if last_keyframe is None or received - last_keyframe >= self._keyframe_interval:
+            self._store.write_keyframe(zone, received, next_state)
+            self._keyframes[zone] = received
+
+        self.received_count += len(records)
+        self.stored_count += len(changes)
+        logging.debug('zone %s: stored %d changes out of %d positions, %d departures',
+                      zone, len(changes), len(records), len(departures))
+        return len(changes)
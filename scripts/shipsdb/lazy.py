@@ -0,0 +1,53 @@
+"""
+Deferred imports of heavy dependencies (pandas, pyarrow, BeautifulSoup, aiohttp), so that commands only pay for
+the libraries used by the code path they run:
+
+    >>> pandas = lazy_import('pandas')
+    >>> pyarrow = lazy_import('pyarrow', 'pyarrow.dataset', 'pyarrow.parquet')
+
+The module is imported on first attribute access, along with the listed submodules. Modules using lazy imports
+in annotations postpone their evaluation (from __future__ import annotations).
+"""
+import importlib
+import sys
+import types
+
+__all__ = ['lazy_import']
+
+
+class _LazyModule(types.ModuleType):
+
+    def __init__(self, name: str, submodules: tuple):
+        super().__init__(name)
+        self._submodules = submodules
+        self._module = None
+
+    def _load(self) -> types.ModuleType:
+        if self._module is None:
+            module = importlib.import_module(self.__name__)
+            for submodule in self._submodules:
+                importlib.import_module(submodule)
+
+            self._module = module
+
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self.__name__!r} ({state})>'
+
+
+def lazy_import(name: str, *submodules: str) -> types.ModuleType:
+    """
+    :param name: module name
+    :param submodules: full names of submodules imported along with the module, as in 'pyarrow.parquet'
+    :return: the module, if already imported, a placeholder importing it on first use otherwise
+    """
+    module = sys.modules.get(name)
+    if module is not None and all(submodule in sys.modules for submodule in submodules):
+        return module
+
+    return _LazyModule(name, submodules)
@@ -0,0 +1,327 @@
+"""
+Crawl metrics.
+
+Each stage of the crawls (throttling, network, parsing, writing...) is timed into a latency histogram, next
+to counters for pages and bytes fetched, cache hits and misses, parse failures and rows written. A background
+thread logs a summary line at regular intervals and rewrites a Prometheus text file, as read by the node
+exporter textfile collector:
+
+    >>> start_reporting(interval=60., metrics_filename='output/crawl.prom')
+    >>> with stage('parse'):
+    ...     rows = parse_results(html_text)
+    >>> increment('parse_failures')
+    >>> stop_reporting()
+
+Hot loops can also be profiled with cProfile, or pyinstrument when installed. Only the calling thread is
+profiled, work done by pools of threads or processes is not:
+
+    >>> with profiled('load-pages', 'cprofile', output_dir='output'):
+    ...     load_pages(...)
+
+"""
+import bisect
+import contextlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+__all__ = ['Metrics', 'Histogram', 'PROFILERS', 'get_metrics', 'stage', 'observe', 'increment',
+           'start_reporting', 'stop_reporting', 'profiled']
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# upper bounds in seconds of the histogram buckets
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., float('inf'))
+
+_PREFIX = 'shipsdb'
+
+# counters shown in summaries, in that order
+_COUNTERS = {
+    'pages_fetched': 'Pages downloaded from remote hosts',
+    'bytes_fetched': 'Bytes downloaded from remote hosts',
+    'fetch_retries': 'Failed requests retried',
+    'cache_hits': 'Pages served by the url cache',
+    'cache_misses': 'Pages missing from the url cache',
+    'parse_failures': 'Pages whose format could not be parsed',
+    'rows_written': 'Rows written to outputs',
+}
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(_BUCKETS)
+        self.total = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated by linear interpolation within the bucket holding the quantile.
+        """
+        if self.count == 0:
+            return float('nan')
+
+        rank = q * self.count
+        cumulated = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count > 0 and cumulated + bucket_count >= rank:
+                lower = _BUCKETS[index - 1] if index > 0 else 0.
+                upper = _BUCKETS[index] if index < len(_BUCKETS) - 1 else lower
+                return lower + (upper - lower) * (rank - cumulated) / bucket_count
+
+            cumulated += bucket_count
+
+        return _BUCKETS[-2]
+
+    def copy(self) -> 'Histogram':
+        histogram = Histogram()
+        histogram.counts = list(self.counts)
+        histogram.total = self.total
+        histogram.count = self.count
+        return histogram
+
+
+def _format_size(size: float) -> str:
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+
+        size /= 1024.
+
+    return f'{size:.1f} TB'
+
+
+def _format_seconds(seconds: float) -> str:
+    return f'{seconds * 1000.:.0f}ms' if seconds < 1. else f'{seconds:.1f}s'
+
+
+class Metrics(object):
+    """
+    Thread-safe registry of counters and stage histograms.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = dict()
+        self._started = time.monotonic()
+
+    def observe(self, stage_name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(stage_name)
+            if histogram is None:
+                histogram = Histogram()
+                self._histograms[stage_name] = histogram
+
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1.):
+        with self._lock:
+            self._counters[name] += amount
+
+    @contextlib.contextmanager
+    def stage(self, stage_name: str):
+        """
+        Times the enclosed block into the stage histogram, including when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+
+        finally:
+            self.observe(stage_name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        :return: elapsed seconds since creation, copies of the counters and of the histograms
+        """
+        with self._lock:
+            return (time.monotonic() - self._started, dict(self._counters),
+                    {name: histogram.copy() for name, histogram in self._histograms.items()})
+
+    def summary(self) -> str:
+        elapsed, counters, histograms = self.snapshot()
+        pages = counters.get('pages_fetched', 0)
+        hits, misses = counters.get('cache_hits', 0), counters.get('cache_misses', 0)
+        parts = [f'{pages:.0f} pages fetched ({pages / elapsed if elapsed else 0.:.2f}/s)',
+                 f'{_format_size(counters.get("bytes_fetched", 0))}']
+        if hits + misses > 0:
+            parts.append(f'cache hits {hits / (hits + misses):.1%} ({hits:.0f}/{hits + misses:.0f})')
+
+        parts.extend(f'{name.replace("_", " ")}: {counters[name]:.0f}' for name in _COUNTERS
+                     if name not in ('pages_fetched', 'bytes_fetched', 'cache_hits', 'cache_misses') and
+                     counters.get(name))
+        stages = [f'{name} n={histogram.count} p50={_format_seconds(histogram.quantile(0.5))} '
+                  f'p95={_format_seconds(histogram.quantile(0.95))} total={_format_seconds(histogram.total)}'
+                  for name, histogram in sorted(histograms.items())]
+        return ', '.join(parts) + (' | ' + ', '.join(stages) if stages else '')
+
+    def prometheus(self) -> str:
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        elapsed, counters, histograms = self.snapshot()
+        lines = list()
+        for name in sorted(set(_COUNTERS) | set(counters)):
+            metric = f'{_PREFIX}_{name}_total'
+            lines.append(f'# HELP {metric} {_COUNTERS.get(name, name.replace("_", " "))}')
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {counters.get(name, 0):g}')
+
+        metric = f'{_PREFIX}_stage_seconds'
+        lines.append(f'# HELP {metric} Time spent per crawl stage')
+        lines.append(f'# TYPE {metric} histogram')
+        for name, histogram in sorted(histograms.items()):
+            cumulated = 0
+            for upper, bucket_count in zip(_BUCKETS, histogram.counts):
+                cumulated += bucket_count
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{"+Inf" if upper == float("inf") else upper}"}} '
+                             f'{cumulated}')
+
+            lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.total:g}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+
+        lines.append(f'# HELP {_PREFIX}_uptime_seconds Time since the metrics were started')
+        lines.append(f'# TYPE {_PREFIX}_uptime_seconds gauge')
+        lines.append(f'{_PREFIX}_uptime_seconds {elapsed:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename: str):
+        with open(filename + '.tmp', 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(self.prometheus())
+
+        os.replace(filename + '.tmp', filename)
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def stage(stage_name: str):
+    return _metrics.stage(stage_name)
+
+
+def observe(stage_name: str, seconds: float):
+    _metrics.observe(stage_name, seconds)
+
+
+def increment(name: str, amount: float = 1.):
+    _metrics.increment(name, amount)
+
+
+class _Reporter(threading.Thread):
+
+    def __init__(self, interval: float, metrics_filename: Optional[str]):
+        super().__init__(name='metrics-reporter', daemon=True)
+        self._interval = interval
+        self._metrics_filename = metrics_filename
+        self._stopped = threading.Event()
+
+    def report(self):
+        logging.info('metrics: %s', _metrics.summary())
+        if self._metrics_filename is not None:
+            _metrics.write_prometheus(self._metrics_filename)
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.report()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.report()
+
+
+_reporter = None
+
+
+def start_reporting(interval: float = 60., metrics_filename: Optional[str] = None):
+    """
+    Logs a summary and rewrites the Prometheus text file, if specified, at regular intervals.
+
+    :param interval: seconds between two reports
+    :param metrics_filename: location of the Prometheus text file
+    """
+    global _reporter
+    stop_reporting()
+    _reporter = _Reporter(interval, metrics_filename)
+    _reporter.start()
+
+
+def stop_reporting():
+    """
+    Stops the periodic reports, after a final one.
+    """
+    global _reporter
+    if _reporter is not None:
+        _reporter.stop()
+        _reporter = None
+
+
+@contextlib.contextmanager
+def profiled(name: str, profiler: Optional[str] = None, output_dir: str = '.'):
+    """
+    Profiles the enclosed block, the report being logged and saved as <output dir>/<name>.prof (cProfile)
+    or <output dir>/<name>.html (pyinstrument).
+
+    :param name: name of the profiled section
+    :param profiler: one of PROFILERS, no profiling if None
+    :param output_dir: location of the saved report
+    """
+    if profiler is None:
+        yield
+        return
+
+    if profiler == 'cprofile':
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+
+        finally:
+            profile.disable()
+            filename = os.path.sep.join([output_dir, f'{name}.prof'])
+            profile.dump_stats(filename)
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(20)
+            logging.info('profile of %s saved to "%s":\n%s', name, filename, report.getvalue())
+
+    elif profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+
+        except ImportError:
+            logging.warning('pyinstrument is not installed, %s is not profiled', name)
+            yield
+            return
+
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+
+        finally:
+            profile.stop()
+            filename = os.path.sep.join([output_dir, f'{name}.html'])
+            with open(filename, 'w', encoding='utf-8') as report_file:
+                report_file.write(profile.output_html())
+
+            logging.info('profile of %s saved to "%s":\n%s', name, filename, profile.output_text())
+
+    else:
+        raise ValueError(f'unknown profiler "{profiler}", expecting one of {PROFILERS}')
@@ -0,0 +1,213 @@
+"""
+Compressed page cache stored in a single SQLite file.
+
+Each page is zlib-compressed and indexed by its url. Entries expire after a time-to-live that depends
+on the kind of page: map positions and vessel details pages, which include the last AIS report, are only
+valid for a few minutes, whereas search results can be reused for days. Static vessel particulars are
+kept for days by the incremental mode of download-vessels-details instead. The cache is bounded in size,
+least recently used entries are evicted first.
+
+    >>> cache = PageCache('output/urlcaching.sqlite', max_size=512 * 1024 ** 2)
+    >>> cache.put(url, html_text)
+    >>> html_text = cache.get(url)
+
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Pattern, Tuple
+
+__all__ = ['PageCache', 'DEFAULT_TTL_RULES']
+
+_DAY = 24 * 3600
+
+DEFAULT_TTL_RULES = [
+    ('positions', re.compile(r'/get_data_json/|/vesselsonmap|/get_info_window_json'), 5 * 60),
+    # details pages carry the AIS position, course, speed and current draught of the vessel
+    ('details', re.compile(r'/vessels/details/'), 15 * 60),
+    ('search', re.compile(r'/vessels(\?|$)'), 2 * _DAY),
+]
+
+_DEFAULT_TTL = ('other', 10 * _DAY)
+
+_DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed);
+CREATE INDEX IF NOT EXISTS pages_expires ON pages (expires);
+'''
+
+
+class PageCache(object):
+    """
+    Thread-safe: a single connection is shared behind a lock.
+    """
+
+    def __init__(self, filename: str, max_size: Optional[int] = _DEFAULT_MAX_SIZE,
+                 ttl_rules: Optional[List[Tuple[str, Pattern, float]]] = None,
+                 default_ttl: Tuple[str, float] = _DEFAULT_TTL):
+        """
+
+        :param filename: location of the SQLite file, created if missing
+        :param max_size: maximum amount of compressed bytes kept, unbounded if None
+        :param ttl_rules: list of (page kind, url pattern, time-to-live in seconds), first match applies
+        :param default_ttl: (page kind, time-to-live in seconds) for urls not matching any rule
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.filename = filename
+        self._max_size = max_size
+        self._ttl_rules = DEFAULT_TTL_RULES if ttl_rules is None else ttl_rules
+        self._default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+        self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def get_ttl(self, key: str) -> Tuple[str, float]:
+        """
+        :param key: url
+        :return: page kind and time-to-live in seconds
+        """
+        for kind, pattern, ttl in self._ttl_rules:
+            if pattern.search(key):
+                return kind, ttl
+
+        return self._default_ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        :param key: url
+        :return: cached content, None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute('SELECT content, expires FROM pages WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] < now:
+                return None
+
+            self._connection.execute('UPDATE pages SET accessed = ? WHERE key = ?', (now, key))
+
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._connection.execute('SELECT expires FROM pages WHERE key = ?', (key,)).fetchone()
+
+        return row is not None and row[0] >= time.time()
+
+    def put(self, key: str, content: str, ttl: Optional[float] = None):
+        """
+        :param key: url
+        :param content: page content
+        :param ttl: time-to-live in seconds, overrides the rules
+        """
+        kind, rule_ttl = self.get_ttl(key)
+        raw_content = content.encode('utf-8')
+        compressed = zlib.compress(raw_content)
+        now = time.time()
+        expires = now + (rule_ttl if ttl is None else ttl)
+        with self._lock:
+            with self._connection:
+                self._connection.execute('BEGIN')
+                previous = self._connection.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+                self._connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                         (key, kind, compressed, len(compressed), len(raw_content), now, now, expires))
+
+            self._size += len(compressed) - (previous[0] if previous else 0)
+            if self._max_size is not None and self._size > self._max_size:
+                self._evict(int(0.9 * self._max_size))
+
+    def delete(self, key: str):
+        with self._lock:
+            with self._connection:
+                self._connection.execute('BEGIN')
+                previous = self._connection.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+                self._connection.execute('DELETE FROM pages WHERE key = ?', (key,))
+
+            self._size -= previous[0] if previous else 0
+
+    def _evict(self, target_size: int) -> int:
+        """
+        Removes least recently used entries until the cache fits the target size, lock must be held.
+        """
+        excess = self._size - target_size
+        if excess <= 0:
+            return 0
+
+        evicted_keys = list()
+        freed = 0
+        for key, size in self._connection.execute('SELECT key, size FROM pages ORDER BY accessed'):
+            evicted_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+
+        with self._connection:
+            self._connection.execute('BEGIN')
+            self._connection.executemany('DELETE FROM pages WHERE key = ?', evicted_keys)
+
+        self._size -= freed
+        logging.debug('evicted %d cache entries (%d bytes)', len(evicted_keys), freed)
+        return len(evicted_keys)
+
+    def prune(self, max_size: Optional[int] = None, vacuum: bool = False) -> Tuple[int, int]:
+        """
+        Removes expired entries, then least recently used ones above the size limit.
+
+        :param max_size: size limit in bytes, defaults to the cache limit
+        :param vacuum: reclaims the freed disk space
+        :return: number of expired entries removed, number of entries evicted
+        """
+        max_size = self._max_size if max_size is None else max_size
+        with self._lock:
+            with self._connection:
+                self._connection.execute('BEGIN')
+                expired = self._connection.execute('DELETE FROM pages WHERE expires < ?', (time.time(),)).rowcount
+
+            self._size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+            evicted = 0 if max_size is None else self._evict(max_size)
+            if vacuum:
+                self._connection.execute('VACUUM')
+
+        return expired, evicted
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            rows = self._connection.execute('SELECT kind, COUNT(*), SUM(expires < ?), SUM(size), SUM(raw_size) '
+                                            'FROM pages GROUP BY kind ORDER BY kind', (now,)).fetchall()
+
+        kinds = {kind: {'entries': count, 'expired': expired, 'size': size, 'raw_size': raw_size}
+                 for kind, count, expired, size, raw_size in rows}
+        return {
+            'filename': self.filename,
+            'file_size': sum(os.path.getsize(self.filename + suffix) for suffix in ('', '-wal')
+                             if os.path.exists(self.filename + suffix)),
+            'entries': sum(kind['entries'] for kind in kinds.values()),
+            'size': self._size,
+            'max_size': self._max_size,
+            'kinds': kinds,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
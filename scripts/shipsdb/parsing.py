@@ -0,0 +1,329 @@
+"""
+Parsing of the vesselfinder pages.
+
+Two interchangeable backends are available:
+    - lxml: fast default, relying on the libxml2 HTML parser and XPath
+    - bs4: original BeautifulSoup implementation, kept as a reference
+
+Both produce the same output for a given page:
+    >>> parser = get_parser('lxml')
+    >>> vessels, page_last = parser.parse_results(html_text)
+    >>> params = parser.parse_details(html_text)
+
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import lxml.html
+
+except ImportError:
+    lxml = None
+
+from shipsdb.lazy import lazy_import
+
+bs4 = lazy_import('bs4')
+
+
+__all__ = ['get_parser', 'available_parsers', 'DEFAULT_PARSER']
+
+_HIDDEN_VALUES = ('PREMIUM USERS ONLY', 'N/A')
+
+
+def _parse_int(text: Optional[str]) -> Optional[int]:
+    if text is None:
+        return None
+
+    value = text.strip().replace(',', '')
+    if value.isdigit():
+        return int(value)
+
+    return None
+
+
+def _build_vessel_row(flag: Optional[str], name: Optional[str], vessel_type: Optional[str], href: Optional[str],
+                      year_built: Optional[str], gross_tons: Optional[str], dead_weight_tons: Optional[str],
+                      size: Optional[str]) -> Dict:
+    """
+    Converts the raw strings extracted from a row of the results table.
+    """
+    row_data = dict()
+    if flag is not None:
+        row_data['country'] = flag.strip()
+
+    if name is not None:
+        row_data['name'] = name.strip()
+
+    if vessel_type is not None:
+        row_data['type'] = vessel_type.strip()
+
+    if href is not None:
+        row_data['imo'] = href.split('/')[-1]
+
+    for field_name, field_value in (('year-built', year_built),
+                                    ('gross-tons', gross_tons),
+                                    ('dead-weight-tons', dead_weight_tons)):
+        value = _parse_int(field_value)
+        if value is not None:
+            row_data[field_name] = value
+
+    if size is not None and '/' in size:
+        length, width = size.split('/')
+        length, width = _parse_int(length), _parse_int(width)
+        if length is not None:
+            row_data['length_meters'] = length
+
+        if width is not None:
+            row_data['width_meters'] = width
+
+    return row_data
+
+
+def _parse_page_last(pagination_text: Optional[str]) -> Optional[int]:
+    if pagination_text and '/' in pagination_text:
+        _, total = pagination_text.split('/')
+        return _parse_int(total)
+
+    return None
+
+
+def _clean_param(name: str, value: str) -> Tuple[str, str]:
+    value = value.strip()
+    if value.upper() in _HIDDEN_VALUES:
+        value = ''
+
+    return name.replace(':', ''), value
+
+
+def _new_params():
+    return defaultdict(lambda: None)
+
+
+class SoupParser(object):
+    """
+    BeautifulSoup backend, building the full document tree.
+    """
+
+    name = 'bs4'
+
+    @staticmethod
+    def parse_results(html_text: str) -> Tuple[List[Dict], Optional[int]]:
+        html = bs4.BeautifulSoup(html_text, 'html.parser')
+        ships = html.find('table', {'class': 'results'})
+        page_content = list()
+        for ship_row in ships.find('tbody').find_all('tr'):
+            field1 = ship_row.find('td', {'class': 'v2'})
+            flag, name, vessel_type, href = None, None, None, None
+            if field1:
+                flag_tag = field1.find('div', {'class': 'flag-icon'})
+                if flag_tag:
+                    flag = flag_tag.get('title')
+
+                name_tag = field1.find('div', {'class': 'slna'})
+                if name_tag:
+                    name = name_tag.text
+
+                type_tag = field1.find('div', {'class': 'slty'})
+                if type_tag:
+                    vessel_type = type_tag.text
+
+                href = field1.find('a').get('href')
+
+            fields = [ship_row.find('td', {'class': css_class}) for css_class in ('v3', 'v4', 'v5', 'v6')]
+            year_built, gross_tons, dead_weight_tons, size = [field.text if field else None for field in fields]
+            page_content.append(_build_vessel_row(flag, name, vessel_type, href,
+                                                  year_built, gross_tons, dead_weight_tons, size))
+
+        pagination = html.find('div', {'class': 'pagination-controls'}).find('span')
+        return page_content, _parse_page_last(pagination.text if pagination else None)
+
+    @staticmethod
+    def parse_details(html_text: str) -> Optional[Dict]:
+        html = bs4.BeautifulSoup(html_text, 'html.parser')
+        ais_data = html.find('div', {'id': 'ais-data'})
+        if ais_data is None:
+            return None
+
+        params = _new_params()
+        for param in ais_data.find_all('div', {'class': 'row param'}):
+            column_name_tag = param.find('span', {'itemprop': 'name'})
+            column_value_tag = param.find('span', {'itemprop': 'value'})
+            if column_name_tag and column_value_tag:
+                params[str(column_name_tag.text)] = str(column_value_tag.text.strip())
+
+            else:
+                column_name_tag = param.find('span', {'class': 'name'})
+                column_value_tag = param.find('span', {'class': 'value'})
+                if column_name_tag and column_value_tag:
+                    column_name, column_value = _clean_param(column_name_tag.text, column_value_tag.text)
+                    params[str(column_name)] = str(column_value)
+
+        def find_param(param_field):
+            def inner(tag):
+                if tag.name in ('div', 'span'):
+                    for attr in tag.attrs:
+                        if param_field in tag[attr]:
+                            return True
+
+                return False
+
+            return inner
+
+        master_data = html.find('section', {'id': 'master-data'})
+        if master_data is not None:
+            for param in master_data.find_all('div', {'class': 'row param'}):
+                column_name_tag = param.find(find_param('name'))
+                column_value_tag = param.find(find_param('value'))
+                if column_name_tag and column_value_tag:
+                    column_name, column_value = _clean_param(column_name_tag.text, column_value_tag.text)
+                    params[str(column_name)] = str(column_value)
+
+        last_report_ts = None
+        last_report_tag = html.find('time', {'id': 'last_report_ts'})
+        if last_report_tag is not None:
+            last_report_ts = last_report_tag.contents[0]
+
+        params['last_report_ts'] = str(last_report_ts)
+        return params
+
+
+def _has_class(css_class: str) -> str:
+    return f'contains(concat(" ", normalize-space(@class), " "), " {css_class} ")'
+
+
+class LxmlParser(object):
+    """
+    lxml backend, only visiting the nodes of interest through precompiled XPath expressions.
+    """
+
+    name = 'lxml'
+
+    if lxml is not None:
+        _XPATH_RESULTS_ROWS = lxml.etree.XPath(f'//table[{_has_class("results")}]/tbody/tr')
+        _XPATH_RESULTS_CELLS = {css_class: lxml.etree.XPath(f'td[{_has_class(css_class)}]')
+                                for css_class in ('v2', 'v3', 'v4', 'v5', 'v6')}
+        _XPATH_FLAG = lxml.etree.XPath(f'.//div[{_has_class("flag-icon")}]')
+        _XPATH_VESSEL_NAME = lxml.etree.XPath(f'.//div[{_has_class("slna")}]')
+        _XPATH_VESSEL_TYPE = lxml.etree.XPath(f'.//div[{_has_class("slty")}]')
+        _XPATH_LINK = lxml.etree.XPath('.//a')
+        _XPATH_PAGINATION = lxml.etree.XPath(f'//div[{_has_class("pagination-controls")}]//span')
+        _XPATH_AIS_DATA = lxml.etree.XPath('//div[@id="ais-data"]')
+        _XPATH_MASTER_DATA = lxml.etree.XPath('//section[@id="master-data"]')
+        _XPATH_PARAMS = lxml.etree.XPath('.//div[@class="row param"]')
+        _XPATH_LAST_REPORT = lxml.etree.XPath('//time[@id="last_report_ts"]')
+        _XPATH_ITEMPROP_NAME = lxml.etree.XPath('.//span[@itemprop="name"]')
+        _XPATH_ITEMPROP_VALUE = lxml.etree.XPath('.//span[@itemprop="value"]')
+        _XPATH_SPAN_NAME = lxml.etree.XPath(f'.//span[{_has_class("name")}]')
+        _XPATH_SPAN_VALUE = lxml.etree.XPath(f'.//span[{_has_class("value")}]')
+
+    @staticmethod
+    def _find(element, xpath):
+        found = xpath(element)
+        return found[0] if found else None
+
+    @staticmethod
+    def _text(element) -> Optional[str]:
+        return None if element is None else str(element.text_content())
+
+    @staticmethod
+    def _matches_attribute(tag, param_field: str) -> bool:
+        for attr_name, attr_value in tag.attrib.items():
+            if attr_name == 'class':
+                if param_field in attr_value.split():
+                    return True
+
+            elif param_field in attr_value:
+                return True
+
+        return False
+
+    @classmethod
+    def parse_results(cls, html_text: str) -> Tuple[List[Dict], Optional[int]]:
+        html = lxml.html.document_fromstring(html_text)
+        page_content = list()
+        for ship_row in cls._XPATH_RESULTS_ROWS(html):
+            field1 = cls._find(ship_row, cls._XPATH_RESULTS_CELLS['v2'])
+            flag, name, vessel_type, href = None, None, None, None
+            if field1 is not None:
+                flag_tag = cls._find(field1, cls._XPATH_FLAG)
+                if flag_tag is not None:
+                    flag = flag_tag.get('title')
+
+                name = cls._text(cls._find(field1, cls._XPATH_VESSEL_NAME))
+                vessel_type = cls._text(cls._find(field1, cls._XPATH_VESSEL_TYPE))
+                href = cls._find(field1, cls._XPATH_LINK).get('href')
+
+            year_built, gross_tons, dead_weight_tons, size = [cls._text(cls._find(ship_row, cls._XPATH_RESULTS_CELLS[css_class]))
+                                                              for css_class in ('v3', 'v4', 'v5', 'v6')]
+            page_content.append(_build_vessel_row(flag, name, vessel_type, href,
+                                                  year_built, gross_tons, dead_weight_tons, size))
+
+        return page_content, _parse_page_last(cls._text(cls._find(html, cls._XPATH_PAGINATION)))
+
+    @classmethod
+    def parse_details(cls, html_text: str) -> Optional[Dict]:
+        html = lxml.html.document_fromstring(html_text)
+        ais_data = cls._XPATH_AIS_DATA(html)
+        if not ais_data:
+            return None
+
+        params = _new_params()
+        for param in cls._XPATH_PARAMS(ais_data[0]):
+            column_name_tag = cls._find(param, cls._XPATH_ITEMPROP_NAME)
+            column_value_tag = cls._find(param, cls._XPATH_ITEMPROP_VALUE)
+            if column_name_tag is not None and column_value_tag is not None:
+                params[cls._text(column_name_tag)] = cls._text(column_value_tag).strip()
+
+            else:
+                column_name_tag = cls._find(param, cls._XPATH_SPAN_NAME)
+                column_value_tag = cls._find(param, cls._XPATH_SPAN_VALUE)
+                if column_name_tag is not None and column_value_tag is not None:
+                    column_name, column_value = _clean_param(cls._text(column_name_tag), cls._text(column_value_tag))
+                    params[column_name] = column_value
+
+        for master_data in cls._XPATH_MASTER_DATA(html)[:1]:
+            for param in cls._XPATH_PARAMS(master_data):
+                column_name_tag, column_value_tag = None, None
+                for tag in param.iterdescendants('div', 'span'):
+                    if column_name_tag is None and cls._matches_attribute(tag, 'name'):
+                        column_name_tag = tag
+
+                    if column_value_tag is None and cls._matches_attribute(tag, 'value'):
+                        column_value_tag = tag
+
+                if column_name_tag is not None and column_value_tag is not None:
+                    column_name, column_value = _clean_param(cls._text(column_name_tag), cls._text(column_value_tag))
+                    params[column_name] = column_value
+
+        last_report_ts = None
+        last_report_tag = cls._XPATH_LAST_REPORT(html)
+        if last_report_tag:
+            last_report_ts = last_report_tag[0].text
+
+        params['last_report_ts'] = str(last_report_ts)
+        return params
+
+
+_PARSERS = {parser.name: parser for parser in (LxmlParser, SoupParser)}
+
+DEFAULT_PARSER = LxmlParser.name if lxml is not None else SoupParser.name
+
+
+def available_parsers() -> List[str]:
+    return [name for name in _PARSERS if name != LxmlParser.name or lxml is not None]
+
+
+def get_parser(name: Optional[str] = None):
+    """
+    :param name: backend name, defaults to lxml when installed
+    :return: parser backend
+    """
+    if name is None:
+        name = DEFAULT_PARSER
+
+    if name not in available_parsers():
+        logging.warning('parser "%s" not available, falling back to "%s"', name, DEFAULT_PARSER)
+        name = DEFAULT_PARSER
+
+    return _PARSERS[name]
@@ -0,0 +1,609 @@
+"""
+Vessel positions store, partitioned by tracking zone and UTC day:
+    <root>/<zone>/<YYYY-MM-DD>/pending.bin               records appended since the last compaction
+    <root>/<zone>/<YYYY-MM-DD>/pending.compacting        records being merged by a compaction
+    <root>/<zone>/<YYYY-MM-DD>/compacted/<column>.npy    one array per column, sorted by grid cell then timestamp
+    <root>/<zone>/<YYYY-MM-DD>/compacted/index.npz       grid cell and IMO indexes, partition bounds
+    <root>/<zone>/<YYYY-MM-DD>/compacted/strings.json    names and destinations referenced by the text columns
+    <root>/<zone>/<YYYY-MM-DD>/keyframe-<received>.npy   state of all vessels of the zone at a poll time
+
+Records without coordinates mark vessels no longer reported in their zone: they are left out of queries
+but used, together with keyframes, to rebuild the state of a zone at any time with snapshot().
+
+A compaction renames the pending file before merging it and marks the compacted directory replacing the
+previous one, so that a compaction interrupted at any point is either completed or started over by the
+next one, without losing or duplicating records.
+
+Coordinates and speeds are float32, timestamps int32 epoch seconds. Compacted columns are memory mapped:
+box queries only read the rows of the grid cells overlapping the box and vessel tracks only the rows of
+that vessel, so that they do not depend on the amount of history kept.
+
+    >>> store = PositionStore('output/positions')
+    >>> store.append('Houston', positions)
+    >>> store.compact()
+    >>> tankers = store.query(box=(-95.45, 28.70, -93.60, 29.83), start=t1, end=t2, ship_types=[8])
+    >>> track = store.track(9330812, start=t2 - 7 * 86400)
+    >>> vessels = store.snapshot('Houston', t2)
+
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy
+
+from shipsdb.lazy import lazy_import
+
+pandas = lazy_import('pandas')
+
+__all__ = ['POSITION_FIELDS', 'RECORD_DTYPE', 'PositionStore', 'to_records', 'vessel_keys', 'grid_cell', 'zone_slug']
+
+POSITION_FIELDS = ['timestamp', 'received', 'ship_id', 'mmsi', 'imo', 'name', 'ship_type', 'lat', 'lon',
+                   'speed', 'course', 'heading', 'draught', 'destination']
+
+RECORD_DTYPE = numpy.dtype([
+    ('timestamp', '<i4'),
+    ('received', '<i4'),
+    ('ship_id', '<i4'),
+    ('mmsi', '<i4'),
+    ('imo', '<i4'),
+    ('ship_type', '<i2'),
+    ('lat', '<f4'),
+    ('lon', '<f4'),
+    ('speed', '<f4'),
+    ('course', '<f4'),
+    ('heading', '<f4'),
+    ('draught', '<f4'),
+    ('name', 'S32'),
+    ('destination', 'S32'),
+])
+
+_TEXT_COLUMNS = ('name', 'destination')
+_INTEGER_COLUMNS = ('timestamp', 'received', 'ship_id', 'mmsi', 'imo', 'ship_type')
+_NUMERIC_COLUMNS = [name for name in RECORD_DTYPE.names if name not in _TEXT_COLUMNS]
+
+# side in degrees of the grid cells used for the spatial index
+_CELL_SIZE = 0.1
+_GRID_COLUMNS = int(round(360. / _CELL_SIZE))
+
+_SECONDS_PER_DAY = 86400
+
+_PENDING_FILENAME = 'pending.bin'
+_MERGING_FILENAME = 'pending.compacting'
+# written in the compacted directory along with the merged records, removed once the merged file is deleted
+_MERGED_MARKER = 'pending.merged'
+
+
+def zone_slug(zone: str) -> str:
+    return zone.lower().replace(' ', '-')
+
+
+def grid_cell(lat, lon) -> numpy.ndarray:
+    """
+    :return: index of the grid cells containing the coordinates, increasing with longitude within a latitude row
+    """
+    row = numpy.floor((numpy.asarray(lat, dtype=numpy.float64) + 90.) / _CELL_SIZE).astype(numpy.int32)
+    column = numpy.floor((numpy.asarray(lon, dtype=numpy.float64) + 180.) / _CELL_SIZE).astype(numpy.int32)
+    return row * _GRID_COLUMNS + numpy.clip(column, 0, _GRID_COLUMNS - 1)
+
+
+def _as_int(value) -> int:
+    try:
+        return int(value)
+
+    except (TypeError, ValueError):
+        return 0
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value)
+
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def to_records(positions: Iterable[Dict]) -> numpy.ndarray:
+    """
+    Converts position dicts with POSITION_FIELDS keys into a record array, missing identifiers becoming 0
+    and missing measures NaN.
+    """
+    positions = list(positions)
+    records = numpy.zeros(len(positions), dtype=RECORD_DTYPE)
+    for name in _NUMERIC_COLUMNS:
+        convert = _as_int if name in _INTEGER_COLUMNS else _as_float
+        records[name] = [convert(position.get(name)) for position in positions]
+
+    for name in _TEXT_COLUMNS:
+        records[name] = [(position.get(name) or '').encode('utf-8')[:RECORD_DTYPE[name].itemsize]
+                         for position in positions]
+
+    return records
+
+
+def vessel_keys(records) -> numpy.ndarray:
+    """
+    :return: identifiers of the vessels, the site ship id or the negated MMSI when missing
+    """
+    ship_id = numpy.asarray(records['ship_id'], dtype=numpy.int64)
+    return numpy.where(ship_id != 0, ship_id, -numpy.asarray(records['mmsi'], dtype=numpy.int64))
+
+
+def _decode(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.char.decode(values, 'utf-8', errors='ignore').astype(object)
+
+
+def _day(timestamp: int) -> datetime.date:
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=int(timestamp) // _SECONDS_PER_DAY)
+
+
+class _Partition(object):
+    """
+    Compacted positions of a zone for a single day, columns being memory mapped on first use.
+    """
+
+    def __init__(self, compacted_dir: str):
+        self._dir = compacted_dir
+        self._columns = dict()
+        with numpy.load(os.path.sep.join([compacted_dir, 'index.npz'])) as index:
+            self.cells = index['cells']
+            self.cell_starts = index['cell_starts']
+            self.imos = index['imos']
+            self.imo_starts = index['imo_starts']
+            self.imo_order = index['imo_order']
+            self.bounds = tuple(index['bounds'])
+
+        with open(os.path.sep.join([compacted_dir, 'strings.json']), 'r', encoding='utf-8') as strings_file:
+            self.strings = {name: numpy.array(values, dtype=object)
+                            for name, values in json.load(strings_file).items()}
+
+    def column(self, name: str) -> numpy.ndarray:
+        if name not in self._columns:
+            self._columns[name] = numpy.load(os.path.sep.join([self._dir, f'{name}.npy']), mmap_mode='r')
+
+        return self._columns[name]
+
+    def box_rows(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> numpy.ndarray:
+        """
+        :return: rows of the cells overlapping the box, to be filtered further on exact coordinates
+        """
+        if not (self.bounds[0] <= max_lon and min_lon <= self.bounds[2] and
+                self.bounds[1] <= max_lat and min_lat <= self.bounds[3]):
+            return numpy.empty(0, dtype=numpy.int64)
+
+        low_cell, high_cell = grid_cell([min_lat, max_lat], [min_lon, max_lon])
+        low_column = low_cell % _GRID_COLUMNS
+        high_column = high_cell % _GRID_COLUMNS
+        row_starts = numpy.arange(low_cell // _GRID_COLUMNS, high_cell // _GRID_COLUMNS + 1) * _GRID_COLUMNS
+        first = numpy.searchsorted(self.cells, row_starts + low_column, side='left')
+        last = numpy.searchsorted(self.cells, row_starts + high_column, side='right')
+        ranges = [(self.cell_starts[start], self.cell_starts[end]) for start, end in zip(first, last) if end > start]
+        if not ranges:
+            return numpy.empty(0, dtype=numpy.int64)
+
+        return numpy.concatenate([numpy.arange(start, end) for start, end in ranges])
+
+    def imo_rows(self, imo: int) -> numpy.ndarray:
+        """
+        :return: rows of the vessel, by increasing timestamp
+        """
+        position = numpy.searchsorted(self.imos, imo)
+        if position == len(self.imos) or self.imos[position] != imo:
+            return numpy.empty(0, dtype=numpy.int64)
+
+        return self.imo_order[self.imo_starts[position]:self.imo_starts[position + 1]]
+
+    def records(self, rows: Optional[numpy.ndarray] = None) -> Dict[str, numpy.ndarray]:
+        selected = dict()
+        for name in POSITION_FIELDS:
+            values = self.column(name)
+            values = values[rows] if rows is not None else numpy.asarray(values)
+            if name in _TEXT_COLUMNS:
+                values = self.strings[name][values]
+
+            selected[name] = values
+
+        return selected
+
+
+class PositionStore(object):
+
+    def __init__(self, root: str):
+        """
+
+        :param root: location of the store
+        """
+        self._root = root
+        self._lock = threading.RLock()
+        # compactions only hold the store lock to swap files, so that appends and queries are not blocked by them
+        self._compaction_lock = threading.Lock()
+        self._partitions = dict()
+
+    def _partition_dir(self, zone: str, day: datetime.date) -> str:
+        return os.path.sep.join([self._root, zone_slug(zone), day.isoformat()])
+
+    def append(self, zone: str, positions: Iterable[Dict]) -> int:
+        """
+        :param zone: name of the tracking zone
+        :param positions: records with POSITION_FIELDS keys, timestamps in epoch seconds
+        :return: number of records written
+        """
+        return self.append_records(zone, to_records(positions))
+
+    def append_records(self, zone: str, records: numpy.ndarray) -> int:
+        """
+        Appends records with RECORD_DTYPE to the pending file of their day, cheap enough to be done on each poll.
+
+        :return: number of records written
+        """
+        days = records['timestamp'] // _SECONDS_PER_DAY
+        with self._lock:
+            for day in numpy.unique(days):
+                partition_dir = self._partition_dir(zone, _day(day * _SECONDS_PER_DAY))
+                os.makedirs(partition_dir, exist_ok=True)
+                with open(os.path.sep.join([partition_dir, _PENDING_FILENAME]), 'ab') as pending_file:
+                    records[days == day].tofile(pending_file)
+
+        return len(records)
+
+    def partitions(self, zones: Optional[Sequence[str]] = None, start: Optional[int] = None,
+                   end: Optional[int] = None) -> List[Tuple[str, datetime.date]]:
+        """
+        :return: (zone slug, day) of the partitions overlapping the time range, in chronological order
+        """
+        if not os.path.exists(self._root):
+            return list()
+
+        zone_dirs = sorted(os.listdir(self._root)) if zones is None else [zone_slug(zone) for zone in zones]
+        first_day = _day(start) if start is not None else datetime.date.min
+        last_day = _day(end) if end is not None else datetime.date.max
+        partitions = list()
+        for zone_dir in zone_dirs:
+            zone_path = os.path.sep.join([self._root, zone_dir])
+            if not os.path.isdir(zone_path):
+                continue
+
+            for day_dir in os.listdir(zone_path):
+                if not os.path.isdir(os.path.sep.join([zone_path, day_dir])):
+                    continue
+
+                day = datetime.date.fromisoformat(day_dir)
+                if first_day <= day <= last_day:
+                    partitions.append((zone_dir, day))
+
+        return sorted(partitions, key=lambda partition: (partition[1], partition[0]))
+
+    @staticmethod
+    def _read_records(filename: str) -> numpy.ndarray:
+        if not os.path.exists(filename):
+            return numpy.empty(0, dtype=RECORD_DTYPE)
+
+        with open(filename, 'rb') as records_file:
+            content = records_file.read()
+
+        # a record being appended by another process is left out
+        return numpy.frombuffer(content[:len(content) - len(content) % RECORD_DTYPE.itemsize], dtype=RECORD_DTYPE)
+
+    def _load_partition(self, zone: str, day: datetime.date) -> Tuple[Optional[_Partition], numpy.ndarray]:
+        """
+        :return: compacted part (None if not compacted yet) and pending records, including those being compacted
+        """
+        partition_dir = self._partition_dir(zone, day)
+        compacted_dir = os.path.sep.join([partition_dir, 'compacted'])
+        with self._lock:
+            partition = self._partitions.get(compacted_dir)
+            if partition is None and os.path.exists(compacted_dir):
+                partition = _Partition(compacted_dir)
+                self._partitions[compacted_dir] = partition
+
+            pending = self._read_records(os.path.sep.join([partition_dir, _PENDING_FILENAME]))
+            if not os.path.exists(os.path.sep.join([compacted_dir, _MERGED_MARKER])):
+                merging = self._read_records(os.path.sep.join([partition_dir, _MERGING_FILENAME]))
+                if len(merging) > 0:
+                    pending = numpy.concatenate([merging, pending])
+
+        return partition, pending
+
+    def last_received(self, zone: str) -> Optional[int]:
+        """
+        :return: latest poll time stored for a zone in epoch seconds, None if empty
+        """
+        for zone_dir, day in reversed(self.partitions([zone])):
+            partition, pending = self._load_partition(zone_dir, day)
+            received = [int(pending['received'].max())] if len(pending) > 0 else []
+            if partition is not None:
+                received.append(int(partition.column('received').max()))
+
+            if received:
+                return max(received)
+
+        return None
+
+    def compact(self, zone: Optional[str] = None, before: Optional[datetime.date] = None) -> int:
+        """
+        Sorts and indexes the pending records, merging them with the partition already compacted if any.
+
+        :param zone: restricts compaction to a single zone, all by default
+        :param before: only partitions older than this day are compacted, defaults to the current UTC day
+        :return: number of partitions compacted
+        """
+        if before is None:
+            before = datetime.datetime.now(datetime.timezone.utc).date()
+
+        count = 0
+        for zone_dir, day in self.partitions(zones=None if zone is None else [zone]):
+            partition_dir = self._partition_dir(zone_dir, day)
+            if day >= before or not any(os.path.exists(os.path.sep.join([partition_dir, filename]))
+                                        for filename in (_PENDING_FILENAME, _MERGING_FILENAME)):
+                continue
+
+            with self._compaction_lock:
+                with self._lock:
+                    self._recover(partition_dir)
+
+                if os.path.exists(os.path.sep.join([partition_dir, _MERGING_FILENAME])):
+                    # left by an interrupted compaction
+                    self._compact_partition(zone_dir, day)
+
+                if os.path.exists(os.path.sep.join([partition_dir, _PENDING_FILENAME])):
+                    self._compact_partition(zone_dir, day)
+
+            count += 1
+
+        return count
+
+    def _recover(self, partition_dir: str):
+        """
+        Cleans up after a compaction interrupted by a crash: records of the merged file are either part of the
+        compacted directory, the file being then removed, or left to be compacted again.
+        """
+        compacted_dir = os.path.sep.join([partition_dir, 'compacted'])
+        previous_dir = os.path.sep.join([partition_dir, 'compacted.previous'])
+        work_dir = os.path.sep.join([partition_dir, 'compacting'])
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+
+        if os.path.exists(previous_dir):
+            if os.path.exists(compacted_dir):
+                shutil.rmtree(previous_dir)
+
+            else:
+                os.replace(previous_dir, compacted_dir)
+
+        marker_filename = os.path.sep.join([compacted_dir, _MERGED_MARKER])
+        if os.path.exists(marker_filename):
+            merging_filename = os.path.sep.join([partition_dir, _MERGING_FILENAME])
+            if os.path.exists(merging_filename):
+                os.remove(merging_filename)
+
+            os.remove(marker_filename)
+
+    def _compact_partition(self, zone: str, day: datetime.date):
+        """
+        Merges the records being compacted, if any left by an interrupted compaction, or else the pending ones.
+        Compaction lock must be held, the store lock being only taken to rename the pending file and to swap the
+        compacted directories: records appended meanwhile go to a new pending file.
+        """
+        partition_dir = self._partition_dir(zone, day)
+        compacted_dir = os.path.sep.join([partition_dir, 'compacted'])
+        merging_filename = os.path.sep.join([partition_dir, _MERGING_FILENAME])
+        with self._lock:
+            if not os.path.exists(merging_filename):
+                os.replace(os.path.sep.join([partition_dir, _PENDING_FILENAME]), merging_filename)
+
+        partition = _Partition(compacted_dir) if os.path.exists(compacted_dir) else None
+        records = self._read_records(merging_filename)
+        if partition is not None:
+            compacted = numpy.zeros(len(partition.column('timestamp')), dtype=RECORD_DTYPE)
+            for name, values in partition.records().items():
+                compacted[name] = numpy.char.encode(values.astype(str), 'utf-8') if name in _TEXT_COLUMNS else values
+
+            records = numpy.concatenate([compacted, records])
+
+        located = numpy.isfinite(records['lat']) & numpy.isfinite(records['lon'])
+        cells = numpy.where(located, grid_cell(numpy.where(located, records['lat'], 0.),
+                                               numpy.where(located, records['lon'], 0.)), -1)
+        order = numpy.lexsort((records['timestamp'], cells))
+        records, cells = records[order], cells[order]
+        cell_values, cell_starts = numpy.unique(cells, return_index=True)
+        imo_order = numpy.lexsort((records['timestamp'], records['imo']))
+        imo_values, imo_starts = numpy.unique(records['imo'][imo_order], return_index=True)
+
+        work_dir = os.path.sep.join([partition_dir, 'compacting'])
+        os.makedirs(work_dir, exist_ok=True)
+        strings = dict()
+        for name in RECORD_DTYPE.names:
+            values = records[name]
+            if name in _TEXT_COLUMNS:
+                vocabulary, values = numpy.unique(values, return_inverse=True)
+                strings[name] = _decode(vocabulary).tolist()
+                values = values.astype(numpy.int32)
+
+            numpy.save(os.path.sep.join([work_dir, f'{name}.npy']), numpy.ascontiguousarray(values))
+
+        with open(os.path.sep.join([work_dir, 'strings.json']), 'w', encoding='utf-8') as strings_file:
+            json.dump(strings, strings_file)
+
+        numpy.savez(os.path.sep.join([work_dir, 'index.npz']),
+                    cells=cell_values, cell_starts=numpy.append(cell_starts, len(cells)),
+                    imos=imo_values, imo_starts=numpy.append(imo_starts, len(records)),
+                    imo_order=imo_order.astype(numpy.int32),
+                    bounds=self._bounds(records[located]))
+        open(os.path.sep.join([work_dir, _MERGED_MARKER]), 'wb').close()
+
+        # previous directory is restored by _recover() if the new one is not in place yet
+        previous_dir = os.path.sep.join([partition_dir, 'compacted.previous'])
+        with self._lock:
+            self._partitions.pop(compacted_dir, None)
+            if os.path.exists(compacted_dir):
+                os.replace(compacted_dir, previous_dir)
+
+            os.replace(work_dir, compacted_dir)
+            os.remove(merging_filename)
+            os.remove(os.path.sep.join([compacted_dir, _MERGED_MARKER]))
+
+        if os.path.exists(previous_dir):
+            shutil.rmtree(previous_dir)
+
+    @staticmethod
+    def _bounds(records: numpy.ndarray) -> numpy.ndarray:
+        if len(records) == 0:
+            return numpy.full(4, numpy.nan)
+
+        return numpy.array([records['lon'].min(), records['lat'].min(), records['lon'].max(), records['lat'].max()])
+
+    def write_keyframe(self, zone: str, received: int, records: numpy.ndarray):
+        """
+        Stores the state of all vessels of a zone at a poll time.
+        """
+        partition_dir = self._partition_dir(zone, _day(received))
+        os.makedirs(partition_dir, exist_ok=True)
+        filename = os.path.sep.join([partition_dir, f'keyframe-{int(received)}.npy'])
+        with open(filename + '.tmp', 'wb') as keyframe_file:
+            numpy.save(keyframe_file, records)
+
+        os.replace(filename + '.tmp', filename)
+
+    def _latest_keyframe(self, zone: str, at: int) -> Tuple[Optional[int], numpy.ndarray]:
+        """
+        :return: time of the latest keyframe of the zone not after the specified time (None if none) and its records
+        """
+        for zone_dir, day in reversed(self.partitions([zone], end=at)):
+            partition_dir = self._partition_dir(zone_dir, day)
+            keyframe_times = [int(filename[len('keyframe-'):-len('.npy')]) for filename in os.listdir(partition_dir)
+                              if filename.startswith('keyframe-') and filename.endswith('.npy')]
+            keyframe_times = [keyframe_time for keyframe_time in keyframe_times if keyframe_time <= at]
+            if keyframe_times:
+                keyframe_time = max(keyframe_times)
+                filename = os.path.sep.join([partition_dir, f'keyframe-{keyframe_time}.npy'])
+                return keyframe_time, numpy.load(filename)
+
+        return None, numpy.empty(0, dtype=RECORD_DTYPE)
+
+    def snapshot(self, zone: str, at: int, lookback: int = 86400) -> pandas.DataFrame:
+        """
+        State of the vessels of a zone at a time, rebuilt from the latest keyframe and the records stored after it.
+
+        :param zone: name of the tracking zone
+        :param at: time in epoch seconds, usually a poll time
+        :param lookback: age in seconds of the oldest report expected in a poll, bounds the partitions searched
+        :return: latest stored record of each vessel present in the zone, with POSITION_FIELDS columns and the zone slug
+        """
+        keyframe_time, keyframe = self._latest_keyframe(zone, at)
+        selections = [(zone_slug(zone), self._pending_records(keyframe))]
+        start = keyframe_time - lookback if keyframe_time is not None else None
+        for zone_dir, day in self.partitions([zone], start, at):
+            partition, pending = self._load_partition(zone_dir, day)
+            if partition is not None:
+                received = numpy.asarray(partition.column('received'))
+                mask = received <= at
+                if keyframe_time is not None:
+                    mask &= received > keyframe_time
+
+                selections.append((zone_dir, partition.records(numpy.flatnonzero(mask))))
+
+            mask = pending['received'] <= at
+            if keyframe_time is not None:
+                mask &= pending['received'] > keyframe_time
+
+            selections.append((zone_dir, self._pending_records(pending[mask])))
+
+        positions = self._to_frame(selections).sort_values('received', kind='stable')
+        positions = positions.groupby(vessel_keys(positions), sort=True).tail(1)
+        return positions[positions['lat'].notna()].reset_index(drop=True)
+
+    def query(self, box: Optional[Tuple[float, float, float, float]] = None, start: Optional[int] = None,
+              end: Optional[int] = None, zones: Optional[Sequence[str]] = None,
+              ship_types: Optional[Sequence[int]] = None, departures: bool = False) -> pandas.DataFrame:
+        """
+        Positions reported inside a box during a time range.
+
+        :param box: (min lon, min lat, max lon, max lat), anywhere by default
+        :param start: earliest timestamp in epoch seconds, included
+        :param end: latest timestamp in epoch seconds, included
+        :param zones: restricts to the specified tracking zones, all by default
+        :param ship_types: restricts to the specified ship type codes (8 for tankers), all by default
+        :param departures: also returns the records without coordinates of vessels no longer reported in their
+        zone, timestamped at the poll time, unless a box is specified
+        :return: positions with POSITION_FIELDS columns and the zone slug
+        """
+        selections = list()
+        for zone, day in self.partitions(zones, start, end):
+            partition, pending = self._load_partition(zone, day)
+            if partition is not None:
+                rows = partition.box_rows(*box) if box is not None else None
+                columns = {name: partition.column(name) for name in ('timestamp', 'lat', 'lon', 'ship_type')}
+                if rows is not None:
+                    columns = {name: values[rows] for name, values in columns.items()}
+
+                mask = self._mask(columns, box, start, end, ship_types, departures)
+                if rows is None:
+                    rows = numpy.arange(len(mask))
+
+                selections.append((zone, partition.records(rows[mask])))
+
+            mask = self._mask(pending, box, start, end, ship_types, departures)
+            selections.append((zone, self._pending_records(pending[mask])))
+
+        return self._to_frame(selections)
+
+    def track(self, imo: int, start: Optional[int] = None, end: Optional[int] = None,
+              zones: Optional[Sequence[str]] = None) -> pandas.DataFrame:
+        """
+        Positions of a single vessel during a time range.
+
+        :return: positions by increasing timestamp, with POSITION_FIELDS columns and the zone slug
+        """
+        selections = list()
+        for zone, day in self.partitions(zones, start, end):
+            partition, pending = self._load_partition(zone, day)
+            if partition is not None:
+                rows = partition.imo_rows(imo)
+                columns = {name: partition.column(name)[rows] for name in ('timestamp', 'lat')}
+                mask = self._mask(columns, None, start, end, None)
+                selections.append((zone, partition.records(rows[mask])))
+
+            mask = (pending['imo'] == imo) & self._mask(pending, None, start, end, None)
+            selections.append((zone, self._pending_records(pending[mask])))
+
+        return self._to_frame(selections).sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def _mask(columns, box, start, end, ship_types, departures: bool = False) -> numpy.ndarray:
+        mask = numpy.ones(len(columns['lat']), dtype=bool) if departures else numpy.isfinite(columns['lat'])
+        if box is not None:
+            min_lon, min_lat, max_lon, max_lat = box
+            lat, lon = columns['lat'], columns['lon']
+            mask &= (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+        if start is not None:
+            mask &= columns['timestamp'] >= start
+
+        if end is not None:
+            mask &= columns['timestamp'] <= end
+
+        if ship_types is not None:
+            mask &= numpy.isin(columns['ship_type'], ship_types)
+
+        return mask
+
+    @staticmethod
+    def _pending_records(records: numpy.ndarray) -> Dict[str, numpy.ndarray]:
+        return {name: _decode(records[name]) if name in _TEXT_COLUMNS else records[name]
+                for name in POSITION_FIELDS}
+
+    @staticmethod
+    def _to_frame(selections: List[Tuple[str, Dict[str, numpy.ndarray]]]) -> pandas.DataFrame:
+        frames = [pandas.DataFrame(dict(records, zone=zone)) for zone, records in selections
+                  if len(records['timestamp']) > 0]
+        if not frames:
+            columns = {name: pandas.Series(dtype=object if name in _TEXT_COLUMNS else RECORD_DTYPE[name])
+                       for name in POSITION_FIELDS}
+            return pandas.DataFrame(dict(columns, zone=pandas.Series(dtype=object)))
+
+        return pandas.concat(frames, ignore_index=True)
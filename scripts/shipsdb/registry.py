@@ -0,0 +1,448 @@
+"""
+Registry of static vessel attributes, keyed on IMO, MMSI and name:
+    <root>/<column>.npy        one array per attribute, Flag and Ship type as codes into strings.json
+    <root>/names.npy           vessel names as a single utf-8 buffer, delimited by name_offsets.npy
+    <root>/<key>_slots.npy     open addressing hash tables on IMO, MMSI and normalized name
+    <root>/strings.json        flags and ship types referenced by the codes
+
+Every file is memory mapped on opening, so that a process starts without reading the registry, and lookups
+only touch the few pages they need. Hash tables hold row numbers and are probed linearly, the key column
+telling apart colliding keys.
+
+The registry is rebuilt in bulk from the details export of download-vessels-details.py, MMSI being either
+read from it or learnt from tracked positions:
+
+    >>> registry = VesselRegistry.refresh('output/registry', 'output/ship-db-details.csv')
+    >>> registry.by_imo(9321483).deadweight
+    >>> positions = VesselRegistry('output/registry').join(positions, columns=['flag', 'deadweight'])
+
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+import zlib
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy
+
+from shipsdb.lazy import lazy_import
+
+pandas = lazy_import('pandas')
+
+__all__ = ['Vessel', 'VesselRegistry', 'ATTRIBUTES']
+
+# numeric attributes and their dtype, missing values being 0 for integers and NaN for floats
+_NUMERIC_COLUMNS = {
+    'imo': numpy.int32,
+    'mmsi': numpy.int32,
+    'built': numpy.int16,
+    'gross_tonnage': numpy.float32,
+    'deadweight': numpy.float32,
+    'net_tonnage': numpy.float32,
+    'length': numpy.float32,
+    'width': numpy.float32,
+    'draught': numpy.float32,
+}
+
+# attributes stored as codes into a vocabulary, -1 when missing
+_CATEGORY_COLUMNS = ('flag', 'ship_type')
+
+ATTRIBUTES = ['imo', 'mmsi', 'name', 'flag', 'ship_type', 'built', 'gross_tonnage', 'deadweight', 'net_tonnage',
+              'length', 'width', 'draught']
+
+# columns of the details export for each attribute, first one found wins
+_SOURCE_COLUMNS = {
+    'imo': ('IMO', 'IMO number'),
+    'mmsi': ('MMSI',),
+    'name': ('Name', 'Vessel Name'),
+    'flag': ('Flag',),
+    'ship_type': ('Ship type',),
+    'built': ('Built', 'Build'),
+    'gross_tonnage': ('GT', 'Gross Tonnage'),
+    'deadweight': ('DW', 'Deadweight'),
+    'net_tonnage': ('NT', 'Net Tonnage'),
+    'length': ('Length',),
+    'width': ('Width',),
+    'draught': ('Draught',),
+}
+
+_KEYS = ('imo', 'mmsi', 'name')
+
+# Fibonacci hashing of integer keys
+_MULTIPLIER = 11400714819323198485
+_MASK_64 = (1 << 64) - 1
+
+
+class Vessel(NamedTuple):
+    imo: int
+    mmsi: Optional[int]
+    name: str
+    flag: Optional[str]
+    ship_type: Optional[str]
+    built: Optional[int]
+    gross_tonnage: float
+    deadweight: float
+    net_tonnage: float
+    length: float
+    width: float
+    draught: float
+
+
+def normalize_name(name: str) -> str:
+    return ' '.join(name.upper().split())
+
+
+def _name_hash(name: str) -> int:
+    return zlib.crc32(normalize_name(name).encode('utf-8'))
+
+
+def _table_bits(size: int) -> int:
+    """
+    Hash tables are kept at most half full.
+    """
+    return max(4, int(math.ceil(math.log2(max(size, 1) * 2))))
+
+
+def _homes(keys: numpy.ndarray, bits: int) -> numpy.ndarray:
+    hashed = keys.astype(numpy.uint64) * numpy.uint64(_MULTIPLIER)
+    return (hashed >> numpy.uint64(64 - bits)).astype(numpy.int64)
+
+
+def _home(key: int, bits: int) -> int:
+    return ((key * _MULTIPLIER) & _MASK_64) >> (64 - bits)
+
+
+def _build_table(rows: numpy.ndarray, homes: numpy.ndarray, bits: int) -> numpy.ndarray:
+    """
+    Inserts all rows at once, one probing step per round: on each round, rows whose current slot is free
+    take it, the first one only when several compete for the same slot, the others moving to the next slot.
+    Rows end up where sequential insertion could have put them, so that lookups probe them the same way.
+
+    :return: row number by slot, -1 for empty slots
+    """
+    mask = (1 << bits) - 1
+    slots = numpy.full(1 << bits, -1, dtype=numpy.int32)
+    pending, positions = rows, homes
+    while len(pending) > 0:
+        free = numpy.flatnonzero(slots[positions] < 0)
+        taken_positions, first = numpy.unique(positions[free], return_index=True)
+        slots[taken_positions] = pending[free[first]]
+        placed = numpy.zeros(len(pending), dtype=bool)
+        placed[free[first]] = True
+        pending, positions = pending[~placed], (positions[~placed] + 1) & mask
+
+    return slots
+
+
+def _parse_numeric(values: pandas.Series) -> pandas.Series:
+    """
+    Leading number of values as in "17.1 m" or "159999 t".
+    """
+    return pandas.to_numeric(values.astype(str).str.extract(r'^\s*([0-9]+(?:\.[0-9]+)?)', expand=False),
+                             errors='coerce')
+
+
+def _source(details: pandas.DataFrame, attribute: str) -> Optional[pandas.Series]:
+    for column in _SOURCE_COLUMNS[attribute]:
+        if column in details.columns:
+            return details[column]
+
+    return None
+
+
+class VesselRegistry(object):
+
+    def __init__(self, root: str):
+        """
+        Opens the registry, all files being memory mapped.
+
+        :param root: location of the registry
+        """
+        self._root = root
+        self._columns = {name: self._load(name) for name in list(_NUMERIC_COLUMNS) + list(_CATEGORY_COLUMNS)}
+        self._names = self._load('names')
+        self._name_offsets = self._load('name_offsets')
+        self._name_hashes = self._load('name_hashes')
+        self._slots = {key: self._load(f'{key}_slots') for key in _KEYS}
+        self._bits = {key: int(math.log2(len(slots))) for key, slots in self._slots.items()}
+        with open(os.path.sep.join([root, 'strings.json']), 'r', encoding='utf-8') as strings_file:
+            self._strings = {name: numpy.array(values, dtype=object)
+                             for name, values in json.load(strings_file).items()}
+
+    def _load(self, name: str) -> numpy.ndarray:
+        return numpy.load(os.path.sep.join([self._root, f'{name}.npy']), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self._columns['imo'])
+
+    def name(self, row: int) -> str:
+        return bytes(self._names[self._name_offsets[row]:self._name_offsets[row + 1]]).decode('utf-8')
+
+    def vessel(self, row: int) -> Vessel:
+        values = {name: column[row] for name, column in self._columns.items()}
+        return Vessel(imo=int(values['imo']), mmsi=int(values['mmsi']) or None, name=self.name(row),
+                      flag=self._strings['flag'][values['flag']] if values['flag'] >= 0 else None,
+                      ship_type=self._strings['ship_type'][values['ship_type']] if values['ship_type'] >= 0 else None,
+                      built=int(values['built']) or None, gross_tonnage=float(values['gross_tonnage']),
+                      deadweight=float(values['deadweight']), net_tonnage=float(values['net_tonnage']),
+                      length=float(values['length']), width=float(values['width']),
+                      draught=float(values['draught']))
+
+    def _probe(self, key: str, value: int) -> int:
+        slots, column = self._slots[key], self._columns[key]
+        mask = len(slots) - 1
+        position = _home(value, self._bits[key])
+        while True:
+            row = slots[position]
+            if row < 0 or column[row] == value:
+                return int(row)
+
+            position = (position + 1) & mask
+
+    def row_of_imo(self, imo: int) -> int:
+        """
+        :return: row of the vessel, -1 if unknown
+        """
+        return self._probe('imo', imo) if imo > 0 else -1
+
+    def row_of_mmsi(self, mmsi: int) -> int:
+        return self._probe('mmsi', mmsi) if mmsi > 0 else -1
+
+    def rows_of_name(self, name: str) -> List[int]:
+        """
+        :return: rows of the vessels with that name, case and spaces being ignored
+        """
+        normalized = normalize_name(name)
+        name_hash = zlib.crc32(normalized.encode('utf-8'))
+        slots = self._slots['name']
+        mask = len(slots) - 1
+        position = _home(name_hash, self._bits['name'])
+        rows = list()
+        while True:
+            row = int(slots[position])
+            if row < 0:
+                return rows
+
+            if self._name_hashes[row] == name_hash and normalize_name(self.name(row)) == normalized:
+                rows.append(row)
+
+            position = (position + 1) & mask
+
+    def by_imo(self, imo: int) -> Optional[Vessel]:
+        row = self.row_of_imo(imo)
+        return self.vessel(row) if row >= 0 else None
+
+    def by_mmsi(self, mmsi: int) -> Optional[Vessel]:
+        row = self.row_of_mmsi(mmsi)
+        return self.vessel(row) if row >= 0 else None
+
+    def by_name(self, name: str) -> List[Vessel]:
+        return [self.vessel(row) for row in self.rows_of_name(name)]
+
+    def rows(self, values: Sequence[int], key: str = 'imo') -> numpy.ndarray:
+        """
+        Vectorized lookup, probing all values at once.
+
+        :param values: IMO or MMSI numbers
+        :param key: 'imo' or 'mmsi'
+        :return: row of each value, -1 if unknown
+        """
+        values = numpy.asarray(values, dtype=numpy.int64)
+        slots, column = self._slots[key], self._columns[key]
+        mask = len(slots) - 1
+        rows = numpy.full(len(values), -1, dtype=numpy.int64)
+        pending = numpy.flatnonzero(values > 0)
+        positions = _homes(values[pending], self._bits[key])
+        while len(pending) > 0:
+            candidates = numpy.asarray(slots[positions])
+            occupied = candidates >= 0
+            found = occupied & (numpy.asarray(column)[numpy.maximum(candidates, 0)] == values[pending])
+            rows[pending[found]] = candidates[found]
+            probing = occupied & ~found
+            pending, positions = pending[probing], (positions[probing] + 1) & mask
+
+        return rows
+
+    def attributes(self, rows: numpy.ndarray, columns: Optional[Iterable[str]] = None) -> pandas.DataFrame:
+        """
+        :param rows: as returned by rows(), -1 giving missing values
+        :param columns: attributes to be returned, all by default
+        :return: one line per row
+        """
+        rows = numpy.asarray(rows)
+        missing = rows < 0
+        safe_rows = numpy.where(missing, 0, rows)
+        attributes = dict()
+        for name in columns or ATTRIBUTES:
+            if name == 'name':
+                values = numpy.array([self.name(row) if row >= 0 else None for row in rows.tolist()], dtype=object)
+
+            elif name in _CATEGORY_COLUMNS:
+                codes = numpy.where(missing, -1, numpy.asarray(self._columns[name])[safe_rows])
+                values = pandas.Categorical.from_codes(codes, categories=self._strings[name])
+
+            elif numpy.issubdtype(_NUMERIC_COLUMNS[name], numpy.integer):
+                raw = numpy.asarray(self._columns[name])[safe_rows]
+                values = pandas.array(raw, dtype='Int64')
+                values[missing | (raw == 0)] = pandas.NA
+
+            else:
+                values = numpy.where(missing, numpy.nan, numpy.asarray(self._columns[name])[safe_rows])
+
+            attributes[name] = values
+
+        return pandas.DataFrame(attributes)
+
+    def join(self, positions: pandas.DataFrame, columns: Optional[Iterable[str]] = None) -> pandas.DataFrame:
+        """
+        Adds static attributes to positions, matched on IMO, or on MMSI for positions without a known IMO.
+
+        :param positions: frame with imo and mmsi columns, as returned by PositionStore.query()
+        :param columns: attributes to be added, all but imo, mmsi and name by default
+        :return: positions with the attributes
+        """
+        columns = list(columns or [name for name in ATTRIBUTES if name not in _KEYS])
+        rows = self.rows(positions['imo'].to_numpy(), 'imo')
+        unmatched = rows < 0
+        if 'mmsi' in positions.columns and unmatched.any():
+            rows[unmatched] = self.rows(positions['mmsi'].to_numpy()[unmatched], 'mmsi')
+
+        attributes = self.attributes(rows, columns).set_axis(positions.index)
+        return pandas.concat([positions, attributes], axis=1)
+
+    def arrays(self) -> Dict[str, numpy.ndarray]:
+        """
+        :return: in-memory copies of the attributes, names as a list, categories decoded
+        """
+        arrays = {name: numpy.array(column) for name, column in self._columns.items()}
+        for name in _CATEGORY_COLUMNS:
+            codes = arrays[name]
+            arrays[name] = numpy.where(codes >= 0, self._strings[name][numpy.maximum(codes, 0)], None)
+
+        arrays['name'] = [self.name(row) for row in range(len(self))]
+        return arrays
+
+    @staticmethod
+    def from_frame(vessels: pandas.DataFrame) -> Dict[str, numpy.ndarray]:
+        """
+        Attributes from a details export, last line of each IMO winning.
+
+        :param vessels: details as read from ship-db-details.csv
+        :return: arrays by attribute, as written by save()
+        """
+        imo = _parse_numeric(_source(vessels, 'imo'))
+        vessels = vessels[imo.notna() & (imo > 0)]
+        imo = imo[vessels.index].astype(numpy.int64)
+        keep = ~imo.duplicated(keep='last').to_numpy()
+        vessels, imo = vessels[keep], imo[keep]
+        arrays = {'imo': numpy.array(imo)}
+        for name in _NUMERIC_COLUMNS:
+            if name == 'imo':
+                continue
+
+            values = _source(vessels, name)
+            if values is None:
+                values = pandas.Series(numpy.nan, index=vessels.index)
+
+            values = _parse_numeric(values)
+            if numpy.issubdtype(_NUMERIC_COLUMNS[name], numpy.integer):
+                values = values.fillna(0)
+
+            arrays[name] = numpy.array(values)
+
+        for name in _CATEGORY_COLUMNS + ('name',):
+            values = _source(vessels, name)
+            values = values.astype(str).str.strip() if values is not None else pandas.Series('', index=vessels.index)
+            arrays[name] = numpy.where(values.to_numpy() == '', None, values.to_numpy()) \
+                if name in _CATEGORY_COLUMNS else values.tolist()
+
+        return arrays
+
+    @staticmethod
+    def save(root: str, arrays: Dict[str, numpy.ndarray]) -> 'VesselRegistry':
+        """
+        Writes a new registry, replacing the existing one once complete.
+
+        :param root: location of the registry
+        :param arrays: values by attribute, categories and names as strings
+        """
+        work_dir = root + '.building'
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+
+        def save_array(name: str, values: numpy.ndarray):
+            numpy.save(os.path.sep.join([work_dir, f'{name}.npy']), numpy.ascontiguousarray(values))
+
+        size = len(arrays['imo'])
+        for name, dtype in _NUMERIC_COLUMNS.items():
+            save_array(name, numpy.asarray(arrays[name]).astype(dtype))
+
+        strings = dict()
+        for name in _CATEGORY_COLUMNS:
+            values = pandas.Series(arrays[name], dtype=object)
+            codes, vocabulary = pandas.factorize(values, sort=True)
+            strings[name] = [str(value) for value in vocabulary]
+            save_array(name, codes.astype(numpy.int16))
+
+        encoded = [str(name).encode('utf-8') for name in arrays['name']]
+        save_array('names', numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8))
+        save_array('name_offsets', numpy.concatenate([[0], numpy.cumsum([len(name) for name in encoded])])
+                   .astype(numpy.int64))
+        name_hashes = numpy.array([_name_hash(str(name)) for name in arrays['name']], dtype=numpy.uint32)
+        save_array('name_hashes', name_hashes)
+
+        all_rows = numpy.arange(size, dtype=numpy.int32)
+        for key, keys in (('imo', numpy.asarray(arrays['imo'], dtype=numpy.int64)),
+                          ('mmsi', numpy.asarray(arrays['mmsi'], dtype=numpy.int64)),
+                          ('name', name_hashes.astype(numpy.int64))):
+            rows = all_rows if key == 'name' else all_rows[keys > 0]
+            if key == 'mmsi':
+                # a MMSI reassigned to another vessel only points to the latest one
+                rows = rows[~pandas.Series(keys[rows]).duplicated(keep='last').to_numpy()]
+
+            bits = _table_bits(len(rows))
+            save_array(f'{key}_slots', _build_table(rows, _homes(keys[rows], bits), bits))
+
+        with open(os.path.sep.join([work_dir, 'strings.json']), 'w', encoding='utf-8') as strings_file:
+            json.dump(strings, strings_file)
+
+        if os.path.exists(root):
+            shutil.rmtree(root)
+
+        os.replace(work_dir, root)
+        return VesselRegistry(root)
+
+    @classmethod
+    def refresh(cls, root: str, details_filename: str) -> 'VesselRegistry':
+        """
+        Rebuilds the registry from a details export, MMSI missing from the export being kept from the
+        existing registry.
+
+        :param root: location of the registry
+        :param details_filename: as written by download-vessels-details.py
+        """
+        arrays = cls.from_frame(pandas.read_csv(details_filename, dtype=str, keep_default_na=False))
+        if os.path.exists(os.path.sep.join([root, 'strings.json'])):
+            previous = cls(root)
+            previous_rows = previous.rows(arrays['imo'], 'imo')
+            known = (arrays['mmsi'] == 0) & (previous_rows >= 0)
+            arrays['mmsi'][known] = numpy.asarray(previous._columns['mmsi'])[previous_rows[known]]
+            del previous
+
+        return cls.save(root, arrays)
+
+    def learn_mmsi(self, imos: Sequence[int], mmsis: Sequence[int]) -> 'VesselRegistry':
+        """
+        Records the MMSI reported along with IMO numbers, as in tracked positions, the last pair winning.
+
+        :return: the updated registry, saved in place
+        """
+        imos, mmsis = numpy.asarray(imos, dtype=numpy.int64), numpy.asarray(mmsis, dtype=numpy.int64)
+        rows = self.rows(imos, 'imo')
+        known = (rows >= 0) & (mmsis > 0)
+        arrays = self.arrays()
+        arrays['mmsi'][rows[known]] = mmsis[known]
+        return self.save(self._root, arrays)
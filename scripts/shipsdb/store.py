@@ -0,0 +1,225 @@
+"""
+Columnar vessels store.
+
+Snapshots are kept as Parquet files, partitioned by dataset, vessel type and snapshot date:
+    <root>/<dataset>/vessel_type=<code>/snapshot=<YYYY-MM-DD>/part-0.parquet
+
+Each dataset has an explicit schema: numeric columns are stored as numbers and Flag / Ship type
+like columns as dictionary encoded strings, loaded back as pandas categoricals. Columns missing from
+the schema are kept as strings.
+
+    >>> write_snapshot('output/store', 'details', vessels, vessel_type='oil')
+    >>> vessels = read_snapshot('output/store', 'details', columns=['IMO', 'DW', 'Flag'], vessel_type='oil')
+
+"""
+from __future__ import annotations
+
+import datetime
+import os
+from typing import Dict, Iterable, List, Optional, Union
+
+from shipsdb.lazy import lazy_import
+
+pandas = lazy_import('pandas')
+pyarrow = lazy_import('pyarrow', 'pyarrow.dataset', 'pyarrow.parquet')
+
+__all__ = ['SCHEMAS', 'write_snapshot', 'write_csv_snapshot', 'read_snapshot', 'list_snapshots', 'apply_schema']
+
+# dictionary encoded strings
+_CATEGORY = 'category'
+
+# column types by dataset, as names of pyarrow type factories
+SCHEMAS = {
+    # raw list from download-vessels.py
+    'vessels': {
+        'imo': 'string',
+        'name': 'string',
+        'country': _CATEGORY,
+        'type': _CATEGORY,
+        'year-built': 'int16',
+        'gross-tons': 'int32',
+        'dead-weight-tons': 'int32',
+        'length_meters': 'int16',
+        'width_meters': 'int16',
+    },
+    # details from download-vessels-details.py
+    'details': {
+        'IMO': 'string',
+        'MMSI': 'string',
+        'Flag': _CATEGORY,
+        'ship_country_owner': _CATEGORY,
+        'Ship type': _CATEGORY,
+        'GT': 'float64',
+        'DW': 'float64',
+        'NT': 'float64',
+        'Length': 'float32',
+        'Width': 'float32',
+        'Draught': 'float32',
+        'Current draught': 'float32',
+        'Built': 'float32',
+        'Build': 'float32',
+    },
+    # cleaned output from clean-vessels-data.py
+    'cleaned': {
+        'IMO': 'string',
+        'Flag': _CATEGORY,
+        'ship_country_owner': _CATEGORY,
+        'Ship type': _CATEGORY,
+        'Built': 'float32',
+        'Course': 'float32',
+        'Speed': 'float32',
+        'Current draught': 'float32',
+        'Draught': 'float32',
+        'Length': 'float32',
+        'Width': 'float32',
+        'Deadweight': 'float64',
+        'Gross Tonnage': 'float64',
+        'Net Tonnage': 'float64',
+    },
+}
+
+
+def _snapshot_dir(root: str, dataset: str, vessel_type: Union[int, str], snapshot_date: datetime.date) -> str:
+    return os.path.sep.join([root, dataset, f'vessel_type={vessel_type}', f'snapshot={snapshot_date.isoformat()}'])
+
+
+def _arrow_type(name: str) -> pyarrow.DataType:
+    if name == _CATEGORY:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+    return getattr(pyarrow, name)()
+
+
+def apply_schema(vessels: pandas.DataFrame, dataset: str) -> pyarrow.Table:
+    """
+    Converts a frame to the dataset schema, invalid numeric values becoming nulls.
+    """
+    schema = SCHEMAS[dataset]
+    arrays, fields = list(), list()
+    for column in vessels.columns:
+        column_type = _arrow_type(schema.get(column, 'string'))
+        values = vessels[column]
+        if pyarrow.types.is_integer(column_type) or pyarrow.types.is_floating(column_type):
+            values = pandas.to_numeric(values, errors='coerce')
+
+        elif values.dtype.name != 'category':
+            values = values.where(values.isna(), values.astype(str))
+
+        arrays.append(pyarrow.array(values, type=column_type, from_pandas=True))
+        fields.append(pyarrow.field(str(column), column_type))
+
+    return pyarrow.Table.from_arrays(arrays, schema=pyarrow.schema(fields))
+
+
+def write_snapshot(root: str, dataset: str, vessels: pandas.DataFrame, vessel_type: Union[int, str],
+                   snapshot_date: Optional[datetime.date] = None) -> str:
+    """
+    Stores a snapshot, replacing any previous one for the same vessel type and date.
+
+    :return: location of the Parquet file
+    """
+    if snapshot_date is None:
+        snapshot_date = datetime.date.today()
+
+    snapshot_dir = _snapshot_dir(root, dataset, vessel_type, snapshot_date)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    filename = os.path.sep.join([snapshot_dir, 'part-0.parquet'])
+    pyarrow.parquet.write_table(apply_schema(vessels.reset_index(drop=True), dataset), filename,
+                                compression='zstd')
+    return filename
+
+
+def write_csv_snapshot(root: str, dataset: str, csv_filename: str, vessel_type: Union[int, str],
+                       snapshot_date: Optional[datetime.date] = None, chunk_size: int = 100000) -> str:
+    """
+    Converts a CSV export into a snapshot, chunk by chunk so that memory does not depend on the file size.
+
+    :return: location of the Parquet file
+    """
+    if snapshot_date is None:
+        snapshot_date = datetime.date.today()
+
+    snapshot_dir = _snapshot_dir(root, dataset, vessel_type, snapshot_date)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    filename = os.path.sep.join([snapshot_dir, 'part-0.parquet'])
+    writer = None
+    try:
+        for chunk in pandas.read_csv(csv_filename, dtype=str, keep_default_na=False, na_values=[''],
+                                     chunksize=chunk_size):
+            table = apply_schema(chunk, dataset)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(filename, table.schema, compression='zstd')
+
+            writer.write_table(table.cast(writer.schema))
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return filename
+
+
+def list_snapshots(root: str, dataset: str) -> Dict[str, List[datetime.date]]:
+    """
+    :return: available snapshot dates by vessel type, oldest first
+    """
+    snapshots = dict()
+    dataset_dir = os.path.sep.join([root, dataset])
+    if not os.path.exists(dataset_dir):
+        return snapshots
+
+    for vessel_type_dir in sorted(os.listdir(dataset_dir)):
+        if not vessel_type_dir.startswith('vessel_type='):
+            continue
+
+        vessel_type = vessel_type_dir.split('=', 1)[1]
+        snapshot_dirs = os.listdir(os.path.sep.join([dataset_dir, vessel_type_dir]))
+        snapshots[vessel_type] = sorted(datetime.date.fromisoformat(snapshot_dir.split('=', 1)[1])
+                                        for snapshot_dir in snapshot_dirs if snapshot_dir.startswith('snapshot='))
+
+    return snapshots
+
+
+def read_snapshot(root: str, dataset: str, columns: Optional[Iterable[str]] = None,
+                  vessel_type: Optional[Union[int, str]] = None,
+                  snapshot_date: Optional[datetime.date] = None) -> pandas.DataFrame:
+    """
+    Loads a snapshot, only reading the requested columns.
+
+    :param root: location of the store
+    :param dataset: one of 'vessels', 'details', 'cleaned'
+    :param columns: subset of columns to be loaded, all by default
+    :param vessel_type: restricts to a single vessel type, all by default
+    :param snapshot_date: defaults to the latest snapshot of each vessel type
+    :return: vessels frame, with 'vessel_type' and 'snapshot' columns when spanning several partitions
+    """
+    snapshots = list_snapshots(root, dataset)
+    if vessel_type is not None:
+        snapshots = {str(vessel_type): snapshots.get(str(vessel_type), [])}
+
+    filenames = list()
+    for current_type, dates in snapshots.items():
+        selected_date = snapshot_date if snapshot_date is not None else (dates[-1] if dates else None)
+        if selected_date is not None and selected_date in dates:
+            filenames.append(os.path.sep.join([_snapshot_dir(root, dataset, current_type, selected_date),
+                                               'part-0.parquet']))
+
+    if not filenames:
+        raise FileNotFoundError(f'no snapshot available for dataset "{dataset}" in "{root}"')
+
+    partition_schema = pyarrow.schema([('vessel_type', pyarrow.string()), ('snapshot', pyarrow.string())])
+    schema = pyarrow.unify_schemas([pyarrow.parquet.read_schema(filename) for filename in filenames] +
+                                   [partition_schema])
+    vessels_dataset = pyarrow.dataset.dataset(filenames, schema=schema, format='parquet',
+                                              partitioning=pyarrow.dataset.partitioning(partition_schema,
+                                                                                        flavor='hive'),
+                                              partition_base_dir=os.path.sep.join([root, dataset]))
+    if columns is not None:
+        columns = list(columns)
+        if len(filenames) > 1:
+            columns += ['vessel_type', 'snapshot']
+
+    elif len(filenames) == 1:
+        columns = [name for name in vessels_dataset.schema.names if name not in ('vessel_type', 'snapshot')]
+
+    return vessels_dataset.to_table(columns=columns).to_pandas()
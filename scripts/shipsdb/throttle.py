@@ -0,0 +1,192 @@
+"""
+Adaptive per-host throttling.
+
+The request rate to each host follows the TCP congestion control scheme: it doubles at regular intervals
+while responses are healthy (slow start), until the first backoff, then increases linearly above the rate
+that backoff led to. It is cut down on 429 and 5xx statuses, network errors, slow responses and soft-block
+pages (pages served with an unexpected format, as in "invalid format for page"). A Retry-After header or a
+soft-block also pauses the host for a while.
+
+Requests are spaced by a theoretical arrival time per host (generic cell rate algorithm) rather than by a
+token count, so that the whole state of a host is a few numbers. When a state file is specified, it is shared
+by all the processes using it, under an exclusive file lock: concurrent scripts crawling the same site then
+share a single rate, as well as what each of them learned about it.
+
+    >>> throttle = AdaptiveThrottle('output/throttle-state.json', initial_rate=1., max_rate=10.)
+    >>> await throttle.acquire('www.vesselfinder.com')
+    >>> throttle.record('www.vesselfinder.com', status=200, latency=0.4)
+
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+try:
+    import fcntl
+
+except ImportError:
+    # no locking available, processes sharing a state file may then overwrite each other's updates
+    fcntl = None
+
+from shipsdb import metrics
+
+__all__ = ['AdaptiveThrottle']
+
+_BACKOFF_STATUSES = (429, 500, 502, 503, 504)
+
+
+class AdaptiveThrottle(object):
+
+    def __init__(self, state_filename: Optional[str] = None, initial_rate: float = 1., min_rate: float = 0.05,
+                 max_rate: float = 10., ramp_up: float = 10., increase: float = 0.1, decrease: float = 0.5,
+                 slow_latency: float = 5., slow_decrease: float = 0.8, block_pause: float = 60., burst: int = 1):
+        """
+
+        :param state_filename: location of the state file shared by processes, state kept in memory if None
+        :param initial_rate: requests per second to a host seen for the first time
+        :param min_rate: lowest rate backoffs can lead to
+        :param max_rate: highest rate healthy responses can lead to, at least the initial rate
+        :param ramp_up: seconds of healthy responses doubling the rate, until the first backoff
+        :param increase: rate gained, in requests per second, for each second of healthy responses after the
+               first backoff
+        :param decrease: factor applied to the rate on errors and soft-blocks
+        :param slow_latency: response time in seconds above which a response is considered slow
+        :param slow_decrease: factor applied to the rate on slow responses
+        :param block_pause: seconds during which a host is left alone after a soft-block
+        :param burst: number of requests allowed at once to an idle host
+        """
+        self._state_filename = state_filename
+        self._initial_rate = initial_rate
+        self._min_rate = min_rate
+        self._max_rate = max(max_rate, min_rate, initial_rate)
+        self._ramp_up_gain = math.log(2.) / ramp_up
+        self._increase = increase
+        self._decrease = decrease
+        self._slow_latency = slow_latency
+        self._slow_decrease = slow_decrease
+        self._block_pause = block_pause
+        self._burst = max(burst, 1)
+        self._states = dict()
+        self._lock = threading.Lock()
+        if state_filename is not None and os.path.dirname(state_filename):
+            os.makedirs(os.path.dirname(state_filename), exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked_states(self):
+        """
+        States by host, saved back when the block exits.
+        """
+        with self._lock:
+            if self._state_filename is None:
+                yield self._states
+                return
+
+            file_descriptor = os.open(self._state_filename, os.O_RDWR | os.O_CREAT, 0o644)
+            with open(file_descriptor, 'r+', encoding='utf-8') as state_file:
+                if fcntl is not None:
+                    fcntl.flock(state_file, fcntl.LOCK_EX)
+
+                content = state_file.read()
+                try:
+                    states = json.loads(content) if content else dict()
+
+                except ValueError:
+                    logging.warning('ignoring invalid throttle state file "%s"', self._state_filename)
+                    states = dict()
+
+                yield states
+                state_file.seek(0)
+                state_file.truncate()
+                json.dump(states, state_file)
+                state_file.flush()
+
+    def _host_state(self, states: Dict, host: str) -> Dict:
+        state = states.get(host)
+        if state is None:
+            # threshold: rate the last backoff led to, slow start going on until then
+            state = {'rate': self._initial_rate, 'tat': 0., 'paused_until': 0., 'threshold': None}
+            states[host] = state
+
+        state['rate'] = min(self._max_rate, max(self._min_rate, state['rate']))
+        return state
+
+    def _reserve(self, host: str) -> float:
+        """
+        :return: time at which the reserved request can be sent
+        """
+        now = time.time()
+        with self._locked_states() as states:
+            state = self._host_state(states, host)
+            interval = 1. / state['rate']
+            arrival = max(state['tat'], now, state['paused_until'])
+            slot = max(now, state['paused_until'], arrival - (self._burst - 1) * interval)
+            state['tat'] = arrival + interval
+            return slot
+
+    async def acquire(self, host: str):
+        """
+        Waits for the next request slot to the host.
+        """
+        delay = self._reserve(host) - time.time()
+        if delay > 0.:
+            await asyncio.sleep(delay)
+
+    def _slow_down(self, host: str, factor: float, pause: float, reason: str):
+        metrics.increment('throttle_backoffs')
+        now = time.time()
+        with self._locked_states() as states:
+            state = self._host_state(states, host)
+            state['rate'] = max(self._min_rate, state['rate'] * factor)
+            state['threshold'] = state['rate']
+            if pause > 0.:
+                state['paused_until'] = max(state['paused_until'], now + pause)
+
+            # requests already scheduled at the former rate are pushed back
+            state['tat'] = max(state['tat'], now) + 1. / state['rate']
+            rate = state['rate']
+
+        logging.info('slowing down %s to %.2f requests/s (%s)', host, rate, reason)
+
+    def record(self, host: str, status: Optional[int] = None, latency: Optional[float] = None,
+               retry_after: Optional[float] = None):
+        """
+        Adjusts the rate of the host to a response.
+
+        :param host: host the request was sent to
+        :param status: HTTP status, None for a network error
+        :param latency: response time in seconds
+        :param retry_after: pause requested by the server in seconds
+        """
+        if status is None or status in _BACKOFF_STATUSES:
+            self._slow_down(host, self._decrease, retry_after or 0., f'status {status}' if status else 'error')
+
+        elif latency is not None and latency > self._slow_latency:
+            self._slow_down(host, self._slow_decrease, 0., f'response in {latency:.1f}s')
+
+        elif status < 400:
+            with self._locked_states() as states:
+                state = self._host_state(states, host)
+                if state['threshold'] is None:
+                    # exponential growth: each response adds a constant, responses coming at the current rate
+                    gain = self._ramp_up_gain
+
+                else:
+                    gain = self._increase / state['rate']
+
+                state['rate'] = min(self._max_rate, state['rate'] + gain)
+
+    def soft_block(self, host: str):
+        """
+        Backs off after a page blocked without an error status (captcha, unexpected format...).
+        """
+        self._slow_down(host, self._decrease, self._block_pause, 'soft-block')
+
+    def rate(self, host: str) -> float:
+        with self._locked_states() as states:
+            return self._host_state(states, host)['rate']
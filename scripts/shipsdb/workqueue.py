@@ -0,0 +1,305 @@
+"""
+Work queue of crawl shards with leases, stored in a single SQLite file.
+
+A coordinator splits a crawl into shards (ranges of search pages, lists of vessels) submitted as a job. Workers,
+possibly on other machines with their own egress and cache, claim shards one at a time under a lease that they
+keep renewing while the shard is processed. The output of a shard is stored with it on completion, failures hand
+the shard back for another attempt, and shards whose lease expired (worker gone) are claimed again. Once all
+shards are done, the coordinator reads the outputs in shard order, so that the merged result does not depend on
+which worker processed what.
+
+    >>> queue = WorkQueue('shared/crawl-queue.sqlite')
+    >>> queue.submit('vessels-6', 'vessels', [{'vessel_type': 6, 'pages': [1, 50]}, ...])
+    >>> shard = queue.claim('vessels', worker_name())
+    >>> with queue.leased(shard):
+    ...     queue.complete(shard, output)
+    >>> outputs = queue.outputs('vessels-6')
+
+Workers on several machines need the file on a shared file system with working locks: the rollback journal is
+used rather than WAL for that reason.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+__all__ = ['WorkQueue', 'Shard', 'ShardFailure', 'worker_name', 'PENDING', 'LEASED', 'DONE', 'FAILED']
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shards (
+    job TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    output BLOB,
+    PRIMARY KEY (job, shard)
+);
+CREATE INDEX IF NOT EXISTS shards_kind_state ON shards (kind, state);
+'''
+
+
+class Shard(NamedTuple):
+    job: str
+    shard: int
+    payload: Dict
+    worker: str
+
+
+class ShardFailure(Exception):
+    pass
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue(object):
+    """
+    Thread-safe: a single connection is shared behind a lock, transactions serialize processes.
+    """
+
+    def __init__(self, filename: str, lease: float = 300., max_attempts: int = 3):
+        """
+
+        :param filename: location of the SQLite file, created if missing
+        :param lease: seconds a claimed shard stays with its worker without renewal
+        :param max_attempts: claims of a shard before it is marked as failed
+        """
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.filename = filename
+        self._lease = lease
+        self._max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False, isolation_level=None, timeout=60.)
+        self._connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+
+            self._connection.execute('COMMIT')
+
+    def submit(self, job: str, kind: str, payloads: List[Dict], resume: bool = False) -> int:
+        """
+        Creates the job, replacing a previous one with the same name unless resumed.
+
+        :param job: job name
+        :param kind: kind of shards, as claimed by workers
+        :param payloads: shard descriptions, in merge order
+        :param resume: keeps the shards of a previous job with the same payloads, failed ones being retried
+        :return: number of shards left to process
+        """
+        encoded = [json.dumps(payload, sort_keys=True) for payload in payloads]
+        with self._transaction() as connection:
+            previous = [row[0] for row in
+                        connection.execute('SELECT payload FROM shards WHERE job = ? ORDER BY shard', (job,))]
+            if resume and previous == encoded:
+                connection.execute('UPDATE shards SET state = ?, attempts = 0, error = NULL WHERE job = ? AND state = ?',
+                                   (PENDING, job, FAILED))
+
+            else:
+                if resume and previous:
+                    logging.warning('shards of job "%s" changed, restarting it', job)
+
+                connection.execute('DELETE FROM shards WHERE job = ?', (job,))
+                connection.executemany('INSERT INTO shards (job, shard, kind, payload, state) VALUES (?, ?, ?, ?, ?)',
+                                       [(job, count, kind, payload, PENDING) for count, payload in enumerate(encoded)])
+
+            return connection.execute('SELECT COUNT(*) FROM shards WHERE job = ? AND state != ?',
+                                      (job, DONE)).fetchone()[0]
+
+    def claim(self, kind: str, worker: str, job: Optional[str] = None) -> Optional[Shard]:
+        """
+        Leases the first pending shard, or the first one whose lease expired.
+
+        :param kind: kind of shards
+        :param worker: name of the claiming worker
+        :param job: restricts to a job, any job of that kind by default
+        :return: claimed shard, None if there is none available right now
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            query = 'SELECT job, shard, payload, state, attempts FROM shards ' \
+                    'WHERE kind = ? AND (state = ? OR (state = ? AND lease_expires < ?))'
+            params = [kind, PENDING, LEASED, now]
+            if job is not None:
+                query += ' AND job = ?'
+                params.append(job)
+
+            for job_name, shard, payload, state, attempts in connection.execute(query + ' ORDER BY job, shard',
+                                                                                  params).fetchall():
+                if state == LEASED and attempts >= self._max_attempts:
+                    # the lease of its last attempt expired
+                    connection.execute('UPDATE shards SET state = ?, error = ? WHERE job = ? AND shard = ?',
+                                       (FAILED, 'lease expired', job_name, shard))
+                    continue
+
+                if state == LEASED:
+                    logging.warning('lease of shard %s/%d expired, claiming it again', job_name, shard)
+
+                connection.execute('UPDATE shards SET state = ?, worker = ?, lease_expires = ?, attempts = ? '
+                                   'WHERE job = ? AND shard = ?',
+                                   (LEASED, worker, now + self._lease, attempts + 1, job_name, shard))
+                return Shard(job_name, shard, json.loads(payload), worker)
+
+        return None
+
+    def _update_leased(self, shard: Shard, assignments: str, params: tuple) -> bool:
+        """
+        :return: False if the shard was claimed again by another worker in the meantime
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(f'UPDATE shards SET {assignments} WHERE job = ? AND shard = ? AND state = ? '
+                                        f'AND worker = ?', params + (shard.job, shard.shard, LEASED, shard.worker))
+            return cursor.rowcount > 0
+
+    def renew(self, shard: Shard) -> bool:
+        return self._update_leased(shard, 'lease_expires = ?', (time.time() + self._lease,))
+
+    def complete(self, shard: Shard, output: bytes) -> bool:
+        """
+        :param output: result of the shard, stored compressed
+        :return: False if the lease was lost, the output being then discarded
+        """
+        completed = self._update_leased(shard, 'state = ?, output = ?, error = NULL', (DONE, zlib.compress(output)))
+        if not completed:
+            logging.warning('lease of shard %s/%d was lost, discarding its output', shard.job, shard.shard)
+
+        return completed
+
+    def fail(self, shard: Shard, error: str) -> bool:
+        """
+        Hands the shard back for another attempt, marks it as failed after the last attempt.
+        """
+        return self._update_leased(shard, 'state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?',
+                                   (self._max_attempts, FAILED, PENDING, error))
+
+    @contextmanager
+    def leased(self, shard: Shard):
+        """
+        Renews the lease in the background while the block runs, the shard being handed back if it raises.
+        """
+        stopped = threading.Event()
+
+        def renew_lease():
+            while not stopped.wait(self._lease / 3.):
+                if not self.renew(shard):
+                    logging.warning('lease of shard %s/%d was lost', shard.job, shard.shard)
+                    return
+
+        renewer = threading.Thread(target=renew_lease, name=f'lease-{shard.job}-{shard.shard}', daemon=True)
+        renewer.start()
+        try:
+            yield shard
+
+        except Exception as error:
+            logging.exception('shard %s/%d failed', shard.job, shard.shard)
+            self.fail(shard, repr(error))
+
+        finally:
+            stopped.set()
+            renewer.join()
+
+    def status(self, job: Optional[str] = None, kind: Optional[str] = None) -> Dict[str, int]:
+        """
+        :param job: restricts to a job, all jobs by default
+        :param kind: restricts to a kind of shards, all kinds by default
+        :return: number of shards by state
+        """
+        conditions = {'job': job, 'kind': kind}
+        conditions = {name: value for name, value in conditions.items() if value is not None}
+        query = 'SELECT state, COUNT(*) FROM shards'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(f'{name} = ?' for name in conditions)
+
+        with self._lock:
+            counts = dict(self._connection.execute(query + ' GROUP BY state', tuple(conditions.values())).fetchall())
+
+        return {state: counts.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED)}
+
+    def failures(self, job: str) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._connection.execute('SELECT shard, error FROM shards WHERE job = ? AND state = ?',
+                                                 (job, FAILED)).fetchall())
+
+    def outputs(self, job: str) -> Iterator[bytes]:
+        """
+        :return: outputs of the shards in shard order
+        :raise ShardFailure: if any shard is not done
+        """
+        status = self.status(job)
+        if status[DONE] != sum(status.values()):
+            raise ShardFailure(f'job "{job}" is not complete: {status}, failures: {self.failures(job)}')
+
+        with self._lock:
+            shards = [row[0] for row in
+                      self._connection.execute('SELECT shard FROM shards WHERE job = ? ORDER BY shard', (job,))]
+
+        for shard in shards:
+            with self._lock:
+                output = self._connection.execute('SELECT output FROM shards WHERE job = ? AND shard = ?',
+                                                  (job, shard)).fetchone()[0]
+
+            yield zlib.decompress(output)
+
+    def work(self, kind: str, process, job: Optional[str] = None, wait: float = 0., poll_interval: float = 5.) -> int:
+        """
+        Processes shards until none is left pending or leased, waiting for shards leased by other workers, as
+        their lease may expire.
+
+        :param kind: kind of shards
+        :param process: function of the shard payload returning the shard output as bytes
+        :param job: restricts to a job, any job of that kind by default
+        :param wait: seconds to wait for new shards once none is left, before returning
+        :param poll_interval: seconds between two claims while other workers hold all remaining shards
+        :return: number of shards completed by this worker
+        """
+        name = worker_name()
+        completed = 0
+        idle_since = time.monotonic()
+        while True:
+            shard = self.claim(kind, name, job)
+            if shard is None:
+                status = self.status(job, kind)
+                if status[PENDING] + status[LEASED] == 0 and time.monotonic() - idle_since >= wait:
+                    return completed
+
+                time.sleep(poll_interval)
+                continue
+
+            logging.info('processing shard %s/%d', shard.job, shard.shard)
+            with self.leased(shard):
+                if self.complete(shard, process(shard.payload)):
+                    completed += 1
+
+            idle_since = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -1,19 +1,30 @@
-from distutils.core import setup
+from setuptools import setup, find_packages
 
 setup(
     name='oott-ships-db',
     version='1.0',
-    packages=[''],
-    package_dir={'': 'src'},
+    packages=find_packages('scripts'),
+    package_dir={'': 'scripts'},
     url='',
     license='',
     author='Christophe',
     author_email='ch.alexandre@bluewin.ch',
     description='Managing Tanker DB',
+    python_requires='>=3.9',
     install_requires=[
-        'matplotlib >= 1.5.2',
+        'aiohttp >= 3.8.0',
         'beautifulsoup4 >= 4.5.1',
-        'pandas >= 0.18.1',
-        'requests >= 2.11.1',
+        'lxml >= 3.6.0',
+        'numpy >= 1.20',
+        'pandas >= 1.3',
+        'pyarrow >= 8.0.0',
     ],
+    extras_require={
+        'profiling': ['pyinstrument'],
+    },
+    entry_points={
+        'console_scripts': [
+            'ships = shipsdb.cli:main',
+        ],
+    },
 )